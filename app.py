@@ -1,6 +1,8 @@
 import logging
 import argparse
 import datetime
+import os
+import config
 
 from flask import Flask
 from config import LOGGER_CONFIG
@@ -23,6 +25,36 @@ PROJECT_STALE_SECONDS = 21 * (24 * 60 * 60)  # How many days before project beco
 RELEASE_NOTES = 'release_notes.json'
 RANDOM_EASTER_REJECTION = 0.05
 DEFAULT_SUBPROJECT = 'GENERAL'
+STORAGE_ENGINE = getattr(config, 'STORAGE_ENGINE', 'json')  # 'json' or 'sqlite'
+DATABASE_FILE = getattr(config, 'DATABASE_FILE', 'queuebot/data/queuebot.db')  # Only used by the sqlite engine
+COMMAND_LOG_FILE = getattr(config, 'COMMAND_LOG_FILE', os.path.splitext(config.COMMANDS_FILE)[0] + '.log')
+COMMAND_LOG_SEGMENT_BYTES = getattr(config, 'COMMAND_LOG_SEGMENT_BYTES', 4 * 1024 * 1024)  # Rotate segments at 4MB
+COMMAND_LOG_FSYNC = getattr(config, 'COMMAND_LOG_FSYNC', 'always')  # 'always', 'interval' or 'never'
+COMMAND_LOG_FSYNC_INTERVAL = getattr(config, 'COMMAND_LOG_FSYNC_INTERVAL', 5)  # Seconds between fsyncs for 'interval'
+HISTORY_FILE = getattr(config, 'HISTORY_FILE', config.SUBPROJECT_FOLDER + '/history')  # Columns in history.<column>
+HISTORY_RETENTION_DAYS = getattr(config, 'HISTORY_RETENTION_DAYS', 90)  # Days of history kept before rollups
+LAST_ACTIVITY_FILE = getattr(config, 'LAST_ACTIVITY_FILE', config.DATA_FOLDER + '/last-activity.json')
+STALE_WARNINGS_FILE = getattr(config, 'STALE_WARNINGS_FILE', os.path.dirname(config.DATA_FOLDER.format('')) + '/warnings.json')
+STALE_SWEEP_SECONDS = getattr(config, 'STALE_SWEEP_SECONDS', 60)  # Seconds between checks for projects made elsewhere
+SPARK_BASE_URL = getattr(config, 'SPARK_BASE_URL', 'https://api.ciscospark.com/v1/')
+PEOPLE_CACHE_SIZE = getattr(config, 'PEOPLE_CACHE_SIZE', 1000)  # Spark person records kept in memory
+PEOPLE_CACHE_TTL = getattr(config, 'PEOPLE_CACHE_TTL', 60 * 60)  # Seconds before a person record is fetched again
+PEOPLE_CACHE_NEGATIVE_TTL = getattr(config, 'PEOPLE_CACHE_NEGATIVE_TTL', 5 * 60)  # Seconds an unknown id is remembered
+WEBHOOK_WORKERS = getattr(config, 'WEBHOOK_WORKERS', 4)  # Threads handling webhooks, 0 handles them in the request
+WEBHOOK_QUEUE_SIZE = getattr(config, 'WEBHOOK_QUEUE_SIZE', 1000)  # Webhooks waiting to be handled, over all workers
+WEBHOOK_OVERFLOW = getattr(config, 'WEBHOOK_OVERFLOW', 'block')  # 'drop', 'block' or 'spill' when the queue is full
+WEBHOOK_BLOCK_TIMEOUT = getattr(config, 'WEBHOOK_BLOCK_TIMEOUT', 5)  # Seconds to wait for room with 'block'
+WEBHOOK_SPILL_FOLDER = getattr(config, 'WEBHOOK_SPILL_FOLDER', 'queuebot/data/spill')  # Only used with 'spill'
+WEBHOOK_DEDUP_WINDOW = getattr(config, 'WEBHOOK_DEDUP_WINDOW', 60 * 60)  # Seconds a message id is remembered
+WEBHOOK_DEDUP_SIZE = getattr(config, 'WEBHOOK_DEDUP_SIZE', 10000)  # Most message ids remembered at once
+WEBHOOK_DEDUP_FILE = getattr(config, 'WEBHOOK_DEDUP_FILE', None)  # Set to remember message ids across restarts
+OUTBOUND_BACKGROUND = getattr(config, 'OUTBOUND_BACKGROUND', True)  # False sends messages as soon as they are created
+OUTBOUND_COALESCE_SECONDS = getattr(config, 'OUTBOUND_COALESCE_SECONDS', 0.5)  # How long messages wait to be combined
+OUTBOUND_MAX_MARKDOWN = getattr(config, 'OUTBOUND_MAX_MARKDOWN', 7000)  # Longest combined message, Spark allows 7439
+OUTBOUND_MAX_RETRIES = getattr(config, 'OUTBOUND_MAX_RETRIES', 5)  # Attempts after a rate limit before giving up
+CHART_CACHE_BYTES = getattr(config, 'CHART_CACHE_BYTES', 16 * 1024 * 1024)  # Rendered charts kept in memory
+CHART_PROCESSES = getattr(config, 'CHART_PROCESSES', 2)  # Processes rendering charts, 0 renders them in the webhook thread
+CHART_TIMEOUT = getattr(config, 'CHART_TIMEOUT', 10)  # Seconds to wait for a chart before sending a table instead
 
 if __name__ == '__main__':
     from endpoints import *
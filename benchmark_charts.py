@@ -0,0 +1,80 @@
+import argparse
+import json
+import threading
+import time
+
+from queuebot import Bot
+from queuebot.charts import ChartRenderer
+
+# Measures how long an unrelated command takes to handle while other webhook threads are rendering 'show ... by hour'
+# charts, with the charts rendered in the webhook threads (as before) and in the chart process pool. The command is
+# routed and its queue loaded and saved as JSON, the in-process work of something like 'add me'.
+
+QUEUE = [{
+    'personId': 'person-' + str(i),
+    'displayName': 'Person ' + str(i),
+    'timeEnqueued': '1980-01-01 12:00:00',
+    'atHeadTime': None
+} for i in range(20)]
+ITEMS = {str(i): i * 1.5 for i in range(24)}
+
+
+def unrelated_command():
+    Bot.router.route('add me', strict=True)
+    json.loads(json.dumps(QUEUE))
+
+
+def measure(renderer, charts, seconds):
+    stop = threading.Event()
+    rendered = []
+
+    def request_charts():
+        while not stop.is_set():
+            rendered.append(renderer.render('Average Queue Depth by Hour', ITEMS) if renderer else None)
+
+    threads = [threading.Thread(target=request_charts) for i in range(charts)]
+    for thread in threads:
+        thread.start()
+
+    # Commands arrive every 10ms and are timed from when they arrive, so waiting for the GIL is included
+    latencies = []
+    arrival = time.perf_counter()
+    end = arrival + seconds
+    while arrival < end:
+        arrival += 0.01
+        time.sleep(max(arrival - time.perf_counter(), 0))
+        unrelated_command()
+        latencies.append(time.perf_counter() - arrival)
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return latencies, len(rendered)
+
+
+def benchmark(charts, processes, seconds):
+    pool = ChartRenderer(processes=processes, timeout=60)
+    # Start the pool before timing
+    pool.render('', ITEMS)
+
+    for name, renderer, threads in [
+        ('no charts', None, 0),
+        ('charts in threads', ChartRenderer(processes=0), charts),
+        ('charts in processes', pool, charts)
+    ]:
+        latencies, rendered = measure(renderer, threads, seconds)
+        print(name.ljust(20) + ' p50 ' + format(latencies[len(latencies) // 2] * 1e3, '7.2f') + ' ms' +
+              '   p99 ' + format(latencies[len(latencies) * 99 // 100] * 1e3, '7.2f') + ' ms' +
+              '   max ' + format(latencies[-1] * 1e3, '7.2f') + ' ms   ' +
+              str(rendered if renderer else 0) + ' charts')
+    pool.stop()
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Benchmark command latency while charts are rendered')
+    arguments.add_argument('--charts', type=int, default=4, help='Threads requesting charts at once')
+    arguments.add_argument('--processes', type=int, default=2, help='Processes in the chart pool')
+    arguments.add_argument('--seconds', type=float, default=10, help='Seconds to measure each case for')
+    args = arguments.parse_args()
+    benchmark(args.charts, args.processes, args.seconds)
@@ -0,0 +1,72 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import tempfile
+import timeit
+
+from queuebot.history import History, HistoryLog, diff_queues
+
+# Compares loading a large synthetic queue history in the old global stats format (a copy of the queue for every
+# change, kept in historicalData), in the columnar history, and in the columnar history once it has been compacted.
+
+
+def synthetic_history(days, changes):
+    start = datetime.datetime.now() - datetime.timedelta(days=days)
+    queues, flush_times = {}, {}
+    history = History()
+    queue = []
+    for i in range(days * changes):
+        time = start + datetime.timedelta(seconds=i * 24 * 60 * 60 / changes)
+        previous = queue
+        if queue and (len(queue) >= 10 or random.random() < 0.5):
+            queue = queue[1:]
+        else:
+            queue = queue + [{
+                'personId': 'person-' + str(random.randrange(100)),
+                'timeEnqueued': str(time),
+                'displayName': 'Person',
+                'atHeadTime': None if queue else str(time)
+            }]
+        flush_time = 60 * len(queue)
+        queues[str(time)] = queue
+        flush_times[str(time)] = flush_time
+        history.append(time.timestamp(), len(queue), flush_time, diff_queues(previous, queue))
+    return {'historicalData': {'queues': queues, 'flush_times': flush_times}}, history
+
+
+def benchmark(days, changes, retention, number):
+    random.seed(0)
+    legacy, history = synthetic_history(days, changes)
+    folder = tempfile.mkdtemp()
+
+    legacy_file = os.path.join(folder, 'global-stats.pickle')
+    json.dump(legacy, open(legacy_file, 'w'), indent=4, separators=(',', ': '))
+    HistoryLog(os.path.join(folder, 'raw')).append(list(history.records()))
+    compacted = history.compact((datetime.datetime.now() - datetime.timedelta(days=retention)).timestamp())
+    HistoryLog(os.path.join(folder, 'compacted')).replace(compacted)
+
+    def size(prefix):
+        return sum(os.path.getsize(os.path.join(folder, i)) for i in os.listdir(folder) if i.startswith(prefix))
+
+    print(str(len(history)) + ' records over ' + str(days) + ' days, ' + str(len(compacted)) + ' kept after compacting '
+          'to ' + str(retention) + ' days (' + str(len(compacted.hourly)) + ' hourly and ' +
+          str(len(compacted.daily)) + ' daily summaries)')
+    for name, prefix, load in [
+        ('historicalData JSON', 'global-stats', lambda: json.load(open(legacy_file))),
+        ('columnar history', 'raw', HistoryLog(os.path.join(folder, 'raw')).read),
+        ('compacted history', 'compacted', HistoryLog(os.path.join(folder, 'compacted')).read)
+    ]:
+        seconds = timeit.timeit(load, number=number) / number
+        print(name.ljust(20) + format(size(prefix) / 1e6, '8.2f') + ' MB' + format(seconds * 1e3, '10.2f') + ' ms')
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Benchmark loading queue history')
+    arguments.add_argument('--days', type=int, default=730, help='Days of synthetic history')
+    arguments.add_argument('--changes', type=int, default=40, help='Queue changes per day')
+    arguments.add_argument('--retention', type=int, default=90, help='Days of history kept by compacting')
+    arguments.add_argument('--number', type=int, default=5, help='Number of loads to time')
+    args = arguments.parse_args()
+    benchmark(args.days, args.changes, args.retention, args.number)
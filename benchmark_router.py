@@ -0,0 +1,51 @@
+import argparse
+import re
+import timeit
+
+from queuebot import Bot
+from queuebot.enum import TIER
+
+# Compares the cost of routing one message with the precompiled CommandRouter against the previous implementation,
+# which rebuilt '^command$' for every pattern and called re.search on each one, one privilege tier at a time.
+
+MESSAGES = [
+    'add me',
+    'list',
+    'how long',
+    'show release notes 1.0',
+    'show average flush time by hour',
+    'add person someone@example.com',
+    'delete last message',
+    'show projects',
+    'this is not a command',
+]
+
+
+def legacy_route(string, strict):
+    for tier, commands in [(TIER.GLOBAL_ADMIN, Bot.global_admin_commands), (TIER.ADMIN, Bot.admin_commands),
+                           (TIER.USER, Bot.user_commands)]:
+        for command in commands:
+            executed_command = ("^" + command + "$") if strict else command
+            if re.search(executed_command, string.lower()):
+                return commands[command], tier
+    return None, TIER.NONE
+
+
+def benchmark(number):
+    for strict in [False, True]:
+        for message in MESSAGES:
+            assert legacy_route(message, strict) == Bot.router.route(message, strict=strict)[:2], message
+
+        legacy = timeit.timeit(lambda: [legacy_route(i, strict) for i in MESSAGES], number=number)
+        router = timeit.timeit(lambda: [Bot.router.route(i, strict=strict) for i in MESSAGES], number=number)
+        count = number * len(MESSAGES)
+
+        print(('strict' if strict else 'non-strict') + ':')
+        print('  legacy: ' + format(legacy / count * 1e6, '.2f') + ' us/message')
+        print('  router: ' + format(router / count * 1e6, '.2f') + ' us/message')
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Benchmark command routing')
+    arguments.add_argument('--number', type=int, default=2000, help='Iterations over the sample messages')
+    benchmark(arguments.parse_args().number)
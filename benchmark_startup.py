@@ -0,0 +1,33 @@
+import argparse
+import timeit
+
+from unittest import mock
+from queuebot import Bot
+
+# Measures the per webhook cost of setting up a Bot, separately from the one-time cost of building the process-wide
+# command help text. ProjectManager is replaced by a mock so only Bot's own setup is timed.
+
+
+def benchmark(number):
+    data = {'roomId': 'BENCHMARK'}
+
+    Bot._command_help_cache.clear()
+    first = timeit.timeit(lambda: (Bot._command_help('user_commands'),
+                                   Bot._command_help('admin_commands', escape=True)), number=1)
+    cached = timeit.timeit(lambda: (Bot._command_help('user_commands'),
+                                    Bot._command_help('admin_commands', escape=True)), number=number)
+
+    with mock.patch('queuebot.ProjectManager'):
+        setup = timeit.timeit(lambda: Bot(None, data), number=number)
+        help_string = timeit.timeit(lambda: Bot(None, data).help_string, number=number)
+
+    print('command help, first build:  ' + format(first * 1e6, '.2f') + ' us')
+    print('command help, cached:       ' + format(cached / number * 1e6, '.2f') + ' us')
+    print('Bot setup per webhook:      ' + format(setup / number * 1e6, '.2f') + ' us')
+    print('Bot setup and help string:  ' + format(help_string / number * 1e6, '.2f') + ' us')
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Benchmark per webhook Bot setup')
+    arguments.add_argument('--number', type=int, default=10000, help='Number of Bots to set up')
+    benchmark(arguments.parse_args().number)
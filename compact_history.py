@@ -0,0 +1,36 @@
+import argparse
+import os
+
+from app import HISTORY_RETENTION_DAYS
+from config import DATA_FOLDER
+from queuebot.people import PeopleManager
+from queuebot.queue import Queue
+
+# Summarises the queue history of every subproject that is older than the retention period into hourly and daily
+# rollups, which keep the min/max/mean queue depth and flush time the average, min and max graphs are built from
+# (percentile graphs only use the records that are kept). Loading each subproject also moves any history still held in
+# its global stats into the history files. Run it with the bot stopped, for example from a nightly cron job.
+
+
+def compact(retention_days):
+    root = os.path.dirname(DATA_FOLDER.format(''))
+
+    for project in sorted(os.listdir(root)):
+        project_folder = DATA_FOLDER.format(project)
+        if not os.path.isdir(project_folder):
+            continue
+
+        for subproject in sorted(os.listdir(project_folder)):
+            if not os.path.isdir(os.path.join(project_folder, subproject)):
+                continue
+
+            people = PeopleManager(None, project=project, subproject=subproject)
+            queue = Queue(None, project=project, subproject=subproject, people_manager=people)
+            print(project + ' ' + subproject + ': summarised ' + str(queue.compact_history(retention_days)) +
+                  ' records')
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Roll up queue history older than the retention period')
+    arguments.add_argument('--days', type=int, default=HISTORY_RETENTION_DAYS, help='Days of history to keep')
+    compact(arguments.parse_args().days)
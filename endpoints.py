@@ -4,35 +4,59 @@ import pprint
 
 from app import app, logger
 from queuebot import Bot
-from ciscosparkapi import CiscoSparkAPI
-from config import QUEUE_BOT, PRODUCTION
+from queuebot.projects import get_room_project, get_project_lock
+from queuebot.storage import request_scope
+from queuebot.spark import get_api, get_me, prefetch_people
+from queuebot.dedup import WebhookDeduplicator
+from queuebot.charts import CHART_CACHE, CHART_RENDERER
+from queuebot.dispatcher import get_dispatcher
+from queuebot.workers import WebhookWorkers
+from config import PRODUCTION
 
 BOT = None
 
+
+def webhook_key(data):
+    # The rooms of a project share its queue, people and stats, so its webhooks are handled in order on one worker
+    return get_room_project(data.get('roomId')) or data.get('roomId')
+
+
+def handle_webhook(data):
+    api = get_api()
+    prefetch_people(api, [data['personId']] + list(data.get('mentionedPeople', [])))
+    # A request's unit of work holds the project's data until it flushes, so requests for the same project must not
+    # overlap, even when they are handled inline or a room changed project after it was queued
+    with get_project_lock(webhook_key(data)):
+        with request_scope():
+            BOT = Bot(api, data)
+            BOT.handle_data(data)
+
+
+WORKERS = WebhookWorkers(handle_webhook, key=webhook_key)
+DEDUPLICATOR = WebhookDeduplicator()
+
+
 @app.route('/queuebot', methods=['POST'])
 def queue():
     try:
         data = flask.request.json
         if data:
 
-            logger.debug('Initializing Spark API')
-            if PRODUCTION:
-                api = CiscoSparkAPI(QUEUE_BOT)
-            else:
-                from config import DEV_QUEUE_BOT
-                api = CiscoSparkAPI(DEV_QUEUE_BOT)
-
-            logger.debug('Spark API initialized')
-
             data = data['data']
-            me_id = api.people.me().id
+            if DEDUPLICATOR.is_duplicate(data.get('id')):
+                return ''
+
+            api = get_api()
+            me_id = get_me(api).id
 
             if data.get('personId') != me_id and \
                     ((data.get('mentionedPeople') and me_id in data['mentionedPeople']) or
                      data.get('roomType') == 'direct'):
                 logger.debug(pprint.pformat(data))
-                BOT = Bot(api, data)
-                BOT.handle_data(data)
+                if not WORKERS.submit(data):
+                    # Dropped, so let Spark's retry through and tell it to retry
+                    DEDUPLICATOR.forget(data.get('id'))
+                    return 'Webhook queue is full', 503
 
             return ''
 
@@ -44,3 +68,13 @@ def queue():
         print(traceback.format_exc())
         logger.error(traceback.format_exc())
         return '500 Internal Server Error'
+
+
+@app.route('/queuebot/status', methods=['GET'])
+def status():
+    return flask.jsonify(dict(
+        WORKERS.statistics(),
+        deduplication=DEDUPLICATOR.statistics(),
+        outbound=get_dispatcher(get_api()).statistics(),
+        charts=dict(CHART_CACHE.statistics(), **CHART_RENDERER.statistics())
+    ))
@@ -0,0 +1,49 @@
+import argparse
+import os
+
+from app import DATABASE_FILE
+from config import DATA_FOLDER
+from queuebot.storage import JsonStorage, SqliteStorage
+
+# Imports the JSON data tree (queuebot/data/<PROJECT>/<SUBPROJECT>/*.pickle) into the SQLite database.
+# Safe to run more than once; every collection in the database is replaced by the contents of the JSON files.
+# Set STORAGE_ENGINE = 'sqlite' in config once the import has finished.
+
+
+def migrate(database):
+    source = JsonStorage()
+    target = SqliteStorage(database)
+    root = os.path.dirname(DATA_FOLDER.format(''))
+
+    for project in sorted(os.listdir(root)):
+        project_folder = DATA_FOLDER.format(project)
+        if not os.path.isdir(project_folder):
+            continue
+
+        print(project)
+        target.save_admins(project, source.get_admins(project))
+        target.save_settings(project, source.get_settings(project))
+        if source.get_last_activity(project) is not None:
+            target.save_last_activity(project, source.get_last_activity(project))
+
+        for subproject in sorted(os.listdir(project_folder)):
+            if not os.path.isdir(os.path.join(project_folder, subproject)):
+                continue
+
+            print('    ' + subproject)
+            target.save_people(project, subproject, source.get_people(project, subproject))
+            target.save_queue(project, subproject, source.get_queue(project, subproject))
+            target.save_commands(project, subproject, source.get_commands(project, subproject))
+            target.replace_history(project, subproject, source.get_history(project, subproject))
+
+            global_stats = source.get_global_stats(project, subproject)
+            if global_stats is not None:
+                target.save_global_stats(project, subproject, global_stats)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Import the JSON data folder into the SQLite database')
+    arg_parser.add_argument('--database', default=DATABASE_FILE, help='SQLite database to import into')
+    args = arg_parser.parse_args()
+
+    migrate(args.database)
@@ -1,118 +1,146 @@
 import datetime
-import os
+import io
 import json
 import re
-import requests
-import csv
-import numpy
-import shutil
 import random
-import matplotlib
-matplotlib.use('Agg')
 
 from dateutil import parser
-from matplotlib import pyplot
-from contextlib import contextmanager
-from queuebot.queue import Queue
+from queuebot.charts import CHART_CACHE, CHART_RENDERER
+from queuebot.queue import Queue, STATISTICS
 from queuebot.people import PeopleManager
 from queuebot.commands import CommandManager
 from queuebot.admins import AdminManager
 from queuebot.projects import ProjectManager
 from app import app, logger, FORMAT_STRING, TIMEOUT, CSV_FILE_FORMAT, VERSION, RELEASED, AUTHOR, EMAIL, QUEUE_THRESHOLD, RELEASE_NOTES, PROJECT_STALE_SECONDS, RANDOM_EASTER_REJECTION, DEFAULT_SUBPROJECT
 from config import PROJECT_CONFIG, GLOBAL_ADMINS, DATA_FOLDER
-from queuebot.enum import COMMAND
+from queuebot.enum import COMMAND, TIER
+from queuebot.router import CommandRouter
+from queuebot.dispatcher import get_dispatcher
+from queuebot.spark import get_me, get_person, prefetch_people
+
+
+class RequestContext:
+    """
+    The state that differs between webhooks: the room a message came from, its project and the subproject in use
+    """
+    def __init__(self, roomId, project, subproject=None):
+        self.roomId = roomId
+        self.project = project
+        self.subproject = subproject
 
 
 class Bot():
+    user_commands = {
+        'add me': 'add_me',
+        'remove me': 'remove_me',
+        'list': 'list_queue',
+        'list for all subprojects': 'list_queue_all_subprojects',
+        'help': 'help',
+        'status': 'status',
+        'how long': 'how_long',
+        'about': 'about',
+        'show subprojects': 'show_subprojects',
+        'show version': 'show_version_number',
+        'show all release notes': 'show_release_notes',
+        'show release notes (.*)': 'show_release_notes_for',
+    }
+
+    admin_commands = {
+        'show admin commands': 'show_admin_commands',
+        'show admins': 'show_admins',
+        'add admin (.*)': 'add_admin',
+        'create new subproject (\w+)': 'create_new_subproject',
+        'delete subproject (\w+)': 'delete_subproject',
+        'remove admin (.*)': 'remove_admin',
+        'register bot to project (\w+)': 'register_bot',
+        'show registration': 'show_registration',
+        'create new project (\w+)': 'create_new_project',
+        'delete project': 'delete_project',
+        'change default subproject to (\w+)': 'change_default_subproject',
+        'show last (\d*) commands': 'show_command_history',
+        'show people': 'show_people',
+        'show all stats as csv': 'get_stats_csv',
+        'show all stats as markdown': 'get_stats',
+        'show stats for (.*)': 'get_stats_for',
+        'add person (.*)': 'add_person',
+        'remove person (.*)': 'remove_person',
+        'show most active users': 'most_active_users',
+        'show largest queue depth': 'largest_queue_depth',
+        'show quickest users': 'quickest_at_head_user',
+        'show (' + STATISTICS + ') (queue depth|flush time) by (hour|day)': 'get_aggregate_stat_unit',
+        'show strict regex': 'show_strict_regex',
+        'set strict regex to (.*)': 'set_strict_regex',
+        'delete last message': 'delete_last_message'
+    }
+
+    global_admin_commands = {
+        'show projects': 'show_projects',
+    }
+
+    # Built once per process rather than per webhook. Global admin commands take priority over admin commands, which
+    # take priority over user commands
+    router = CommandRouter([
+        (TIER.GLOBAL_ADMIN, global_admin_commands),
+        (TIER.ADMIN, admin_commands),
+        (TIER.USER, user_commands)
+    ])
+
+    permitted_null_commands = [
+        'register_bot',
+        'create_new_project',
+        'show_release_notes_for',
+        'show_release_notes'
+    ]
+
+    column_names = [
+        'PERSON',
+        'AVERAGE TIME IN QUEUE',
+        'AVERAGE TIME AT QUEUE HEAD',
+        'COMMANDS ISSUED',
+        'NUMBER OF TIMES IN QUEUE',
+        'TOTAL TIME IN QUEUE',
+        'TOTAL TIME AT QUEUE HEAD',
+    ]
+
+    description = \
+        "This bot is to be used to manage a queue for a given team. " \
+        "It can be used to get statistical information as well as manage an individual queue."
+
+    # Markdown lists of commands and their cleaned docstrings, built once per process by _command_help
+    _command_help_cache = {}
+
     def __init__(self, api, data):
         self.api = api
         logger.debug("Initializing Project Manager")
-        self.project = ProjectManager(self.api, roomId=data['roomId'])
+        self.context = RequestContext(data['roomId'], ProjectManager(self.api, roomId=data['roomId']))
         logger.debug("Initialized Project Manager")
 
-        self.permitted_null_commands = [
-            self.register_bot,
-            self.create_new_project,
-            self.show_release_notes_for,
-            self.show_release_notes
-        ]
-
-        self.column_names = [
-            'PERSON',
-            'AVERAGE TIME IN QUEUE',
-            'AVERAGE TIME AT QUEUE HEAD',
-            'COMMANDS ISSUED',
-            'NUMBER OF TIMES IN QUEUE',
-            'TOTAL TIME IN QUEUE',
-            'TOTAL TIME AT QUEUE HEAD',
-        ]
-
-        self.supported_commands = {
-            'add me': self.add_me,
-            'remove me': self.remove_me,
-            'list': self.list_queue,
-            'list for all subprojects': self.list_queue_all_subprojects,
-            'help': self.help,
-            'status': self.status,
-            'how long': self.how_long,
-            'about': self.about,
-            'show subprojects': self.show_subprojects,
-            'show version': self.show_version_number,
-            'show all release notes': self.show_release_notes,
-            'show release notes (.*)': self.show_release_notes_for,
-        }
-        logger.debug('supported commands:\n' + str(self.supported_commands.keys()))
-
-        self.supported_admin_commands = {
-            'show admin commands': self.show_admin_commands,
-            'show admins': self.show_admins,
-            'add admin (.*)': self.add_admin,
-            'create new subproject (\w+)': self.create_new_subproject,
-            'delete subproject (\w+)': self.delete_subproject,
-            'remove admin (.*)': self.remove_admin,
-            'register bot to project (\w+)': self.register_bot,
-            'show registration': self.show_registration,
-            'create new project (\w+)': self.create_new_project,
-            'delete project': self.delete_project,
-            'change default subproject to (\w+)': self.change_default_subproject,
-            'show last (\d*) commands': self.show_command_history,
-            'show people': self.show_people,
-            'show all stats as csv': self.get_stats_csv,
-            'show all stats as markdown': self.get_stats,
-            'show stats for (.*)': self.get_stats_for,
-            'add person (.*)': self.add_person,
-            'remove person (.*)': self.remove_person,
-            'show most active users': self.most_active_users,
-            'show largest queue depth': self.largest_queue_depth,
-            'show quickest users': self.quickest_at_head_user,
-            'show (average|max|min) (queue depth|flush time) by (hour|day)': self.get_aggregate_stat_unit,
-            'show strict regex': self.show_strict_regex,
-            'set strict regex to (.*)': self.set_strict_regex,
-            'delete last message': self.delete_last_message
-        }
-        logger.debug('supported admin commands:\n' + str(self.supported_admin_commands.keys()))
-
-        self.supported_global_admin_commands = {
-            'show projects': self.show_projects,
-        }
-
-        command_strings = ''
-
-        for command, docstring in self._commands_with_help_string().items():
-            docstring = self._clean_docstring(docstring)
-            command_strings += '- **' + command + (('** (' + docstring + ')\n') if docstring else '**\n')
-
-        self.help_string = \
-            "This bot is to be used to manage a queue for a given team. " \
-            "It can be used to get statistical information as well as manage an individual queue.\n\n" \
+    @property
+    def project(self):
+        return self.context.project
+
+    @property
+    def subproject(self):
+        return self.context.subproject
+
+    @subproject.setter
+    def subproject(self, value):
+        self.context.subproject = value
+
+    @property
+    def help_string(self):
+        return \
+            self.description + "\n\n" \
             "This QueueBot is registered to '" + str(self.project.get_project()) + "'\n\n" \
             "You can end any command with the suffix '**for subproject [subproject name]**' to apply " \
-            "that command to the given subproject. Available commands are:\n\n" + command_strings + \
+            "that command to the given subproject. Available commands are:\n\n" + \
+            self._command_help('user_commands') + \
             "\nFor admins, use 'show admin commands' to see a list of admin commands"
 
-        self.about_string = \
-            "This bot is to be used to manage a queue for a given team. " \
-            "It can be used to get statistical information as well as manage an individual queue.\n" \
+    @property
+    def about_string(self):
+        return \
+            self.description + "\n" \
             "\n" \
             "This QueueBot is registered to '" + str(self.project.get_project()) + "'\n" \
             "\n" \
@@ -120,18 +148,32 @@ class Bot():
             "Released: " + str(RELEASED) + "\n\n" \
             "Author: " + str(AUTHOR) + " (" + str(EMAIL) + ")"
 
+    @classmethod
+    def _command_help(cls, table, escape=False):
+        key = (table, escape)
+        if key not in cls._command_help_cache:
+            command_strings = ''
+            for command, name in sorted(getattr(cls, table).items()):
+                docstring = cls._clean_docstring(getattr(cls, name).__doc__)
+                command = command.replace("*", "\\*") if escape else command
+                command_strings += '- **' + command + (('** (' + docstring + ')\n') if docstring else '**\n')
+            cls._command_help_cache[key] = command_strings
+        return cls._command_help_cache[key]
+
+    def _is_permitted_null_command(self, function):
+        return getattr(function, '__name__', None) in self.permitted_null_commands
+
     def delete_last_message(self, data):
-        my_id = self.api.people.me().id
+        my_id = get_me(self.api).id
         for message in self.api.messages.list(roomId=data['roomId']):
             if message.personId == my_id:
                 self.api.messages.delete(message.id)
                 break
 
-    def _clean_docstring(self, docstring):
+    @staticmethod
+    def _clean_docstring(docstring):
         if docstring:
-            docstring = docstring.strip('\n ')
-            while '  ' in docstring:
-                docstring = re.sub('  ', ' ', docstring)
+            docstring = re.sub(' {2,}', ' ', docstring.strip('\n '))
             docstring = docstring.replace('\n', '')
             return docstring
 
@@ -154,12 +196,6 @@ class Bot():
         self.project.strict_regex = bool(value.title() != 'False')
         self.show_strict_regex(data)
 
-    def _commands_with_help_string(self):
-        return {k: v.__doc__ for k, v in sorted(self.supported_commands.items())}
-
-    def _admin_commands_with_help_string(self):
-        return {k: v.__doc__ for k, v in sorted(self.supported_admin_commands.items())}
-
     def status(self, data):
         """
         Shows the current status of queuebot
@@ -270,11 +306,13 @@ class Bot():
     def show_projects(self, data):
         message = 'Registered projects are:\n\n'
 
-        for project in set([i[0] for i in self.project.config]):
-            all_commands = self.project.get_commands(project, subproject=None)
-            last_command = max([parser.parse(i['timeIssued']) for i in all_commands])
-            stale = " **STALE**" if (datetime.datetime.now() - last_command).total_seconds() > PROJECT_STALE_SECONDS else ''
-            message += '- ' + str(project) + ' (' + str(len([i for i in self.project.config if i[0] == project])) + \
+        for project in self.project.get_projects():
+            last_command = self.project.get_last_command_time(project)
+            if last_command:
+                stale = " **STALE**" if (datetime.datetime.now() - last_command).total_seconds() > PROJECT_STALE_SECONDS else ''
+            else:
+                stale = ''
+            message += '- ' + str(project) + ' (' + str(len(self.project.get_rooms(project))) + \
                        ' room/s; ' + str(len(self.project.get_subprojects(project=project))) + ' subproject/s; ' + str(last_command) + ')' + stale + '\n'
 
         self.create_message(
@@ -284,41 +322,22 @@ class Bot():
 
     def create_message(self, message, roomId):
         logger.debug("Sending Message '" + message + "' to room '" + roomId + "' ")
-        self.api.messages.create(markdown=message, roomId=roomId)
-        logger.debug("Message Sent")
-
-    def arg_exists(self, string):
-        for command in self.supported_commands:
-            executed_command = ("^" + command + "$") if self.project.strict_regex else command
-            if re.search(executed_command, string.lower()):
-                logger.debug("Found function for command '" + str(string) + "'")
-                return self.supported_commands[command]
+        get_dispatcher(self.api).send(roomId, markdown=message)
+
+    def route(self, string):
+        """
+        Returns (function, tier, groups) for the command in string, or (None, TIER.NONE, ()) if there is no such command
+        """
+        name, tier, groups = self.router.route(string, strict=bool(self.project.strict_regex))
+        if name:
+            logger.debug("Found " + tier.name.lower() + " function for command '" + str(string) + "'")
+            return getattr(self, name), tier, groups
         else:
             logger.debug("No function found for command '" + str(string) + "'")
-            return None
-
-    def admin_arg_exists(self, string):
-        for command in self.supported_admin_commands:
-            executed_command = ("^" + command + "$") if self.project.strict_regex else command
-            if re.search(executed_command, string.lower()):
-                logger.debug("Found admin function for command '" + str(string) + "'")
-                return self.supported_admin_commands[command]
-        else:
-            logger.debug("No admin function found for command '" + str(string) + "'")
-            return None
-
-    def global_admin_arg_exists(self, string):
-        for command in self.supported_global_admin_commands:
-            executed_command = ("^" + command + "$") if self.project.strict_regex else command
-            if re.search(executed_command, string.lower()):
-                logger.debug("Found global admin function for command '" + str(string) + "'")
-                return self.supported_global_admin_commands[command]
-        else:
-            logger.debug("No global admin function found for command '" + str(string) + "'")
-            return None
+            return None, tier, groups
 
     def _rejection_message(self, data):
-        self.api.messages.create(
+        get_dispatcher(self.api).send(
             files=['queuebot/rejection_pic.jpg'],
             roomId=data['roomId']
         )
@@ -361,7 +380,7 @@ class Bot():
         logger.debug("Initialized Command Manager")
 
     def handle_data(self, data):
-        self.message_text = self.api.messages.get(data['id']).text.replace(self.api.people.me().displayName, "", 1).strip()
+        self.message_text = self.api.messages.get(data['id']).text.replace(get_me(self.api).displayName, "", 1).strip()
 
         pattern = re.search('.*\sfor\ssubproject\s(\w+)', self.message_text)
         self.message_text = re.sub('\s+for\ssubproject\s(\w+)', '', self.message_text)
@@ -398,11 +417,12 @@ class Bot():
             )
 
             if self.message_text.lower() == 'help':
-                self.supported_commands['help'](data)
+                self.help(data)
             elif self.message_text.lower() == 'cat fact':
                 if random.random() <= RANDOM_EASTER_REJECTION:
                     self._rejection_message(data)
                 else:
+                    import requests
                     self.create_message(
                         requests.get('https://catfact.ninja/fact').json()['fact'],
                         roomId=data['roomId']
@@ -411,39 +431,38 @@ class Bot():
                 if random.random() <= RANDOM_EASTER_REJECTION:
                     self._rejection_message(data)
                 else:
+                    import requests
                     self.create_message(
                         requests.get('https://icanhazdadjoke.com/', headers={'Accept': 'application/json'}).json()['joke'],
                         roomId=data['roomId']
                     )
-            elif self.global_admin_arg_exists(self.message_text):
-                if self.admins.is_global_admin(id=data['personId']):
-                    self.global_admin_arg_exists(self.message_text)(data)
-                else:
-                    self.create_message(
-                        'You are not registered as a global admin.',
-                        roomId=data['roomId']
-                    )
-            elif self.admin_arg_exists(self.message_text):
-                if self.admins.is_admin(id=data['personId']):
-                    function = self.admin_arg_exists(self.message_text)
-                    if function == self.register_bot or function == self.create_new_project or self.project.get_project():
-                        function(data)
-                    else:
-                        message = "QueueBot is not registered to a project! Ask an admin to register this bot"
-                        self.create_message(message, data['roomId'])
-                else:
-                    function = self.admin_arg_exists(self.message_text)
-                    if not self.project.get_project() and function in self.permitted_null_commands:
+            else:
+                function, tier, _ = self.route(self.message_text)
+
+                if tier == TIER.GLOBAL_ADMIN:
+                    if self.admins.is_global_admin(id=data['personId']):
                         function(data)
                     else:
                         self.create_message(
-                            'You are not registered as an admin.',
+                            'You are not registered as a global admin.',
                             roomId=data['roomId']
                         )
-            else:
-                function = self.arg_exists(self.message_text)
-
-                if not self.project.get_project() and function in self.permitted_null_commands:
+                elif tier == TIER.ADMIN:
+                    if self.admins.is_admin(id=data['personId']):
+                        if function == self.register_bot or function == self.create_new_project or self.project.get_project():
+                            function(data)
+                        else:
+                            message = "QueueBot is not registered to a project! Ask an admin to register this bot"
+                            self.create_message(message, data['roomId'])
+                    else:
+                        if not self.project.get_project() and self._is_permitted_null_command(function):
+                            function(data)
+                        else:
+                            self.create_message(
+                                'You are not registered as an admin.',
+                                roomId=data['roomId']
+                            )
+                elif not self.project.get_project() and self._is_permitted_null_command(function):
                     function(data)
                 elif not function:
                     self.no_command_found(data)
@@ -456,7 +475,7 @@ class Bot():
     def no_command_found(self, data):
         self.create_message(
             "Unrecognized Command: '" + self.message_text.lower() + "'\n\n" +
-            "Please use one of:\n- " + str('\n- '.join(sorted(self.supported_commands))),
+            "Please use one of:\n- " + str('\n- '.join(sorted(self.user_commands))),
             data['roomId']
         )
 
@@ -572,7 +591,7 @@ class Bot():
         Removes the first occurence of you from the queue
         """
         logger.debug("Executing remove me")
-        person = self.api.people.get(data['personId'])
+        person = get_person(self.api, data['personId'])
         if not self.q.remove_from_queue(data):
             self.create_message("ERROR: '" + str(person.displayName) + "' was not found in the queue", data['roomId'])
         else:
@@ -586,8 +605,9 @@ class Bot():
         """
         Shows all the admins for the current project
         """
-        admin_names = [self.api.people.get(i).displayName for i in self.admins.get_admins()]
-        global_admin_names = [self.api.people.get(i).displayName for i in GLOBAL_ADMINS]
+        prefetch_people(self.api, self.admins.get_admins() + GLOBAL_ADMINS)
+        admin_names = [get_person(self.api, i).displayName for i in self.admins.get_admins()]
+        global_admin_names = [get_person(self.api, i).displayName for i in GLOBAL_ADMINS]
         global_admins_nice = '- '.join([(i + ' (global)\n') for i in global_admin_names])
         admins_nice = '- '.join([(i + '\n') for i in set(admin_names) - set(global_admin_names)])
 
@@ -612,15 +632,9 @@ class Bot():
         """
         Displays all the available commands available to only admins
         """
-        command_strings = ''
-
-        for command, docstring in self._admin_commands_with_help_string().items():
-            docstring = self._clean_docstring(docstring)
-            command_strings += '- **' + command.replace("*", "\*") + (('** (' + docstring + ')\n') if docstring else '**\n')
-
         self.create_message(
             'Admin commands can be used in any room but are only accessible by an admin.\n\n'
-            'Available admin commands are:\n' + command_strings,
+            'Available admin commands are:\n' + self._command_help('admin_commands', escape=True),
             roomId=data['roomId']
         )
 
@@ -687,7 +701,7 @@ class Bot():
                 roomId=data['roomId']
             )
 
-            self.admins._project = project
+            self.admins._project = project.upper()
             self.admins.add_admin(data['personId'])
 
             success, message = self.project.register_room_to_project(project, roomId=data['roomId'])
@@ -719,11 +733,9 @@ class Bot():
         Shows the last X commands that were issued on this project where X is a non-negative integer
         """
         number = int(re.search('show last (\d*) commands', self.message_text).group(1))
-        commands = self.commands.get_commands()
+        commands = self.commands.get_last_commands(number)
         command_string = ''
         for index, command in enumerate(commands[::-1]):
-            if index >= number:
-                break
             time = parser.parse(command['timeIssued'])
             command_string += str(index + 1) + '. ' + command['command'] + ' (' + str(command['displayName']) + \
                               ' executed at ' + str(time.strftime(FORMAT_STRING)) + ')\n'
@@ -733,11 +745,24 @@ class Bot():
             roomId=data['roomId']
         )
 
+    def _get_tagged_or_named(self, data, pattern):
+        """
+        Returns the ids of the tagged people. If nobody was tagged, the text matched by pattern is looked up as the email
+        or display name of someone who has already used the bot on this subproject
+        """
+        tagged = set(data['mentionedPeople']) - {get_me(self.api).id}
+        if not tagged:
+            match = re.search(pattern, self.message_text, re.IGNORECASE)
+            person = self.people.find_person(match.group(1)) if match and match.group(1).strip() else {}
+            if person:
+                tagged = {person['sparkId']}
+        return tagged
+
     def add_person(self, data):
         """
         Adds the tagged person to the back of the queue
         """
-        tagged = set(data['mentionedPeople']) - {self.api.people.me().id}
+        tagged = self._get_tagged_or_named(data, 'add person (.*)')
         if not tagged:
             self.create_message(
                 "Nobody was tagged to be added. Please tag who you would like to add",
@@ -765,7 +790,7 @@ class Bot():
         """
         Removes the first occurence of the tagged person
         """
-        tagged = set(data['mentionedPeople']) - {self.api.people.me().id}
+        tagged = self._get_tagged_or_named(data, 'remove person (.*)')
         if not tagged:
             self.create_message(
                 "Nobody was tagged to be removed. Please tag who you would like to remove",
@@ -779,7 +804,7 @@ class Bot():
         else:
             person_data = {'personId': tagged.pop()}
             logger.debug("Executing remove me")
-            person = self.api.people.get(person_data['personId'])
+            person = get_person(self.api, person_data['personId'])
             if not self.q.remove_from_queue(person_data):
                 self.create_message("ERROR: '" + str(person.displayName) + "' was not found in the queue", data['roomId'])
             else:
@@ -789,7 +814,7 @@ class Bot():
         """
         Adds the tagged person as an admin for the current project
         """
-        tagged = set(data['mentionedPeople']) - {self.api.people.me().id}
+        tagged = set(data['mentionedPeople']) - {get_me(self.api).id}
 
         if not tagged:
             self.create_message(
@@ -802,7 +827,7 @@ class Bot():
                 roomId=data['roomId']
             )
         else:
-            person = self.api.people.get(tagged.pop())
+            person = get_person(self.api, tagged.pop())
             if person and person.id not in self.admins.get_admins():
                 self.admins.add_admin(person.id)
                 self.create_message(
@@ -826,7 +851,7 @@ class Bot():
         """
         Removes the tagged person as an admin for the current project
         """
-        tagged = set(data['mentionedPeople']) - {self.api.people.me().id}
+        tagged = set(data['mentionedPeople']) - {get_me(self.api).id}
 
         if not tagged:
             self.create_message(
@@ -839,7 +864,7 @@ class Bot():
                 roomId=data['roomId']
             )
         else:
-            person = self.api.people.get(tagged.pop())
+            person = get_person(self.api, tagged.pop())
             if person and person.id in self.admins.get_admins():
                 self.admins.remove_admin(person.id)
 
@@ -880,39 +905,41 @@ class Bot():
         """
         Returns a CSV file attachment containing global statistics for the project
         """
+        import csv
         stats = self._get_stats()
         rows = [list(stats.keys())] + [list(i) for i in zip(*stats.values())]
-        with open(CSV_FILE_FORMAT.format(self.project.get_project(), self.subproject), 'w') as csvfile:
-            spamwriter = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
-            for row in rows:
-                spamwriter.writerow(row)
-        self.api.messages.create(
+        # Built in memory and uploaded like the charts, rather than through a file in the working directory
+        csvfile = io.StringIO()
+        spamwriter = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
+        for row in rows:
+            spamwriter.writerow(row)
+        get_dispatcher(self.api).send(
             markdown="Here are all the stats for subproject '" + str(self.subproject) + "' on project '" + str(self.project.get_project()) + "' as a csv",
-            files=[CSV_FILE_FORMAT.format(self.project.get_project(), self.subproject)],
+            files=[(CSV_FILE_FORMAT.format(self.project.get_project(), self.subproject), csvfile.getvalue().encode('utf-8'))],
             roomId=data['roomId']
         )
-        os.remove(CSV_FILE_FORMAT.format(self.project.get_project(), self.subproject))
 
     def _make_time_pretty(self, seconds):
         return str(datetime.timedelta(seconds=seconds))
 
     def _how_long(self, personId=None):
-        seconds = 0
+        queue = self.q.get_queue()
+        flush_times = self.q.get_estimated_flush_times()
 
-        if not personId or not self.q.get_member(personId):
-            flush_time = self.q.get_estimated_wait_time()
+        if not personId or personId not in [i['personId'] for i in queue]:
+            flush_time = self.q.get_estimated_wait_time(flush_times=flush_times)
 
-            if len(self.q.get_queue()) == 1:
+            if len(queue) == 1:
                 people_string = 'is 1 person'
             else:
-                people_string = 'are ' + str(len(self.q.get_queue())) + ' people'
+                people_string = 'are ' + str(len(queue)) + ' people'
 
             return 'Given that there ' + people_string + ' in the queue. ' \
                                                               'Estimated wait time from the back of the queue is:\n\n' + \
                    str(self._make_time_pretty(flush_time))
         else:
-            flush_time = self.q.get_estimated_wait_time(personId)
-            location_in_queue = [i['personId'] for i in self.q.get_queue()].index(personId)
+            flush_time = self.q.get_estimated_wait_time(personId, flush_times=flush_times)
+            location_in_queue = [i['personId'] for i in queue].index(personId)
 
         if location_in_queue == 1:
             people_string = 'is 1 person'
@@ -991,316 +1018,57 @@ class Bot():
 
     def get_aggregate_stat_unit(self, data):
         """
-        Gets aggregate, max, or min for a given statistic by a given unit. Returns an image of a graph
-        """
-        function_mapping = {
-            ('average', 'queue depth', 'hour'): self.get_average_queue_depth_hour,
-            ('max', 'queue depth', 'hour'): self.get_max_queue_depth_hour,
-            ('min', 'queue depth', 'hour'): self.get_min_queue_depth_hour,
-            ('min', 'flush time', 'hour'): self.get_min_flush_time_hour,
-            ('max', 'flush time', 'hour'): self.get_max_flush_time_hour,
-            ('average', 'flush time', 'hour'): self.get_average_flush_time_hour,
-            ('max', 'queue depth', 'day'): self.get_max_queue_depth_day,
-            ('min', 'queue depth', 'day'): self.get_min_queue_depth_day,
-            ('average', 'queue depth', 'day'): self.get_average_queue_depth_day,
-            ('max', 'flush time', 'day'): self.get_max_flush_time_day,
-            ('min', 'flush time', 'day'): self.get_min_flush_time_day,
-            ('average', 'flush time', 'day'): self.get_average_flush_time_day,
-        }
+        Gets the average, max, min or a percentile (p50, p90, ...) of a given statistic by a given unit. Returns an
+        image of a graph
+        """
         aggregate, stat, unit = re.search(
-            "show (average|max|min) (queue depth|flush time) by (hour|day)",
+            "show (" + STATISTICS + ") (queue depth|flush time) by (hour|day)",
             self.message_text
         ).groups()
-
-        function_mapping.get(tuple([aggregate, stat, unit]), self.no_command_found)(data)
-
-    def get_average_flush_time_hour(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: ((sum(x) / len(x)) if x else 0),
-            attribute='flushTime',
-            unit='hour'
-        )
-
-        reformatted = {}
-        while len(d):
-            k = str(min([int(i) for i in d]))
-            reformatted[self._convert_int_to_time(int(k))] = d.pop(k)
-
-        with self._create_bar_graph(
-                title="Average Flush Time by Hour for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_average_flush_time_hour_' + str(self.project.get_project()) + '_' + str(self.subproject)+ '.png',
-                yaxis_dates=True
-        ) as file:
-            self.api.messages.create(
-                files=[file],
-                roomId=data['roomId']
-            )
-
-    def get_average_flush_time_day(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: ((sum(x) / len(x)) if x else 0),
-            attribute='flushTime',
-            unit='day'
-        )
-        days = {'0': 'Monday', '1': 'Tuesday', '2': 'Wednesday', '3': 'Thursday',
-                '4': 'Friday', '5': 'Saturday', '6': 'Sunday'}
-        reformatted = {days[str(k)]: d.get(str(k), '0') for k in range(7)}
-
-        with self._create_bar_graph(
-                title="Average Flush Time by Day for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_average_flush_time_day_' + str(self.project.get_project()) + '_' + str(self.subproject)+ '.png',
-                yaxis_dates=True,
-                rotation=0
-        ) as file:
-            self.api.messages.create(
-                files=[file],
-                roomId=data['roomId']
+        project = str(self.project.get_project())
+        title = (aggregate.upper() if aggregate.startswith('p') else aggregate.title()) + ' ' + stat.title() + \
+            ' by ' + unit.title() + " for '" + project + "' on subproject '" + str(self.subproject) + "'"
+
+        def get_items():
+            values = self.q.get_statistic_by_unit(
+                statistic=aggregate,
+                attribute={'queue depth': 'queueDepth', 'flush time': 'flushTime'}[stat],
+                unit=unit
             )
-
-    def get_min_queue_depth_hour(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: (min(x) if x else 0),
-            attribute='queueDepth',
-            unit='hour'
-        )
-
-        reformatted = {}
-        while len(d):
-            k = str(min([int(i) for i in d]))
-            reformatted[self._convert_int_to_time(int(k))] = d.pop(k)
-
-        with self._create_bar_graph(
-                title="Min Queue Depth by Hour for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_min_queue_depth_hour_' + str(self.project.get_project()) + '_' + str(self.subproject) + '.png',
-        ) as file:
-            self.api.messages.create(
-                files=[file],
-                roomId=data['roomId']
-            )
-
-    def get_max_flush_time_hour(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: (max(x) if x else 0),
-            attribute='flushTime',
-            unit='hour'
-        )
-
-        reformatted = {}
-        while len(d):
-            k = str(min([int(i) for i in d]))
-            reformatted[self._convert_int_to_time(int(k))] = d.pop(k)
-
-        with self._create_bar_graph(
-                title="Max Flush Time by Hour for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_max_flush_time_hour_' + str(self.project.get_project()) + '_' + str(self.subproject) + '.png',
-                yaxis_dates=True
-        ) as file:
-            self.api.messages.create(
-                files=[file],
-                roomId=data['roomId']
-            )
-
-    def get_max_flush_time_day(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: (max(x) if x else 0),
-            attribute='flushTime',
-            unit='day'
-        )
-        days = {'0': 'Monday', '1': 'Tuesday', '2': 'Wednesday', '3': 'Thursday',
-                '4': 'Friday', '5': 'Saturday', '6': 'Sunday'}
-        reformatted = {days[str(k)]: d.get(str(k), '0') for k in range(7)}
-
-        with self._create_bar_graph(
-                title="Max Flush Time by Day for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_max_flush_time_day_' + str(self.project.get_project()) + '_' + str(self.subproject) + '.png',
-                yaxis_dates=True,
-                rotation=0
-        ) as file:
-            self.api.messages.create(
-                files=[file],
-                roomId=data['roomId']
-            )
-
-    def get_min_flush_time_day(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: (min(x) if x else 0),
-            attribute='flushTime',
-            unit='day'
-        )
-        days = {'0': 'Monday', '1': 'Tuesday', '2': 'Wednesday', '3': 'Thursday',
-                '4': 'Friday', '5': 'Saturday', '6': 'Sunday'}
-        reformatted = {days[str(k)]: d.get(str(k), '0') for k in range(7)}
-
-        with self._create_bar_graph(
-                title="Min Flush Time by Day for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_min_flush_time_day_' + str(self.project.get_project()) + '_' + str(self.subproject) + '.png',
-                yaxis_dates=True,
-                rotation=0
-        ) as file:
-            self.api.messages.create(
-                files=[file],
-                roomId=data['roomId']
-            )
-
-    def get_min_flush_time_hour(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: (min(x) if x else 0),
-            attribute='flushTime',
-            unit='hour'
-        )
-
-        reformatted = {}
-        while len(d):
-            k = str(min([int(i) for i in d]))
-            reformatted[self._convert_int_to_time(int(k))] = d.pop(k)
-
-        with self._create_bar_graph(
-                title="Min Flush Time by Hour for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_min_flush_time_hour_' + str(self.project.get_project()) + '_' + str(self.subproject) + '.png',
-                yaxis_dates=True
-        ) as file:
-            self.api.messages.create(
-                files=[file],
-                roomId=data['roomId']
-            )
-
-    def get_max_queue_depth_hour(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: (max(x) if x else 0),
-            attribute='queueDepth',
-            unit='hour'
-        )
-
-        reformatted = {}
-        while len(d):
-            k = str(min([int(i) for i in d]))
-            reformatted[self._convert_int_to_time(int(k))] = d.pop(k)
-
-        with self._create_bar_graph(
-                title="Max Queue Depth by Hour for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_max_queue_depth_hour_' + str(self.project.get_project()) + '_' + str(self.subproject) + '.png'
-        ) as file:
-            self.api.messages.create(
-                files=[file],
-                roomId=data['roomId']
-            )
-
-    def get_average_queue_depth_hour(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: ((sum(x) / len(x)) if x else 0),
-            attribute='queueDepth',
-            unit='hour'
-        )
-
-        reformatted = {}
-        while len(d):
-            k = str(min([int(i) for i in d]))
-            reformatted[self._convert_int_to_time(int(k))] = d.pop(k)
-
-        with self._create_bar_graph(
-                title="Average Queue Depth by Hour for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_average_queue_depth_hour_' + str(self.project.get_project()) + '_' + str(self.subproject) + '.png'
-        ) as file:
-            self.api.messages.create(
-                files=[file],
-                roomId=data['roomId']
-            )
-
-    def get_average_queue_depth_day(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: ((sum(x) / len(x)) if x else 0),
-            attribute='queueDepth',
-            unit='day'
-        )
-        days = {'0': 'Monday', '1': 'Tuesday', '2': 'Wednesday', '3': 'Thursday',
-                '4': 'Friday', '5': 'Saturday', '6': 'Sunday'}
-        reformatted = {days[k]: v for k, v in d.items()}
-
-        with self._create_bar_graph(
-                title="Average Queue Depth by Day for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_average_queue_depth_day_' + str(self.project.get_project()) + '_' + str(self.subproject) + '.png',
-                rotation=0
-        ) as file:
-            self.api.messages.create(
-                files=[file],
-                roomId=data['roomId']
+            if unit == 'hour':
+                return {self._convert_int_to_time(k): v for k, v in enumerate(values)}
+            else:
+                days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+                return {days[k]: v for k, v in enumerate(values)}
+
+        chart = CHART_CACHE.get(
+            (project, self.subproject, aggregate, stat, unit, self.q.get_history_version()),
+            lambda: CHART_RENDERER.render(
+                title=title,
+                items=get_items(),
+                yaxis_dates=stat == 'flush time',
+                rotation=45 if unit == 'hour' else 0
             )
-
-    def get_max_queue_depth_day(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: max(x) if x else 0,
-            attribute='queueDepth',
-            unit='day'
         )
-        days = {'0': 'Monday', '1': 'Tuesday', '2': 'Wednesday', '3': 'Thursday',
-                '4': 'Friday', '5': 'Saturday', '6': 'Sunday'}
-        reformatted = {days[k]: v for k, v in d.items()}
-
-        with self._create_bar_graph(
-                title="Max Queue Depth by Day for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_max_queue_depth_day_' + str(self.project.get_project()) + '_' + str(self.subproject) + '.png',
-                rotation=0
-        ) as file:
-            self.api.messages.create(
-                files=[file],
+        if chart is None:
+            # The graph couldn't be drawn, so send its numbers instead
+            items = get_items()
+            width = max(len(i) for i in items)
+            self.create_message(
+                '**' + title + '**\n\n```\n' + '\n'.join(
+                    k.ljust(width) + '  ' +
+                    (str(datetime.timedelta(seconds=round(v))) if stat == 'flush time' else format(v, '.2f'))
+                    for k, v in items.items()
+                ) + '\n```',
                 roomId=data['roomId']
             )
+            return
 
-    def get_min_queue_depth_day(self, data):
-        d = self.q.get_function_attribute_by_unit(
-            function=lambda x: min(x) if x else 0,
-            attribute='queueDepth',
-            unit='day'
+        get_dispatcher(self.api).send(
+            files=[('get_' + aggregate + '_' + stat.replace(' ', '_') + '_' + unit + '_' + project + '_' +
+                    str(self.subproject) + '.png', chart)],
+            roomId=data['roomId']
         )
-        days = {'0': 'Monday', '1': 'Tuesday', '2': 'Wednesday', '3': 'Thursday',
-                '4': 'Friday', '5': 'Saturday', '6': 'Sunday'}
-        reformatted = {days[k]: v for k, v in d.items()}
-
-        with self._create_bar_graph(
-                title="Min Queue Depth by Day for '" + str(self.project.get_project()) + "' on subproject '" + str(self.subproject) + "'",
-                items=reformatted,
-                filename='get_min_queue_depth_day_' + str(self.project.get_project()) + '_' + str(self.subproject) + '.png',
-                rotation=0
-        ) as file:
-            self.api.messages.create(
-                files=[file],
-                roomId=data['roomId']
-            )
-
-    @contextmanager
-    def _create_bar_graph(self, title, items, filename, yaxis_dates=False, rotation=45):
-        try:
-            if yaxis_dates:
-                def timeTicks(x, pos):
-                    return str(datetime.timedelta(seconds=x))
-
-                formatter = matplotlib.ticker.FuncFormatter(timeTicks)
-                pyplot.axes().yaxis.set_major_formatter(formatter)
-            pyplot.plot(list(range(len(items))), list(items.values()), '-', color='black')
-            pyplot.plot(list(range(len(items))), list(items.values()), 'ro', markersize=4)
-            pyplot.grid(True)
-            pyplot.title(title)
-            pyplot.xticks(range(len(items)), items.keys(), rotation=rotation)
-            pyplot.savefig(filename)
-            pyplot.gcf().clear()
-            yield filename
-        finally:
-            try:
-                os.remove(filename)
-            except OSError:
-                # File doesn't exist
-                pass
 
     def show_version_number(self, data):
         """
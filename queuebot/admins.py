@@ -1,4 +1,3 @@
-import json
 import os
 import pprint
 import datetime
@@ -6,6 +5,7 @@ import datetime
 from app import logger
 from config import ADMINS_FILE, GLOBAL_ADMINS
 from queuebot.people import PeopleManager
+from queuebot.storage import get_storage
 
 
 class AdminManager:
@@ -13,16 +13,9 @@ class AdminManager:
         self._api = api
         self._file = ADMINS_FILE.format(project)
         self._project = project
-        self._displayName = self._api.people.me().displayName
         self._people = people_manager
-
-        os.makedirs(os.path.dirname(os.path.realpath(self._file)), exist_ok=True)
-
-        if not os.path.exists(self._file):
-            self._admins = []
-            self._save()
-        else:
-            self._admins = json.load(open(self._file, 'r'))
+        self._storage = get_storage()
+        self._admins = self._storage.get_admins(self._project)
 
     def get_admins(self):
         return self._admins
@@ -31,14 +24,14 @@ class AdminManager:
         if not project:
             return id in GLOBAL_ADMINS + self._admins
         else:
-            return id in json.load(open(ADMINS_FILE.format(project), 'r')) + GLOBAL_ADMINS
+            return id in self._storage.get_admins(project) + GLOBAL_ADMINS
 
     def is_global_admin(self, id):
         return id in GLOBAL_ADMINS
 
     def _save(self):
         logger.debug(pprint.pformat(self._admins))
-        json.dump(self._admins, open(self._file, 'w'), indent=4, separators=(',', ': '))
+        self._storage.save_admins(self._project, self._admins)
 
     def add_admin(self, id):
         logger.debug("Adding admin '" + id + "'")
@@ -0,0 +1,119 @@
+import datetime
+import re
+
+import numpy
+
+UNITS = {'hour': 24, 'day': 7}
+ATTRIBUTES = {'queueDepth': ('depths', 'depth'), 'flushTime': ('flush_times', 'flush')}
+
+# Local time is worked out once per quarter hour of history, which lines up with the hours of every time zone
+_QUARTER_HOUR = 15 * 60
+
+
+def _local_fields(times):
+    """
+    Returns the local hour of the day and day of the week of every epoch time in times
+    """
+    if not len(times):
+        return {unit: numpy.zeros(0, dtype=numpy.intp) for unit in UNITS}
+
+    quarters, inverse = numpy.unique(numpy.floor_divide(times, _QUARTER_HOUR), return_inverse=True)
+    local = [datetime.datetime.fromtimestamp(i * _QUARTER_HOUR) for i in quarters]
+    return {
+        'hour': numpy.array([i.hour for i in local], dtype=numpy.intp)[inverse],
+        'day': numpy.array([i.weekday() for i in local], dtype=numpy.intp)[inverse]
+    }
+
+
+class HistoryAggregator:
+    """
+    Computes statistics of a History grouped by hour of the day or day of the week.
+
+    The history's columns are viewed as NumPy arrays, without copying, and each record's hour and weekday is worked out
+    once when the aggregator is created. Every statistic is then a handful of vectorised operations over all records:
+    'average', 'min' and 'max' also include the hourly and daily rollups of compacted history, while percentiles
+    ('p50', 'p90', ...) are only computed from the records that have not been compacted, as rollups don't keep the
+    values they summarise.
+    """
+    def __init__(self, history):
+        self._values = {}
+        for attribute, (column, prefix) in ATTRIBUTES.items():
+            self._values[attribute] = numpy.frombuffer(getattr(history, column), dtype=numpy.float64)
+        self._groups = _local_fields(numpy.frombuffer(history.times, dtype=numpy.float64))
+
+        self._rollups = {}
+        for unit, rollup in [('hour', history.hourly), ('day', history.daily)]:
+            self._rollups[unit] = {
+                'groups': _local_fields(numpy.frombuffer(rollup.starts, dtype=numpy.float64))[unit],
+                'counts': numpy.frombuffer(rollup.counts, dtype=numpy.float64)
+            }
+            for attribute, (column, prefix) in ATTRIBUTES.items():
+                for statistic in ['sums', 'mins', 'maxes']:
+                    self._rollups[unit][attribute + statistic] = \
+                        numpy.frombuffer(getattr(rollup, prefix + '_' + statistic), dtype=numpy.float64)
+
+        self._sorted = {}
+
+    def aggregate(self, statistic, attribute, unit):
+        """
+        Returns statistic of attribute ('queueDepth' or 'flushTime') for every hour (0 to 23) or day (0 for Monday to
+        6), as an array with 0 for those without any history
+        """
+        if statistic == 'average':
+            return self._average(attribute, unit)
+        elif statistic in ['min', 'max']:
+            return self._extreme(statistic, attribute, unit)
+        elif re.match('p[0-9]{1,2}$', statistic):
+            return self._percentile(int(statistic[1:]), attribute, unit)
+        else:
+            raise Exception("Unknown statistic '" + str(statistic) + "'")
+
+    def _average(self, attribute, unit):
+        groups, values, rollup = self._groups[unit], self._values[attribute], self._rollups[unit]
+        counts = numpy.bincount(groups, minlength=UNITS[unit]) + \
+            numpy.bincount(rollup['groups'], weights=rollup['counts'], minlength=UNITS[unit])
+        sums = numpy.bincount(groups, weights=values, minlength=UNITS[unit]) + \
+            numpy.bincount(rollup['groups'], weights=rollup[attribute + 'sums'], minlength=UNITS[unit])
+
+        averages = numpy.zeros(UNITS[unit])
+        numpy.divide(sums, counts, out=averages, where=counts > 0)
+        return averages
+
+    def _extreme(self, statistic, attribute, unit):
+        function, empty = (numpy.minimum, numpy.inf) if statistic == 'min' else (numpy.maximum, -numpy.inf)
+        result = numpy.full(UNITS[unit], empty)
+
+        values, starts, counts = self._sort(attribute, unit)
+        present = counts > 0
+        if present.any():
+            result[present] = function.reduceat(values, starts[present])
+
+        rollup = self._rollups[unit]
+        function.at(result, rollup['groups'], rollup[attribute + ('mins' if statistic == 'min' else 'maxes')])
+        result[numpy.isinf(result)] = 0
+        return result
+
+    def _percentile(self, percent, attribute, unit):
+        values, starts, counts = self._sort(attribute, unit)
+        result = numpy.zeros(UNITS[unit])
+        present = counts > 0
+
+        # Linear interpolation between the closest ranks, as numpy.percentile does
+        position = starts[present] + (counts[present] - 1) * percent / 100.0
+        lower = numpy.floor(position).astype(numpy.intp)
+        upper = numpy.minimum(lower + 1, starts[present] + counts[present] - 1)
+        result[present] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+        return result
+
+    def _sort(self, attribute, unit):
+        """
+        Returns the values of attribute sorted by group and then value, with the index each group starts at and the
+        number of values in it
+        """
+        if (attribute, unit) not in self._sorted:
+            groups, values = self._groups[unit], self._values[attribute]
+            order = numpy.lexsort((values, groups))
+            counts = numpy.bincount(groups, minlength=UNITS[unit])
+            starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]]).astype(numpy.intp)
+            self._sorted[(attribute, unit)] = values[order], starts, counts
+        return self._sorted[(attribute, unit)]
@@ -0,0 +1,175 @@
+import atexit
+import collections
+import datetime
+import io
+import multiprocessing
+import threading
+import time
+import traceback
+
+from app import logger, CHART_CACHE_BYTES, CHART_PROCESSES, CHART_TIMEOUT
+
+
+def render_line_graph(title, items, yaxis_dates=False, rotation=45):
+    """
+    Returns the PNG of a line graph of the values of items, labelled with their keys. yaxis_dates labels the y axis as
+    durations in seconds.
+
+    Each graph is drawn on its own Figure and Agg canvas rather than pyplot's current figure, so graphs can be rendered
+    on several threads at once. matplotlib is imported on the first call, so only processes that draw charts load it.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import FuncFormatter
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(1, 1, 1)
+    if yaxis_dates:
+        axes.yaxis.set_major_formatter(FuncFormatter(lambda x, pos: str(datetime.timedelta(seconds=x))))
+    axes.plot(list(range(len(items))), list(items.values()), '-', color='black')
+    axes.plot(list(range(len(items))), list(items.values()), 'ro', markersize=4)
+    axes.grid(True)
+    axes.set_title(title)
+    axes.set_xticks(range(len(items)))
+    axes.set_xticklabels(items.keys(), rotation=rotation)
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def _warm_up():
+    # Imports matplotlib and loads the fonts and the rest of what it reads on its first render, before a chart is
+    # waiting on it
+    render_line_graph('', {'': 0})
+
+
+class ChartRenderer:
+    """
+    Renders charts in a pool of CHART_PROCESSES processes, so the CPU time matplotlib spends on each one doesn't hold the
+    GIL of the process handling webhooks.
+
+    The pool is started on the first render, with the spawn start method as the bot's process has threads, and each
+    process renders a chart as soon as it starts so the first real one is as quick as the rest. A chart that takes
+    longer than CHART_TIMEOUT seconds is given up on and the pool is replaced, as the only way to stop a render is to
+    stop its process. With CHART_PROCESSES = 0 charts are rendered in the calling thread.
+    """
+    def __init__(self, processes=None, timeout=None):
+        self._processes = CHART_PROCESSES if processes is None else processes
+        self._timeout = timeout or CHART_TIMEOUT
+        self._pool = None
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def render(self, title, items, yaxis_dates=False, rotation=45):
+        """
+        Returns the PNG render_line_graph draws for the arguments, or None if it failed or timed out
+        """
+        arguments = (title, items, yaxis_dates, rotation)
+        pool = None
+        try:
+            if self._processes:
+                pool = self._get_pool()
+                chart = pool.apply_async(render_line_graph, arguments).get(self._timeout)
+            else:
+                chart = render_line_graph(*arguments)
+        except multiprocessing.TimeoutError:
+            logger.error("Gave up on chart '" + title + "' after " + str(self._timeout) + ' seconds')
+            self._restart(pool)
+            with self._lock:
+                self.timed_out += 1
+            return None
+        except Exception:
+            logger.error("Failed to render chart '" + title + "'\n" + traceback.format_exc())
+            with self._lock:
+                self.failed += 1
+            return None
+
+        with self._lock:
+            self.rendered += 1
+        return chart
+
+    def statistics(self):
+        with self._lock:
+            return {'rendered': self.rendered, 'failed': self.failed, 'timedOut': self.timed_out}
+
+    def stop(self):
+        self._restart(self._pool)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.get_context('spawn').Pool(self._processes, initializer=_warm_up)
+            return self._pool
+
+    def _restart(self, pool):
+        # The next render starts a new pool
+        with self._lock:
+            if pool is None or pool is not self._pool:
+                return
+            self._pool = None
+        pool.terminate()
+
+
+class ChartCache:
+    """
+    Keeps rendered charts (PNG bytes) in memory so a chart of data that hasn't changed is only rendered once.
+
+    Keys are tuples of the project, the subproject, the chart and the version of the data it is drawn from, so a new
+    version is simply a miss and the charts of old versions age out. At most CHART_CACHE_BYTES of charts are kept, the
+    least recently used are dropped first.
+    """
+    def __init__(self, size=None):
+        self._size = size or CHART_CACHE_BYTES
+        self._charts = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.render_seconds = 0
+
+    def get(self, key, render):
+        """
+        Returns the chart cached for key, or renders it with render() and caches it. If render() returns None, for a
+        chart that couldn't be rendered, it is returned without being cached.
+        """
+        with self._lock:
+            if key in self._charts:
+                self._charts.move_to_end(key)
+                self.hits += 1
+                return self._charts[key]
+            self.misses += 1
+
+        start = time.perf_counter()
+        chart = render()
+        seconds = time.perf_counter() - start
+        logger.debug('Rendered chart ' + str(key) + ' in ' + format(seconds * 1000, '.1f') + 'ms')
+
+        with self._lock:
+            self.render_seconds += seconds
+            if chart is not None and key not in self._charts:
+                self._charts[key] = chart
+                self._bytes += len(chart)
+            while self._bytes > self._size and len(self._charts) > 1:
+                self._bytes -= len(self._charts.popitem(last=False)[1])
+        return chart
+
+    def statistics(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / requests if requests else 0,
+                'averageRenderSeconds': self.render_seconds / self.misses if self.misses else 0,
+                'cached': len(self._charts),
+                'bytes': self._bytes
+            }
+
+
+CHART_CACHE = ChartCache()
+CHART_RENDERER = ChartRenderer()
+atexit.register(CHART_RENDERER.stop)
@@ -0,0 +1,141 @@
+import json
+import os
+import re
+import threading
+import time
+
+from app import logger, COMMAND_LOG_SEGMENT_BYTES, COMMAND_LOG_FSYNC, COMMAND_LOG_FSYNC_INTERVAL
+
+BLOCK_SIZE = 64 * 1024
+
+_last_fsync = {}
+_rotate_lock = threading.Lock()
+
+
+class CommandLog:
+    """
+    Append only log of commands stored as one JSON record per line.
+
+    The active segment is rotated to '<file>.<n>' once it grows past COMMAND_LOG_SEGMENT_BYTES, where n starts at 1
+    for the oldest segment. If a legacy file (the old commands.pickle JSON list) exists it is read as the segment
+    before all others, so existing history does not need to be converted.
+    """
+    def __init__(self, file, legacy_file=None):
+        self._file = file
+        self._legacy_file = legacy_file
+
+    def append(self, record):
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+        with open(self._file, 'ab+') as log:
+            if log.seek(0, os.SEEK_END):
+                log.seek(-1, os.SEEK_END)
+                if log.read(1) != b'\n':
+                    # The last append was interrupted, so end its partial line rather than adding this record to it
+                    line = b'\n' + line
+            log.write(line)
+            log.flush()
+            if self._should_fsync():
+                os.fsync(log.fileno())
+            size = log.tell()
+
+        if size >= COMMAND_LOG_SEGMENT_BYTES:
+            self._rotate()
+
+    def read(self):
+        """
+        Returns every record in the order they were appended
+        """
+        records = self._read_legacy()
+        for file in self._segments() + [self._file]:
+            if os.path.exists(file):
+                with open(file, 'rb') as log:
+                    records += [i for i in (self._parse(line) for line in log) if i is not None]
+        return records
+
+    def tail(self, number):
+        """
+        Returns the last <number> records in the order they were appended, reading backwards from the end of the log
+        so the cost is proportional to <number> rather than the size of the log
+        """
+        records = []
+        if number <= 0:
+            return records
+
+        for file in [self._file] + self._segments()[::-1]:
+            if os.path.exists(file):
+                for record in self._read_reversed(file):
+                    records.append(record)
+                    if len(records) == number:
+                        return records[::-1]
+
+        legacy = self._read_legacy()
+        records += legacy[::-1][:number - len(records)]
+        return records[::-1]
+
+    def _should_fsync(self):
+        if COMMAND_LOG_FSYNC == 'always':
+            return True
+        elif COMMAND_LOG_FSYNC == 'interval':
+            now = time.time()
+            if now - _last_fsync.get(self._file, 0) >= COMMAND_LOG_FSYNC_INTERVAL:
+                _last_fsync[self._file] = now
+                return True
+        return False
+
+    def _segments(self):
+        directory, name = os.path.split(self._file)
+        numbers = []
+        if os.path.isdir(directory or '.'):
+            for file in os.listdir(directory or '.'):
+                match = re.match(re.escape(name) + r'\.(\d+)$', file)
+                if match:
+                    numbers.append(int(match.group(1)))
+        return [self._file + '.' + str(i) for i in sorted(numbers)]
+
+    def _rotate(self):
+        with _rotate_lock:
+            # Another thread may have already rotated this segment
+            if not os.path.exists(self._file) or os.path.getsize(self._file) < COMMAND_LOG_SEGMENT_BYTES:
+                return
+
+            segments = self._segments()
+            number = int(segments[-1].rsplit('.', 1)[1]) + 1 if segments else 1
+            logger.debug("Rotating command log '" + self._file + "' to segment " + str(number))
+            os.rename(self._file, self._file + '.' + str(number))
+
+    def _read_legacy(self):
+        if self._legacy_file and os.path.exists(self._legacy_file):
+            return json.load(open(self._legacy_file, 'r'))
+        else:
+            return []
+
+    def _read_reversed(self, file):
+        with open(file, 'rb') as log:
+            log.seek(0, os.SEEK_END)
+            position = log.tell()
+            remainder = b''
+            while position > 0:
+                size = min(BLOCK_SIZE, position)
+                position -= size
+                log.seek(position)
+                lines = (log.read(size) + remainder).split(b'\n')
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    record = self._parse(line)
+                    if record is not None:
+                        yield record
+
+            record = self._parse(remainder)
+            if record is not None:
+                yield record
+
+    def _parse(self, line):
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return json.loads(line.decode('utf-8'))
+        except ValueError:
+            # A partially written line from an interrupted append
+            logger.warning("Skipping unreadable line in command log '" + self._file + "'")
+            return None
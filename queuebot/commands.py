@@ -1,4 +1,3 @@
-import json
 import os
 import pprint
 import datetime
@@ -6,6 +5,17 @@ import datetime
 from app import logger
 from config import COMMANDS_FILE
 from queuebot.people import PeopleManager
+from queuebot.storage import get_storage
+
+_activity_listeners = []
+
+
+def on_activity(listener):
+    """
+    Registers listener(project, time) to be called whenever a command is added to a project in this process
+    """
+    if listener not in _activity_listeners:
+        _activity_listeners.append(listener)
 
 
 class CommandManager:
@@ -15,41 +25,42 @@ class CommandManager:
         self._project = project
         self._subproject = subproject
         self._people = people_manager
+        self._storage = get_storage()
         self._commands = {}
 
         os.makedirs(os.path.dirname(os.path.dirname(os.path.realpath(self._file))), exist_ok=True)
 
     def get_commands(self):
-        if not os.path.exists(self._file.format(self._subproject)):
-            self._commands = []
-        else:
-            self._commands = json.load(open(self._file.format(self._subproject), 'r'))
-
+        self._commands = self._storage.get_commands(self._project, self._subproject)
         return self._commands
 
-    def _save(self):
-        logger.debug(pprint.pformat(self._commands))
-        json.dump(self._commands, open(self._file.format(self._subproject), 'w'), indent=4, separators=(',', ': '))
+    def get_last_commands(self, number):
+        return self._storage.get_last_commands(self._project, self._subproject, number)
+
+    def _save(self, command):
+        logger.debug(pprint.pformat(command))
+        self._storage.add_command(self._project, self._subproject, command)
 
     def add_command(self, data, person, parsed_command):
         api_message = self._api.messages.get(data['id'])
         logger.debug(api_message)
         logger.debug("Adding command '" + api_message.id + "'")
 
-        self.get_commands()
-
-        self._commands.append({
+        time_issued = datetime.datetime.now()
+        command = {
             'sparkId': api_message.id,
             'personId': api_message.personId,
             'displayName': person['displayName'],
             'roomId': api_message.roomId,
             'command': parsed_command,
-            'timeIssued': str(datetime.datetime.now())
-        })
+            'timeIssued': str(time_issued)
+        }
         if self._people.get_person(id=api_message.personId):
             self._people.update_person(
                 id=api_message.personId,
                 commands=self._people.get_person(id=api_message.personId)['commands'] + 1
             )
-        self._save()
+        self._save(command)
+        for listener in _activity_listeners:
+            listener(self._project, time_issued)
         return api_message
@@ -1,16 +1,20 @@
+import copy
 import ciscosparkapi
 import flask
 import re
-import matplotlib
-matplotlib.use('Agg')
 import json
 
 from functools import wraps, partial
 from unittest import mock
 from attrdict import AttrDict
 from config import PROJECT_CONFIG, QUEUE_FILE, PEOPLE_FILE, GLOBAL_STATS_FILE, COMMANDS_FILE, ADMINS_FILE, SETTINGS_FILE, DATA_FOLDER
-from app import RELEASE_NOTES
+from app import RELEASE_NOTES, LAST_ACTIVITY_FILE
+from queuebot import spark
+from queuebot.charts import ChartCache, ChartRenderer
+from queuebot.dedup import WebhookDeduplicator
+from queuebot.history import History
 import config
+import endpoints  # Imported up front, as the request patches below need it before open() is mocked
 
 r_notes = json.load(open(RELEASE_NOTES))
 ME_ID = 'me_id'
@@ -23,8 +27,10 @@ def with_request(
         global_stats={},
         people=[],
         commands=[],
+        history=[],
         admins=[],
         mock_people={},
+        last_activity=None,
         settings={
             'default_subproject': 'GENERAL',
             'strict_regex': True
@@ -41,9 +47,11 @@ def with_request(
             COMMANDS_FILE: commands,
             ADMINS_FILE: admins,
             RELEASE_NOTES: r_notes,
-            SETTINGS_FILE: settings
+            SETTINGS_FILE: settings,
+            LAST_ACTIVITY_FILE: last_activity
         }
-        return files.get([i for i in files if re.search(i.format(*[".*?"] * i.count("{}")), file_name)][0])
+        # Copied like a real json.load, so changes made by one test don't leak into the defaults of the next
+        return copy.deepcopy(files.get([i for i in files if re.search(i.format(*[".*?"] * i.count("{}")), file_name)][0]))
 
     def api_get_side_effect(*args, **kwargs):
         return mock_people.get(args[0], AttrDict({
@@ -89,22 +97,43 @@ def with_request(
         else:
             return [[path, [], []]]
 
+    def command_log_tail_side_effect(number):
+        return commands[-number:] if number > 0 else []
+
+    def history_log_read_side_effect():
+        result = History()
+        result.extend(history)
+        return result
+
     def with_request_dec(func, *args, **kwargs):
         @wraps(func)
+        # Handle webhooks inside the request so the tests can check what was sent as soon as queue() returns
+        @mock.patch('endpoints.WORKERS._workers', 0)
+        @mock.patch('endpoints.DEDUPLICATOR', WebhookDeduplicator())
+        @mock.patch('queuebot.dispatcher.OUTBOUND_BACKGROUND', False)
+        @mock.patch('queuebot.projects._index', None)
+        @mock.patch('queuebot.CHART_CACHE', ChartCache())
+        @mock.patch('queuebot.CHART_RENDERER', ChartRenderer(processes=0))
+        @mock.patch('queuebot.history.HistoryLog.read', side_effect=history_log_read_side_effect)
+        @mock.patch('queuebot.history.HistoryLog.append', side_effect=history.extend)
+        @mock.patch('queuebot.commandlog.CommandLog.tail', side_effect=command_log_tail_side_effect)
+        @mock.patch('queuebot.commandlog.CommandLog.read', return_value=commands)
+        @mock.patch('queuebot.commandlog.CommandLog.append', side_effect=commands.append)
         @mock.patch('json.dump')
         @mock.patch('os.walk', side_effect=mock_os_walk_side_effect)
         @mock.patch('json.load', side_effect=load_side_effect)
         @mock.patch('flask.request')
         @mock.patch('builtins.open')
-        @mock.patch('endpoints.CiscoSparkAPI')
+        @mock.patch('queuebot.spark.CiscoSparkAPI')
         @mock.patch('os.path.exists')
         @mock.patch('os.makedirs')
         @mock.patch('os.remove')
-        @mock.patch('matplotlib.pyplot.savefig')
+        @mock.patch('matplotlib.figure.Figure.savefig')
         @mock.patch('shutil.rmtree')
         @mock.patch('random.random', return_value=random)
         def closure(mock_random, mock_rm_tree, mock_savefig, mock_remove, mock_makedirs, mock_exists,
-                    mock_api, mock_open, mock_flask, mock_load, mock_oswalk, mock_dump, *args, **kwargs):
+                    mock_api, mock_open, mock_flask, mock_load, mock_oswalk, mock_dump, mock_log_append,
+                    mock_log_read, mock_log_tail, mock_history_append, mock_history_read, *args, **kwargs):
             # mock exists
             mock_exists.return_value = True
 
@@ -135,6 +164,7 @@ def with_request(
             mock1.messages.get.return_value = message_mock
 
             mock_api.return_value = mock1
+            spark.reset()
 
             return func(*args, **kwargs)
         return closure
@@ -156,15 +186,14 @@ def unit_test(func):
     config.SETTINGS_FILE = config.DATA_FOLDER + '/settings.json'
 
     @wraps(func)
-    @mock.patch('endpoints.CiscoSparkAPI')
+    @mock.patch('queuebot.spark.CiscoSparkAPI')
     @mock.patch('random.random')
     def mock_all(mock_random, mock_api, *args, **kwargs):
 
         from queuebot import Bot
-        import endpoints
 
-        TOKEN = config.QUEUE_BOT if config.PRODUCTION else config.DEV_QUEUE_BOT
-        BOT = Bot(endpoints.CiscoSparkAPI(TOKEN), {
+        spark.reset()
+        BOT = Bot(spark.get_api(), {
             'roomId': 'UNIT_TEST_ROOMID'
         })
         BOT.initialize_data(project='UNIT_TEST_PROJECT', subproject='UNIT_TEST_SUBPROJECT')
@@ -0,0 +1,94 @@
+import collections
+import os
+import threading
+import time
+
+from app import logger, WEBHOOK_DEDUP_WINDOW, WEBHOOK_DEDUP_SIZE, WEBHOOK_DEDUP_FILE
+
+
+class WebhookDeduplicator:
+    """
+    Remembers the message ids of recent webhooks so redeliveries from Spark are only handled once.
+
+    Ids are kept for WEBHOOK_DEDUP_WINDOW seconds, and at most WEBHOOK_DEDUP_SIZE of them (oldest forgotten first).
+    If WEBHOOK_DEDUP_FILE is set every new id is also appended to that file, which is read back on start up so a
+    restart does not reprocess redeliveries. Forgotten ids are appended with '-' in place of the time they were seen.
+    The file is rewritten with only the live ids once it holds twice as many lines as there are live ids.
+    """
+    def __init__(self, window=None, size=None, file=None):
+        self._window = window or WEBHOOK_DEDUP_WINDOW
+        self._size = size or WEBHOOK_DEDUP_SIZE
+        self._file = file or WEBHOOK_DEDUP_FILE
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._lines = 0
+        self.checks = 0
+        self.hits = 0
+
+        if self._file and os.path.exists(self._file):
+            with open(self._file, 'r') as file:
+                for line in file:
+                    id, _, seen = line.strip().rpartition(' ')
+                    if id and seen == '-':
+                        self._seen.pop(id, None)
+                        self._lines += 1
+                    elif id:
+                        self._seen[id] = float(seen)
+                        self._seen.move_to_end(id)
+                        self._lines += 1
+            self._expire(time.time())
+
+    def is_duplicate(self, id):
+        """
+        Returns True if id was already seen within the window, otherwise records it and returns False
+        """
+        if id is None:
+            return False
+
+        now = time.time()
+        with self._lock:
+            self.checks += 1
+            self._expire(now)
+            if id in self._seen:
+                self.hits += 1
+                logger.info("Ignoring redelivered message '" + str(id) + "'")
+                return True
+
+            self._seen[id] = now
+            if len(self._seen) > self._size:
+                self._seen.popitem(last=False)
+            self._persist(id, repr(now))
+            return False
+
+    def forget(self, id):
+        """
+        Forgets id, so a redelivery of a webhook that couldn't be handled isn't taken for a duplicate
+        """
+        if id is None:
+            return
+
+        with self._lock:
+            if self._seen.pop(id, None) is not None:
+                self._persist(id, '-')
+
+    def statistics(self):
+        with self._lock:
+            return {'checks': self.checks, 'hits': self.hits, 'remembered': len(self._seen)}
+
+    def _expire(self, now):
+        while self._seen and next(iter(self._seen.values())) <= now - self._window:
+            self._seen.popitem(last=False)
+
+    def _persist(self, id, seen):
+        if not self._file:
+            return
+
+        if self._lines >= 2 * max(len(self._seen), 1):
+            with open(self._file + '.tmp', 'w') as file:
+                file.writelines(str(k) + ' ' + repr(v) + '\n' for k, v in self._seen.items())
+            os.replace(self._file + '.tmp', self._file)
+            self._lines = len(self._seen)
+        else:
+            with open(self._file, 'a') as file:
+                file.write(str(id) + ' ' + seen + '\n')
+            self._lines += 1
@@ -0,0 +1,219 @@
+import collections
+import io
+import mimetypes
+import threading
+import time
+import traceback
+import weakref
+
+from app import logger, OUTBOUND_BACKGROUND, OUTBOUND_COALESCE_SECONDS, OUTBOUND_MAX_MARKDOWN, OUTBOUND_MAX_RETRIES
+from ciscosparkapi import SparkApiError
+from requests_toolbelt import MultipartEncoder
+
+# Longest pause after a rate limit, whatever Retry-After Spark gives
+MAX_BACKOFF = 60
+
+_dispatchers = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_dispatcher(api):
+    """
+    Returns the process wide outbound message dispatcher for api
+    """
+    if api not in _dispatchers:
+        with _lock:
+            if api not in _dispatchers:
+                _dispatchers[api] = MessageDispatcher(api)
+    return _dispatchers[api]
+
+
+class MessageDispatcher:
+    """
+    Sends messages to Spark from a background thread.
+
+    Messages are queued per room. Markdown messages wait up to OUTBOUND_COALESCE_SECONDS so that consecutive ones for
+    the same room can be posted as one message (of at most OUTBOUND_MAX_MARKDOWN characters). Messages with files are
+    sent as soon as everything before them in the room has been sent, and send only returns once they have been
+    posted, since the caller deletes the file afterwards, or raises if they weren't posted within send_timeout seconds
+    (by default long enough for the message before it and its own to use every retry). A 429 from Spark pauses all
+    sending for the Retry-After seconds it gives, or an exponential backoff if it gives none or a date, for up to
+    OUTBOUND_MAX_RETRIES attempts and at most MAX_BACKOFF seconds each. Files are paths, URLs or (filename, bytes)
+    tuples for files that are only in memory.
+
+    With OUTBOUND_BACKGROUND = False every message is posted immediately by send.
+    """
+    def __init__(self, api, window=None, background=None, send_timeout=None):
+        self._api = api
+        self._window = OUTBOUND_COALESCE_SECONDS if window is None else window
+        self._send_timeout = send_timeout or self._window + 2 * (OUTBOUND_MAX_RETRIES + 1) * MAX_BACKOFF
+        self._background = OUTBOUND_BACKGROUND if background is None else background
+        self._rooms = collections.OrderedDict()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._sending = False
+        self._flushing = 0
+        self.queued = 0
+        self.posted = 0
+        self.rate_limited = 0
+        self.failed = 0
+
+    def send(self, roomId, markdown=None, files=None):
+        if not self._background:
+            self._post(roomId, markdown=markdown, files=files)
+            return
+
+        message = {
+            'markdown': markdown,
+            'files': files,
+            'queued': time.time(),
+            'sent': threading.Event() if files else None,
+            'error': None
+        }
+        with self._condition:
+            self._rooms.setdefault(roomId, collections.deque()).append(message)
+            self.queued += 1
+            if not self._thread:
+                self._thread = threading.Thread(target=self._work, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+        if files:
+            if not message['sent'].wait(self._send_timeout):
+                logger.error("Gave up waiting for a file to be sent to room '" + roomId + "' after " +
+                             str(self._send_timeout) + ' seconds')
+                raise TimeoutError('File not sent to room ' + roomId)
+            if message['error']:
+                raise message['error']
+
+    def flush(self, timeout=None):
+        """
+        Waits until every queued message has been sent or timeout seconds have passed
+        """
+        end = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            self._flushing += 1
+            self._condition.notify_all()
+            try:
+                while (self._rooms or self._sending) and (end is None or time.time() < end):
+                    self._condition.wait(0.05)
+            finally:
+                self._flushing -= 1
+
+    def statistics(self):
+        with self._condition:
+            return {
+                'pending': sum(len(i) for i in self._rooms.values()),
+                'queued': self.queued,
+                'posted': self.posted,
+                'rateLimited': self.rate_limited,
+                'failed': self.failed
+            }
+
+    def _work(self):
+        while True:
+            with self._condition:
+                roomId, batch = self._next_batch()
+                self._sending = True
+            try:
+                self._deliver(roomId, batch)
+            except Exception as e:
+                # Keep the thread going for the rest of the queue, and don't leave anyone waiting on this batch
+                self.failed += 1
+                logger.error("Failed to send message to room '" + roomId + "'\n" + traceback.format_exc())
+                for message in batch:
+                    message['error'] = message['error'] or e
+                    if message['sent']:
+                        message['sent'].set()
+            finally:
+                with self._condition:
+                    self._sending = False
+                    self._condition.notify_all()
+
+    def _next_batch(self):
+        """
+        Waits for a room with a message that is due and takes it, along with the markdown messages that follow it
+        """
+        while True:
+            now = time.time()
+            wait = None
+            for roomId, messages in self._rooms.items():
+                # A message with files is waited on, so don't hold back anything queued before it
+                due = messages[0]['queued'] + self._window
+                if due <= now or self._flushing or any(i['files'] for i in messages):
+                    return roomId, self._take(roomId)
+                wait = due - now if wait is None else min(wait, due - now)
+            self._condition.wait(wait)
+
+    def _take(self, roomId):
+        messages = self._rooms[roomId]
+        batch = [messages.popleft()]
+        if not batch[0]['files']:
+            length = len(batch[0]['markdown'] or '')
+            while messages and not messages[0]['files'] and \
+                    length + len(messages[0]['markdown'] or '') + 2 <= OUTBOUND_MAX_MARKDOWN:
+                length += len(messages[0]['markdown'] or '') + 2
+                batch.append(messages.popleft())
+        if not messages:
+            del self._rooms[roomId]
+        return batch
+
+    def _deliver(self, roomId, batch):
+        if len(batch) > 1:
+            markdown = '\n\n'.join(i['markdown'] for i in batch if i['markdown'])
+            logger.debug('Combined ' + str(len(batch)) + " messages to room '" + roomId + "'")
+        else:
+            markdown = batch[0]['markdown']
+
+        error = None
+        for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+            try:
+                self._post(roomId, markdown=markdown, files=batch[0]['files'])
+                error = None
+                break
+            except SparkApiError as e:
+                error = e
+                if getattr(e.response, 'status_code', None) != 429 or attempt == OUTBOUND_MAX_RETRIES:
+                    break
+                self.rate_limited += 1
+                delay = min(2 ** attempt, MAX_BACKOFF)
+                try:
+                    # Retry-After may also be an HTTP date, which falls back to the backoff
+                    delay = min(float(e.response.headers['Retry-After']), MAX_BACKOFF)
+                except (KeyError, TypeError, ValueError):
+                    pass
+                logger.warning('Rate limited by Spark, retrying in ' + str(delay) + ' seconds')
+                time.sleep(delay)
+            except Exception as e:
+                error = e
+                break
+
+        if error is not None:
+            self.failed += 1
+            logger.error("Failed to send message to room '" + roomId + "'\n" + ''.join(
+                traceback.format_exception(type(error), error, error.__traceback__)))
+        for message in batch:
+            message['error'] = error
+            if message['sent']:
+                message['sent'].set()
+
+    def _post(self, roomId, markdown=None, files=None):
+        kwargs = {'roomId': roomId}
+        if markdown is not None:
+            kwargs['markdown'] = markdown
+        if files is not None and not isinstance(files[0], str):
+            self._upload(kwargs, *files[0])
+        else:
+            if files is not None:
+                kwargs['files'] = files
+            self._api.messages.create(**kwargs)
+        self.posted += 1
+
+    def _upload(self, fields, filename, data):
+        # ciscosparkapi 0.7.1 only uploads files from disk, so in memory files are posted through its session
+        encoder = MultipartEncoder(dict(fields, files=(
+            filename,
+            io.BytesIO(data),
+            mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )))
+        self._api._session.post('messages', data=encoder, headers={'Content-type': encoder.content_type})
@@ -3,4 +3,10 @@ from enum import Enum
 class COMMAND(Enum):
     NONE = 0
     ADD = 1
-    REMOVE = 2
\ No newline at end of file
+    REMOVE = 2
+
+class TIER(Enum):
+    NONE = 0
+    USER = 1
+    ADMIN = 2
+    GLOBAL_ADMIN = 3
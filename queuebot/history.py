@@ -0,0 +1,255 @@
+import array
+import datetime
+import difflib
+import json
+import os
+
+COLUMNS = ['times', 'depths', 'flush_times']
+ROLLUP_COLUMNS = ['starts', 'counts', 'depth_sums', 'depth_mins', 'depth_maxes', 'flush_sums', 'flush_mins',
+                  'flush_maxes']
+
+# The sizes of the column and diffs files of each log after it was last appended to, so the next append only checks
+# them for partially written records when they have changed since
+_appended_sizes = {}
+
+
+def diff_queues(old, new):
+    """
+    Returns the changes that turn queue old into queue new, as a list of [start, end, members] meaning old[start:end]
+    is replaced by members
+    """
+    matcher = difflib.SequenceMatcher(
+        a=[json.dumps(i, sort_keys=True) for i in old],
+        b=[json.dumps(i, sort_keys=True) for i in new],
+        autojunk=False
+    )
+    return [[i1, i2, new[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def apply_diff(queue, diff):
+    queue = list(queue)
+    # Later ranges are applied first so the earlier indexes still hold
+    for start, end, members in reversed(diff):
+        queue[start:end] = members
+    return queue
+
+
+def hour_start(time):
+    return datetime.datetime.fromtimestamp(time).replace(minute=0, second=0, microsecond=0).timestamp()
+
+
+def day_start(time):
+    return datetime.datetime.fromtimestamp(time).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+class Rollup:
+    """
+    Summaries of history records by hour or by day, held as columns: the start of each period in epoch seconds, the
+    number of records in it, and the sum, min and max of their depths and flush times.
+    """
+    def __init__(self, **columns):
+        for column in ROLLUP_COLUMNS:
+            setattr(self, column, columns.get(column, array.array('d')))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, depth, flush_time):
+        self.add_summary(start, 1, depth, depth, depth, flush_time, flush_time, flush_time)
+
+    def add_summary(self, start, count, depth_sum, depth_min, depth_max, flush_sum, flush_min, flush_max):
+        # Periods are added in order, so only the last one can be the same period
+        if self.starts and self.starts[-1] == start:
+            self.counts[-1] += count
+            self.depth_sums[-1] += depth_sum
+            self.depth_mins[-1] = min(self.depth_mins[-1], depth_min)
+            self.depth_maxes[-1] = max(self.depth_maxes[-1], depth_max)
+            self.flush_sums[-1] += flush_sum
+            self.flush_mins[-1] = min(self.flush_mins[-1], flush_min)
+            self.flush_maxes[-1] = max(self.flush_maxes[-1], flush_max)
+        else:
+            for column, value in zip(ROLLUP_COLUMNS, [start, count, depth_sum, depth_min, depth_max, flush_sum,
+                                                      flush_min, flush_max]):
+                getattr(self, column).append(value)
+
+    def summaries(self):
+        return zip(*[getattr(self, column) for column in ROLLUP_COLUMNS])
+
+    def copy(self):
+        return Rollup(**{column: array.array('d', getattr(self, column)) for column in ROLLUP_COLUMNS})
+
+
+class History:
+    """
+    The queue history of a subproject, one record per change to the queue, held as columns.
+
+    times are epoch seconds, depths and flush_times are the queue depth and estimated flush time after the change, and
+    diffs are the changes to the queue (see diff_queues) so full snapshots can be rebuilt without storing each one.
+    Records older than the retention period are replaced by the hourly and daily Rollups by compact().
+    """
+    def __init__(self, times=None, depths=None, flush_times=None, diffs=None, hourly=None, daily=None):
+        self.times = times if times is not None else array.array('d')
+        self.depths = depths if depths is not None else array.array('d')
+        self.flush_times = flush_times if flush_times is not None else array.array('d')
+        self.diffs = diffs if diffs is not None else []
+        self.hourly = hourly if hourly is not None else Rollup()
+        self.daily = daily if daily is not None else Rollup()
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, time, depth, flush_time, diff):
+        self.times.append(time)
+        self.depths.append(depth)
+        self.flush_times.append(flush_time)
+        self.diffs.append(diff)
+
+    def extend(self, records):
+        for record in records:
+            self.append(*record)
+
+    def records(self):
+        return zip(self.times, self.depths, self.flush_times, self.diffs)
+
+    def snapshots(self):
+        """
+        Yields (time, queue) for every record, rebuilding each queue from the diffs
+        """
+        queue = []
+        for time, diff in zip(self.times, self.diffs):
+            queue = apply_diff(queue, diff)
+            yield time, queue
+
+    def compact(self, before):
+        """
+        Returns a copy of the history with the records from before the epoch time before summarised into the hourly
+        and daily rollups. The first record kept holds its whole queue, as the records it was a diff against are gone.
+        """
+        compacted = History(hourly=self.hourly.copy(), daily=self.daily.copy())
+        queue = []
+        for time, depth, flush_time, diff in self.records():
+            queue = apply_diff(queue, diff)
+            if time < before:
+                compacted.hourly.add(hour_start(time), depth, flush_time)
+                compacted.daily.add(day_start(time), depth, flush_time)
+            else:
+                compacted.append(time, depth, flush_time, diff if len(compacted) else diff_queues([], queue))
+        return compacted
+
+
+class HistoryLog:
+    """
+    Append only storage for a History, used by the JSON engine.
+
+    Each column is a file of native doubles ('<file>.times', '<file>.depths' and '<file>.flush_times') and the diffs
+    are one JSON list per line in '<file>.diffs'. Columns are appended one after the other, so after a crash they may
+    have different lengths; only the records present in every column are read, and every file is cut back to those
+    before more are appended. The rollups are in '<file>.hourly' and
+    '<file>.daily', one row of doubles per period, and are only written by replace().
+    """
+    def __init__(self, file):
+        self._file = file
+
+    def append(self, records):
+        if not records:
+            return
+
+        os.makedirs(os.path.dirname(os.path.realpath(self._file)), exist_ok=True)
+        self._recover()
+        self._truncate()
+        for index, column in enumerate(COLUMNS):
+            with open(self._file + '.' + column, 'ab') as f:
+                array.array('d', [i[index] for i in records]).tofile(f)
+        with open(self._file + '.diffs', 'a') as f:
+            f.write(''.join(json.dumps(i[3], separators=(',', ':')) + '\n' for i in records))
+        _appended_sizes[self._file] = self._sizes()
+
+    def read(self):
+        self._recover()
+        columns = {}
+        for column in COLUMNS:
+            columns[column] = array.array('d')
+            if os.path.exists(self._file + '.' + column):
+                with open(self._file + '.' + column, 'rb') as f:
+                    data = f.read()
+                columns[column].frombytes(data[:len(data) - len(data) % columns[column].itemsize])
+
+        diffs = []
+        if os.path.exists(self._file + '.diffs'):
+            with open(self._file + '.diffs', 'r') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        # Partially written last line
+                        break
+                    diffs.append(json.loads(line))
+
+        length = min([len(i) for i in columns.values()] + [len(diffs)])
+        return History(diffs=diffs[:length], hourly=self._read_rollup('hourly'), daily=self._read_rollup('daily'),
+                       **{k: v[:length] for k, v in columns.items()})
+
+    def replace(self, history):
+        """
+        Rewrites the whole log with history. Every file is written next to the one it replaces before any of them is
+        moved into place, and the moves are finished by the next HistoryLog if they are interrupted.
+        """
+        os.makedirs(os.path.dirname(os.path.realpath(self._file)), exist_ok=True)
+        for column in COLUMNS:
+            with open(self._file + '.' + column + '.tmp', 'wb') as f:
+                getattr(history, column).tofile(f)
+        with open(self._file + '.diffs.tmp', 'w') as f:
+            f.write(''.join(json.dumps(i, separators=(',', ':')) + '\n' for i in history.diffs))
+        for unit in ['hourly', 'daily']:
+            rollup = getattr(history, unit)
+            with open(self._file + '.' + unit + '.tmp', 'wb') as f:
+                array.array('d', [value for summary in rollup.summaries() for value in summary]).tofile(f)
+
+        with open(self._file + '.replacing', 'w'):
+            pass
+        self._recover()
+
+    def _read_rollup(self, unit):
+        values = array.array('d')
+        if os.path.exists(self._file + '.' + unit):
+            with open(self._file + '.' + unit, 'rb') as f:
+                data = f.read()
+            row = len(ROLLUP_COLUMNS) * values.itemsize
+            values.frombytes(data[:len(data) - len(data) % row])
+        return Rollup(**{column: values[index::len(ROLLUP_COLUMNS)] for index, column in enumerate(ROLLUP_COLUMNS)})
+
+    def _sizes(self):
+        paths = [self._file + '.' + name for name in COLUMNS + ['diffs']]
+        return [os.path.getsize(i) if os.path.exists(i) else 0 for i in paths]
+
+    def _truncate(self):
+        # Cuts every column and the diffs back to the records complete in all of them, so appended records line up
+        # with each other and don't continue a partially written line
+        sizes = self._sizes()
+        if _appended_sizes.get(self._file) == sizes:
+            return
+
+        itemsize = array.array('d').itemsize
+        ends = [0]
+        if os.path.exists(self._file + '.diffs'):
+            with open(self._file + '.diffs', 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    ends.append(ends[-1] + len(line))
+
+        length = min([size // itemsize for size in sizes[:len(COLUMNS)]] + [len(ends) - 1])
+        for name, size in zip(COLUMNS + ['diffs'], [length * itemsize] * len(COLUMNS) + [ends[length]]):
+            if os.path.exists(self._file + '.' + name):
+                os.truncate(self._file + '.' + name, size)
+
+    def _recover(self):
+        # '.replacing' is only created once every '.tmp' file is complete, without it any '.tmp' files are from an
+        # interrupted replace() and are overwritten by the next one
+        if not os.path.exists(self._file + '.replacing'):
+            return
+        for name in COLUMNS + ['diffs', 'hourly', 'daily']:
+            try:
+                os.replace(self._file + '.' + name + '.tmp', self._file + '.' + name)
+            except FileNotFoundError:
+                # Moved before the replace was interrupted
+                pass
+        os.remove(self._file + '.replacing')
@@ -1,9 +1,10 @@
-import json
 import os
 import pprint
 
 from app import logger
 from config import PEOPLE_FILE
+from queuebot.spark import get_person
+from queuebot.storage import get_storage
 
 
 class PeopleManager:
@@ -12,39 +13,60 @@ class PeopleManager:
         self._file = PEOPLE_FILE.format(project, '{}')
         self._project = project
         self._subproject = subproject
+        self._storage = get_storage()
         self._people = {}
+        self._by_email = {}
+        self._by_display_name = {}
+        self._indexed = 0
 
         os.makedirs(os.path.dirname(os.path.dirname(os.path.realpath(self._file))), exist_ok=True)
 
-    def get_people(self):
+    def _load(self):
+        people = self._storage.get_people(self._project, self._subproject)
+        # Rebuild the secondary indexes when the storage hands back a different (or externally extended) dict
+        if people is not self._people or len(people) != self._indexed:
+            self._people = people
+            self._indexed = len(people)
+            self._by_email = {}
+            self._by_display_name = {}
+            for person in self._people.values():
+                self._index(person)
+        return self._people
 
-        if not os.path.exists(self._file.format(self._subproject)):
-            self._people = []
-        else:
-            self._people = json.load(open(self._file.format(self._subproject), 'r'))
+    def _index(self, person):
+        if person.get('email'):
+            self._by_email.setdefault(person['email'].lower(), []).append(person['sparkId'])
+        if person.get('displayName'):
+            self._by_display_name.setdefault(person['displayName'].lower(), []).append(person['sparkId'])
 
-        return self._people
+    def get_people(self):
+        return list(self._load().values())
 
     def get_person(self, id):
-        for person in self.get_people():
-            if id == person['sparkId']:
-                return person
-        else:
-            return {}
+        return self._load().get(id, {})
+
+    def find_person(self, name):
+        """
+        Returns the person whose email or display name is name (case-insensitive) if exactly one person matches
+        """
+        self._load()
+        matches = self._by_email.get(name.lower().strip(), []) or self._by_display_name.get(name.lower().strip(), [])
+        return self._people[matches[0]] if len(set(matches)) == 1 else {}
 
-    def _save(self):
-        json.dump(self._people, open(self._file.format(self._subproject), 'w'), indent=4, separators=(',', ': '))
+    def _save(self, person):
+        self._storage.save_person(self._project, self._subproject, person)
 
     def update_person(self, id, **kwargs):
         person = self.get_person(id=id)
-        for key, value in kwargs.items():
-            person[key] = value
-        self._save()
+        if person:
+            for key, value in kwargs.items():
+                person[key] = value
+            self._save(person)
 
     def add_person(self, data):
         person = self.get_person(id=data['personId'])
         if not person:
-            api_person = self._api.people.get(data['personId'])
+            api_person = get_person(self._api, data['personId'])
             logger.debug("Adding person '" + data['personId'] + "'")
 
             person = {
@@ -63,8 +85,10 @@ class PeopleManager:
                 'added_to_queue': [],
                 'removed_from_queue': []
             }
-            self._people.append(person)
-            self._save()
+            self._people[person['sparkId']] = person
+            self._index(person)
+            self._indexed += 1
+            self._save(person)
             return person
         else:
             logger.info("Person '" + data['personId'] + "' not added because they already exist")
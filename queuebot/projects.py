@@ -1,15 +1,103 @@
+import collections
 import json
 import os
 import pprint
 import re
 import shutil
+import threading
 
+from dateutil import parser
 from app import logger, DEFAULT_SUBPROJECT
 from config import PROJECT_CONFIG, DATA_FOLDER, SUBPROJECT_FOLDER, SETTINGS_FILE
 from queuebot.commands import CommandManager
 from queuebot.people import PeopleManager
 from queuebot.queue import Queue
 from queuebot.admins import AdminManager
+from queuebot.storage import get_storage
+
+_index = None
+_index_lock = threading.Lock()
+_project_locks = collections.defaultdict(threading.Lock)
+_project_locks_lock = threading.Lock()
+
+
+def get_project_index(file):
+    """
+    Returns the process wide ProjectIndex for file, only reading the file again when it has changed on disk
+    """
+    global _index
+    stamp = _get_stamp(file)
+    with _index_lock:
+        if _index is None or _index.file != file or stamp is None or _index.stamp != stamp:
+            _index = ProjectIndex(file, json.load(open(file, 'r')), stamp)
+        return _index
+
+
+def get_room_project(roomId):
+    """
+    Returns the project roomId is registered to, or None
+    """
+    if not roomId or not os.path.exists(PROJECT_CONFIG):
+        return None
+    return get_project_index(PROJECT_CONFIG).rooms.get(roomId)
+
+
+def get_project_lock(project):
+    """
+    Returns the process wide lock for project, held while a request reads and writes the project's data
+    """
+    with _project_locks_lock:
+        return _project_locks[project]
+
+
+def _get_stamp(file):
+    try:
+        stat = os.stat(file)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+class ProjectIndex:
+    """
+    The project config (a list of [project, room] pairs, room being None for a project without rooms) indexed both
+    ways: room -> project and project -> rooms. Registration and deletion update the indexes along with the list.
+    """
+    def __init__(self, file, config, stamp=None):
+        self.file = file
+        self.stamp = stamp
+        self.config = [tuple(i) for i in config]
+        self._rebuild()
+
+    def _rebuild(self):
+        # Built aside and swapped in so other threads never see a half built index
+        rooms = {}
+        projects = collections.OrderedDict()
+        for project, room in self.config:
+            projects.setdefault(project, []).append(room)
+            if room is not None:
+                # A room registered twice belongs to the first project, as it did with a linear scan
+                rooms.setdefault(room, project)
+        self.rooms, self.projects = rooms, projects
+
+    def add_project(self, project):
+        self.config = self.config + [tuple([project, None])]
+        self._rebuild()
+
+    def register(self, project, roomId):
+        # Unregister from any previous project
+        self.config = [i for i in self.config if i[1] != roomId and i != tuple([project, None])]
+        self.config.append(tuple([project, roomId]))
+        self._rebuild()
+
+    def remove_project(self, project):
+        self.config = [i for i in self.config if i[0] != project]
+        self._rebuild()
+
+    def save(self):
+        logger.debug(pprint.pformat(self.config))
+        json.dump(self.config, open(self.file, 'w'), indent=4, separators=(',', ': '))
+        self.stamp = _get_stamp(self.file)
 
 
 class ProjectManager:
@@ -18,51 +106,39 @@ class ProjectManager:
         self._file = PROJECT_CONFIG
         self._subproject_folder = SUBPROJECT_FOLDER
         self._roomId = roomId
+        self._storage = get_storage()
         # self._people = people_manager
 
         if not os.path.exists(self._file):
-            self._project_config = {}
-            self._save()
+            with _index_lock:
+                self._index = ProjectIndex(self._file, [])
+                self._save()
         else:
-            self._project_config = json.load(open(self._file, 'r'))
+            self._index = get_project_index(self._file)
 
         self._project = self.get_project(roomId)
-        self._settings_file = SETTINGS_FILE.format(self.get_project())
-
-        if os.path.exists(self._settings_file):
-            self._settings = json.load(open(self._settings_file, 'r'))
-        else:
-            self._settings = {}
+        self._settings = self._storage.get_settings(self.get_project())
 
     def get_project(self, roomId=None):
-        if not os.path.exists(self._file):
-            return None
-        elif not roomId:
+        if not roomId:
             return getattr(self, '_project', None)
         else:
-            for project, room in self._project_config:
-                if roomId == room:
-                    return project
-            else:
-                return None
+            return self._index.rooms.get(roomId)
 
     def get_projects(self):
-        return set([i[0] for i in self._project_config])
+        return set(self._index.projects)
 
     def get_rooms(self, projectid=None):
-        if not os.path.exists(self._file):
-            return None
-        elif not projectid:
+        if not projectid:
             return None
         else:
-            rooms = []
-            for project, room in self._project_config:
-                if projectid.upper() == project:
-                    rooms.append(room)
-            return rooms
+            return list(self._index.projects.get(projectid.upper(), []))
 
     def get_subprojects(self, project=None):
-
+        """
+        Returns the sorted subprojects of project (the current project by default) from the catalog in its settings.
+        Projects created before the catalog existed fall back to scanning their data folder until it is repaired
+        """
         if not project and getattr(self, '_subprojects', None):
             return self._subprojects
         elif not project:
@@ -70,23 +146,59 @@ class ProjectManager:
         else:
             target_project = project
 
+        subprojects = self._get_settings(target_project).get('subprojects')
+        if subprojects is None:
+            logger.debug("No subproject catalog for '" + str(target_project) + "', scanning its data folder")
+            subprojects = self.scan_subprojects(target_project)
+        else:
+            subprojects = sorted(subprojects)
+
+        if not project:
+            self._subprojects = subprojects
+
+        return subprojects
+
+    def scan_subprojects(self, project):
+        """
+        Returns the subprojects of project found by walking the data folder. This is slow on network storage, so it is
+        only used to build or repair the subproject catalog
+        """
         subprojects = set()
 
         for parent, folders, files in os.walk(os.path.dirname(os.path.dirname(os.path.realpath(self._subproject_folder)))):
-            for project in folders:
-                if project == target_project:
-                    subprojects = sorted(set([x[1] for x in os.walk(os.path.join(parent, project))][0]))
+            for folder in folders:
+                if folder == project:
+                    subprojects = sorted(set([x[1] for x in os.walk(os.path.join(parent, folder))][0]))
                     break
             break
 
-        if not project:
-            self._subprojects = subprojects
-
         return subprojects
 
+    def repair_subprojects(self, project):
+        """
+        Rewrites the subproject catalog of project from its data folder and returns (added, removed)
+        """
+        settings = self._get_settings(project)
+        catalog = set(settings.get('subprojects') or [])
+        scanned = set(self.scan_subprojects(project))
+
+        settings['subprojects'] = sorted(scanned)
+        self._storage.save_settings(project, settings)
+        return sorted(scanned - catalog), sorted(catalog - scanned)
+
+    def _get_settings(self, project):
+        if project == self.get_project():
+            return self._settings
+        return self._storage.get_settings(project)
+
+    def _set_subprojects(self, subprojects):
+        self._settings['subprojects'] = sorted(subprojects)
+        self._subprojects = self._settings['subprojects']
+        self._save_settings()
+
     @property
     def config(self):
-        return self._project_config
+        return self._index.config
 
     def get_commands(self, project=None, subproject=None):
         if not project and not subproject:
@@ -107,6 +219,26 @@ class ProjectManager:
         else:
             return self._get_managers(project=project, subproject=subproject)['commands'].get_commands()
 
+    def get_last_command_time(self, project):
+        """
+        Returns when the last command was issued on any subproject of project, from the last activity record that is
+        kept up to date as commands are added. Projects without one have their commands read once to create it
+        """
+        last_activity = self._storage.get_last_activity(project)
+        if last_activity is None:
+            last_commands = []
+            for subproject in self.get_subprojects(project=project):
+                people = PeopleManager(self._api, project=project, subproject=subproject)
+                commands = CommandManager(self._api, project=project, subproject=subproject, people_manager=people)
+                last_commands += commands.get_last_commands(1)
+
+            if not last_commands:
+                return None
+            last_activity = str(max([parser.parse(i['timeIssued']) for i in last_commands]))
+            self._storage.save_last_activity(project, last_activity)
+
+        return parser.parse(last_activity)
+
     def _get_managers(self, project, subproject):
         people = PeopleManager(self._api, project=project, subproject=subproject)
         admins = AdminManager(self._api, project=project, people_manager=people)
@@ -123,32 +255,31 @@ class ProjectManager:
     def create_new_project(self, project, roomId):
 
         self._project = project.upper()
-        self._settings_file = SETTINGS_FILE.format(project.upper())
-
-        if os.path.exists(self._settings_file):
-            self._settings = json.load(open(self._settings_file, 'r'))
-        else:
-            self._settings = {}
+        self._settings = self._storage.get_settings(self._project)
 
         if project.upper() in self.get_projects():
             return False
         else:
-            self._project_config.append(tuple([project.upper(), None]))
+            with _index_lock:
+                self._index.add_project(project.upper())
+                self._save()
             self.create_subproject(name=DEFAULT_SUBPROJECT, default=True)
-            self._save()
             return True
 
     def create_subproject(self, name, default=False):
         subproject_name = name.upper()
+        subprojects = set(self.get_subprojects(project=self.get_project()))
         os.makedirs(self._subproject_folder.format(self.get_project(), subproject_name), exist_ok=True)
         if default:
             self._settings['default_subproject'] = subproject_name
-            self._save_settings()
+        self._set_subprojects(subprojects | {subproject_name})
 
     def delete_subproject(self, name):
         subproject_name = name.upper()
         if self._settings['default_subproject'] != subproject_name:
-            shutil.rmtree(self._subproject_folder.format(self.get_project(), subproject_name), ignore_errors=True)
+            subprojects = set(self.get_subprojects(project=self.get_project()))
+            self._storage.delete_subproject(self.get_project(), subproject_name)
+            self._set_subprojects(subprojects - {subproject_name})
             return True
         else:
             return False
@@ -180,21 +311,19 @@ class ProjectManager:
             if self.get_project(roomId) == project.upper():
                 return False, "This bot is already registered to project '" + str(project.upper()) + "'"
             else:
-                # Unregister from any previous project
-                self._project_config = [i for i in self._project_config if i[1] != roomId and
-                                        i != tuple([project.upper(), None])]
-
                 self._project = project.upper()
-                self._project_config.append(tuple([self.get_project(), roomId]))
-                self._save()
+                with _index_lock:
+                    self._index.register(self.get_project(), roomId)
+                    self._save()
                 return True, ''
         else:
             return False, "ERROR: project '" + str(project.upper()) + "' has not been created."
 
     def delete_project(self):
-        self._project_config = [i for i in self._project_config if i[0] != self.get_project()]
-        self._save()
-        shutil.rmtree(DATA_FOLDER.format(self.get_project()), ignore_errors=True)
+        with _index_lock:
+            self._index.remove_project(self.get_project())
+            self._save()
+        self._storage.delete_project(self.get_project())
         self._project = None
 
     # def get_admins(self):
@@ -207,12 +336,13 @@ class ProjectManager:
     #     return id in GLOBAL_ADMINS
 
     def _save(self):
-        logger.debug(pprint.pformat(self._project_config))
-        json.dump(self._project_config, open(self._file, 'w'), indent=4, separators=(',', ': '))
+        global _index
+        self._index.save()
+        _index = self._index
 
     def _save_settings(self):
         logger.debug(pprint.pformat(self._settings))
-        json.dump(self._settings, open(self._settings_file.format(self.get_project()), 'w'))
+        self._storage.save_settings(self.get_project(), self._settings)
 
     # def add_admin(self, id):
     #     logger.debug("Adding admin '" + id + "'")
@@ -1,3 +1,4 @@
+import copy
 import json
 import os
 import datetime
@@ -6,9 +7,15 @@ import statistics
 
 from dateutil import parser
 from collections import defaultdict
-from app import logger, FORMAT_STRING, QUEUE_THRESHOLD, MAX_FLUSH_THRESHOLD
+from app import logger, FORMAT_STRING, QUEUE_THRESHOLD, MAX_FLUSH_THRESHOLD, HISTORY_RETENTION_DAYS
 from config import QUEUE_FILE, PEOPLE_FILE, COMMANDS_FILE, GLOBAL_STATS_FILE
+from queuebot.history import History, diff_queues
 from queuebot.people import PeopleManager
+from queuebot.spark import get_person
+from queuebot.storage import get_storage
+
+# The statistics get_statistic_by_unit can compute, as a regex
+STATISTICS = 'average|max|min|p[0-9]{1,2}'
 
 
 class Queue:
@@ -19,6 +26,7 @@ class Queue:
         self._people = people_manager
         self._project = project
         self._subproject = subproject
+        self._storage = get_storage()
 
         os.makedirs(os.path.dirname(os.path.dirname(os.path.realpath(self._file))), exist_ok=True)
 
@@ -26,14 +34,19 @@ class Queue:
 
     def _save(self):
         logger.debug(pprint.pformat(self._q))
-        json.dump(self._q, open(self._file, 'w'), indent=4, separators=(',', ': '))
+        self._storage.save_queue(self._project, self._subproject, self._q)
         self._update_save_global_stats()
 
     def _update_save_global_stats(self):
-        now = str(datetime.datetime.now())
+        now = datetime.datetime.now()
         queue = self.get_queue()
-        self._global_stats['historicalData']['flush_times'][now] = self.get_estimated_flush_time()
-        self._global_stats['historicalData']['queues'][now] = queue
+        flush_time = self.get_estimated_flush_time()
+        self._storage.append_history(self._project, self._subproject, [
+            (now.timestamp(), len(queue), flush_time, diff_queues(self._global_stats.get('lastSnapshot', []), queue))
+        ])
+        # The queue the next history record is a diff against
+        self._global_stats['lastSnapshot'] = copy.deepcopy(queue)
+        self._global_stats['historyVersion'] = self.get_history_version() + 1
 
         most_active = []
         most_activity = 0
@@ -41,96 +54,89 @@ class Queue:
         quickest_head_time = -1
 
         self._global_stats['mostActiveQueueUsers'] = most_active
-        self._global_stats['historicalData']['mostActiveQueueUsers'][now] = most_active
-
         self._global_stats['quickestAtHeadUsers'] = quickest_at_head
-        self._global_stats['historicalData']['quickestAtHeadUsers'][now] = quickest_at_head
-        self._global_stats['historicalData']['largestQueueDepths'][now] = self._global_stats['largestQueueDepth']
-        self._global_stats['historicalData']['largestQueueDepthTimes'][now] = self._global_stats['largestQueueDepthTime']
+        # Hour and day statistics kept before they were computed from the history
+        for key in ['aggregates', 'queueDepth', 'flushTime']:
+            self._global_stats.pop(key, None)
 
         q_depth = -1
         q_depth_time = None
-        self._global_stats['queueDepth'] = defaultdict(dict)
-        self._global_stats['queueDepth']['hour'] = defaultdict(list)
-        self._global_stats['queueDepth']['day'] = defaultdict(list)
-
-        for time, queue in self._global_stats['historicalData']['queues'].items():
-            self._global_stats['queueDepth']['hour'][str(parser.parse(time).hour)].append(len(queue))
-            self._global_stats['queueDepth']['day'][str(parser.parse(time).weekday())].append(len(queue))
-
-        self._global_stats['flushTime'] = defaultdict(dict)
-        self._global_stats['flushTime']['hour'] = defaultdict(list)
-        self._global_stats['flushTime']['day'] = defaultdict(list)
-
-        for time, flush_time in self._global_stats['historicalData']['flush_times'].items():
-            self._global_stats['flushTime']['hour'][str(parser.parse(time).hour)].append(flush_time)
-            self._global_stats['flushTime']['day'][str(parser.parse(time).weekday())].append(flush_time)
-
-        previous_average_hour = -1
-        previous_average_day = -1
-
-        for i in range(7):
-            if str(i) not in self._global_stats['queueDepth']['day']:
-                if any([self._global_stats['queueDepth']['day'][str(j)] for j in range(i + 1, 7)]):
-                    self._global_stats['queueDepth']['day'][str(i)] = previous_average_day if previous_average_day != -1 else 0
-                else:
-                    self._global_stats['queueDepth']['day'][str(i)] = 0
-            else:
-                previous_average_day = self._global_stats['queueDepth']['day'][str(i)]
-
-            if str(i) not in self._global_stats['flushTime']['day']:
-                if any([self._global_stats['flushTime']['day'][str(j)] for j in range(i + 1, 7)]):
-                    self._global_stats['flushTime']['day'][str(i)] = previous_average_day if previous_average_day != -1 else 0
-                else:
-                    self._global_stats['flushTime']['day'][str(i)] = 0
-            else:
-                previous_average_day = self._global_stats['flushTime']['day'][str(i)]
-
-        for i in range(24):
-            if str(i) not in self._global_stats['queueDepth']['hour']:
-                if any([self._global_stats['queueDepth']['hour'][str(j)] for j in range(i + 1, 24)]):
-                    self._global_stats['queueDepth']['hour'][str(i)] = previous_average_hour if previous_average_hour != -1 else 0
-                else:
-                    self._global_stats['queueDepth']['hour'][str(i)] = 0
-            else:
-                previous_average_hour = self._global_stats['queueDepth']['hour'][str(i)]
-
-            if str(i) not in self._global_stats['flushTime']['hour']:
-                if any([self._global_stats['flushTime']['hour'][str(j)] for j in range(i + 1, 24)]):
-                    self._global_stats['flushTime']['hour'][str(i)] = previous_average_hour if previous_average_hour != -1 else 0
-                else:
-                    self._global_stats['flushTime']['hour'][str(i)] = 0
-            else:
-                previous_average_hour = self._global_stats['flushTime']['hour'][str(i)]
 
         self._global_stats['largestQueueDepth'] = q_depth
         self._global_stats['largestQueueDepthHour'] = q_depth_time
 
-        json.dump(self._global_stats, open(self._global_stats_file, 'w'), indent=4, separators=(',', ': '))
+        self._storage.save_global_stats(self._project, self._subproject, self._global_stats)
+
+    def _migrate_history(self):
+        """
+        Moves the snapshots global stats used to keep in 'historicalData' (a full copy of the queue and the flush time
+        for every change, keyed by time) into the history
+        """
+        legacy = self._global_stats.pop('historicalData', None) or {}
+        queues = legacy.get('queues', {})
+        flush_times = legacy.get('flush_times', {})
+
+        history = History()
+        previous = []
+        for time in sorted(set(queues) | set(flush_times)):
+            queue = queues.get(time, previous)
+            history.append(parser.parse(time).timestamp(), len(queue), flush_times.get(time, 0),
+                           diff_queues(previous, queue))
+            previous = queue
+
+        if len(history):
+            logger.debug('Moving ' + str(len(history)) + " historical snapshots of '" + str(self._project) + "' '" +
+                         str(self._subproject) + "' into the history")
+            self._storage.append_history(self._project, self._subproject, list(history.records()))
+            self._global_stats['lastSnapshot'] = previous
+            self._global_stats['historyVersion'] = self.get_history_version() + 1
+            self._storage.save_global_stats(self._project, self._subproject, self._global_stats)
+
+    def get_history(self):
+        """
+        Returns the queue history of the subproject as a History
+        """
+        return self._storage.get_history(self._project, self._subproject)
+
+    def get_history_version(self):
+        """
+        Returns a number that changes whenever the history does
+        """
+        return self._global_stats.get('historyVersion', 0)
+
+    def compact_history(self, retention_days=None, now=None):
+        """
+        Summarises the history older than retention_days (HISTORY_RETENTION_DAYS by default) into the hourly and daily
+        rollups, and returns the number of records that were summarised
+        """
+        retention_days = HISTORY_RETENTION_DAYS if retention_days is None else retention_days
+        now = now or datetime.datetime.now()
+        history = self.get_history()
+        compacted = history.compact((now - datetime.timedelta(days=retention_days)).timestamp())
+
+        if len(compacted) != len(history):
+            self._storage.replace_history(self._project, self._subproject, compacted)
+            if not len(compacted):
+                # Nothing is left for the next record to be a diff against
+                self._global_stats['lastSnapshot'] = []
+            self._global_stats['historyVersion'] = self.get_history_version() + 1
+            self._storage.save_global_stats(self._project, self._subproject, self._global_stats)
+        return len(history) - len(compacted)
 
     def _get_latest_data(self):
-        if not os.path.exists(self._global_stats_file):
+        self._global_stats = self._storage.get_global_stats(self._project, self._subproject)
+        if self._global_stats is None:
             self._global_stats = {
-                'historicalData': {
-                    'queues': {},
-                    'flush_times': {},
-                    'quickestAtHeadUsers': {},
-                    'mostActiveQueueUsers': {},
-                    'largestQueueDepths': {},
-                    'largestQueueDepthTimes': {}
-                },
                 'mostActiveQueueUsers': [],
                 'quickestAtHeadUsers': [],
                 'largestQueueDepth': -1,
                 'largestQueueDepthTime': None,
             }
-        else:
-            self._global_stats = json.load(open(self._global_stats_file, 'r'))
 
-        if not os.path.exists(self._file):
-            self._q = []
-        else:
-            self._q = json.load(open(self._file, 'r'))
+        if 'historicalData' in self._global_stats:
+            self._migrate_history()
+
+        self._q = self._storage.get_queue(self._project, self._subproject)
 
     def get_queue(self):
         self._get_latest_data()
@@ -155,7 +161,7 @@ class Queue:
             return {}
 
     def add_to_queue(self, data):
-        person = self._api.people.get(data['personId'])
+        person = get_person(self._api, data['personId'])
 
         self.get_queue()
         if len(self.get_queue()) == QUEUE_THRESHOLD:
@@ -217,11 +223,12 @@ class Queue:
         if not person['timesInQueue']:
             return 0
         else:
+            times_in_queue = person['timesInQueue']
             if person['currentlyInQueue']:
                 time_enqueued = parser.parse(self.get_queue_member(person['sparkId'])['timeEnqueued'])
-                person['timesInQueue'].append(round((datetime.datetime.now() - time_enqueued).total_seconds()))
+                times_in_queue = times_in_queue + [round((datetime.datetime.now() - time_enqueued).total_seconds())]
 
-            return round(sum(person['timesInQueue']) / len(person['timesInQueue']), 2)
+            return round(sum(times_in_queue) / len(times_in_queue), 2)
 
     def get_average_time_at_queue_head(self, id):
         queue = self.get_queue()
@@ -240,14 +247,14 @@ class Queue:
             return round(sum(times_at_head) / len(person['timesInQueue']), 2)
 
     def get_median_time_at_queue_head(self, id):
-        queue = self.get_queue()
-        person = self._people.get_person(id=id)
+        return self._get_median_time_at_head(self._people.get_person(id=id), self.get_head())
 
-        if not person['timesInQueue']:
+    def _get_median_time_at_head(self, person, head):
+        if not person.get('timesInQueue'):
             return 0
         else:
-            if len(queue) and self.get_head().get('personId') == person['sparkId']:
-                time_at_head = parser.parse(self.get_head()['atHeadTime'])
+            if head.get('personId') == person['sparkId']:
+                time_at_head = parser.parse(head['atHeadTime'])
                 current = max([0, round((datetime.datetime.now() - time_at_head).total_seconds())])
                 times_at_head = person['timesAtHead'] + ([current] if current else [])
             else:
@@ -262,32 +269,48 @@ class Queue:
         person = self._people.get_person(id=id)
         return len(person['added_to_queue']) + len(person['removed_from_queue'])
 
-    def get_estimated_flush_time(self, id=None):
+    def get_estimated_flush_times(self):
+        """
+        Returns the estimated time until each position in the queue has been through the head of the queue.
+        This is the running sum of each member's median time at the head of the queue.
+        """
+        queue = self.get_queue()
+        head = queue[0] if queue else {}
+        medians = {}
+        flush_times = []
+        total = 0
+
+        for member in queue:
+            if member['personId'] not in medians:
+                medians[member['personId']] = self._get_median_time_at_head(self._people.get_person(member['personId']), head)
+            total += medians[member['personId']]
+            flush_times.append(total)
+
+        return flush_times
+
+    def _get_location_in_queue(self, id):
+        for index, member in enumerate(self.get_queue()):
+            if member['personId'] == id:
+                return index
+        else:
+            # Member not in queue
+            raise Exception("Member '" + str(id) + "' not in queue")
+
+    def get_estimated_flush_time(self, id=None, flush_times=None):
+        flush_times = self.get_estimated_flush_times() if flush_times is None else flush_times
         if id:
-            member = self.get_member(id)
-            if member:
-                if self.get_head().get('personId') == id:
-                    return self.get_median_time_at_queue_head(member['personId'])
-                else:
-                    location_in_queue = [i['personId'] for i in self.get_queue()].index(id)
-                    partial_queue = self.get_queue()[:location_in_queue]
-                    return sum(self.get_estimated_flush_time(i['personId']) for i in partial_queue) + \
-                           self.get_median_time_at_queue_head(id)
-            else:
-                # Member not in queue
-                raise Exception("Member '" + str(id) + "' not in queue")
+            return flush_times[self._get_location_in_queue(id)]
         else:
             # Get estimated flush time for full queue
-            if self.get_queue():
-                return self.get_estimated_flush_time(self.get_queue()[-1]['personId'])
-            else:
-                return 0
+            return flush_times[-1] if flush_times else 0
 
-    def get_estimated_wait_time(self, id=None):
+    def get_estimated_wait_time(self, id=None, flush_times=None):
+        flush_times = self.get_estimated_flush_times() if flush_times is None else flush_times
         if id:
-            return max([0, self.get_estimated_flush_time(id=id) - self.get_median_time_at_queue_head(id)])
+            location_in_queue = self._get_location_in_queue(id)
+            return flush_times[location_in_queue - 1] if location_in_queue else 0
         else:
-            return self.get_estimated_flush_time()
+            return flush_times[-1] if flush_times else 0
 
     def get_largest_queue_depth(self):
         if self._global_stats['largestQueueDepth'] != -1:
@@ -298,8 +321,11 @@ class Queue:
     def get_quickest_at_head(self):
         return [self._people.get_person(id=i) for i in self._global_stats['quickestAtHeadUsers']]
 
-    def get_function_attribute_by_unit(self, function, attribute, unit):
-        data = self._global_stats.get(attribute, {}).get(unit, {})
-        for i in data:
-            data[i] = function(i)
-        return data
\ No newline at end of file
+    def get_statistic_by_unit(self, statistic, attribute, unit):
+        """
+        Returns statistic ('average', 'min', 'max' or a percentile such as 'p90') of attribute ('queueDepth' or
+        'flushTime') over the history for each hour of the day or each day of the week (unit 'hour' or 'day')
+        """
+        # NumPy is only imported once statistics are asked for, rather than whenever the bot starts
+        from queuebot.aggregation import HistoryAggregator
+        return HistoryAggregator(self.get_history()).aggregate(statistic, attribute, unit)
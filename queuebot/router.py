@@ -0,0 +1,62 @@
+import re
+
+from queuebot.enum import TIER
+
+
+class CommandRouter:
+    """
+    Matches a message against every command pattern of every privilege tier in a single pass.
+
+    tiers is a list of (tier, {pattern: handler}) in priority order, and both modes reproduce the old per-pattern loop:
+      - strict: the first pattern matching the whole message wins. All patterns are compiled once into one alternation
+        '(pattern)$|(pattern)$|...' and the winning branch is found from the match's lastindex
+      - non-strict: the first pattern found anywhere in the message wins. Each pattern is precompiled along with its
+        literal prefix, and only patterns whose prefix occurs in the message are searched
+    """
+    def __init__(self, tiers):
+        self._routes = {}
+        self._non_strict = []
+        strict = []
+        group = 1
+
+        for tier, commands in tiers:
+            for pattern, handler in commands.items():
+                compiled = re.compile(pattern)
+                self._routes[group] = (group, compiled.groups, tier, handler)
+                self._non_strict.append((self._literal_prefix(pattern), compiled, tier, handler))
+                strict.append('(' + pattern + ')$')
+                group += compiled.groups + 1
+
+        self._strict = re.compile('|'.join(strict))
+
+    @staticmethod
+    def _literal_prefix(pattern):
+        # An alternation outside of any group means there is no prefix shared by every match
+        if '|' in re.sub(r'\([^()]*\)', '', pattern):
+            return ''
+        match = re.match(r'[^\\.^$*+?{}\[\]|()]*', pattern)
+        prefix = match.group(0)
+        # A quantifier applies to the last literal character, which therefore may not appear in the message
+        if prefix and pattern[len(prefix):len(prefix) + 1] in ('?', '*', '{'):
+            prefix = prefix[:-1]
+        return prefix
+
+    def route(self, string, strict=False):
+        """
+        Returns (handler, tier, groups) for the first matching command, or (None, TIER.NONE, ()) if nothing matches
+        """
+        string = string.lower()
+        if strict:
+            match = self._strict.match(string)
+            if match:
+                # lastindex is the outermost group that closed last, which is the wrapper around the winning pattern
+                start, groups, tier, handler = self._routes[match.lastindex]
+                return handler, tier, match.groups()[start:start + groups]
+        else:
+            for prefix, compiled, tier, handler in self._non_strict:
+                if prefix in string:
+                    match = compiled.search(string)
+                    if match:
+                        return handler, tier, match.groups()
+
+        return None, TIER.NONE, ()
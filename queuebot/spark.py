@@ -0,0 +1,155 @@
+import collections
+import threading
+import time
+import weakref
+
+from app import logger, SPARK_BASE_URL, PEOPLE_CACHE_SIZE, PEOPLE_CACHE_TTL, PEOPLE_CACHE_NEGATIVE_TTL
+from ciscosparkapi import CiscoSparkAPI, SparkApiError
+from ciscosparkapi.api.people import Person
+from config import QUEUE_BOT, PRODUCTION
+
+# The Spark API accepts at most this many ids in one 'GET /people?id=...' request
+PREFETCH_BATCH_SIZE = 85
+
+_clients = {}
+_me = weakref.WeakKeyDictionary()
+_directories = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_api(token=None):
+    """
+    Returns the process wide Spark client for token, which defaults to the bot token for this environment.
+
+    The client is created on first use and shared by every request and thread afterwards, so its pooled HTTP session
+    (and the connections in it) are reused instead of being set up again for every webhook
+    """
+    if token is None:
+        if PRODUCTION:
+            token = QUEUE_BOT
+        else:
+            from config import DEV_QUEUE_BOT
+            token = DEV_QUEUE_BOT
+
+    if token not in _clients:
+        with _lock:
+            if token not in _clients:
+                logger.debug('Initializing Spark API')
+                # The dispatcher handles rate limits itself, and ciscosparkapi 0.7.1 fails on them when waiting is on
+                _clients[token] = CiscoSparkAPI(token, base_url=SPARK_BASE_URL, wait_on_rate_limit=False)
+    return _clients[token]
+
+
+def get_me(api, refresh=False):
+    """
+    Returns the Spark person record of the bot that api is authenticated as.
+
+    The record is fetched once per client and kept for the lifetime of the client. Pass refresh=True to fetch it
+    again, e.g. after the bot has been renamed
+    """
+    if refresh or api not in _me:
+        me = api.people.me()
+        with _lock:
+            _me[api] = me
+        logger.debug("Fetched identity of bot '" + str(me.displayName) + "'")
+    return _me[api]
+
+
+def get_person(api, id):
+    """
+    Returns the Spark person record for id through the directory cache shared by every request using api
+    """
+    return _get_directory(api).get(id)
+
+
+def prefetch_people(api, ids):
+    """
+    Loads every id that is not already cached into the directory cache of api with as few requests as possible
+    """
+    _get_directory(api).prefetch(ids)
+
+
+def _get_directory(api):
+    if api not in _directories:
+        with _lock:
+            if api not in _directories:
+                _directories[api] = PeopleDirectory(api)
+    return _directories[api]
+
+
+def reset():
+    """
+    Forgets every shared client, cached identity and cached person record
+    """
+    with _lock:
+        _clients.clear()
+        _me.clear()
+        _directories.clear()
+
+
+class PeopleDirectory:
+    """
+    LRU cache of Spark person records with a time to live.
+
+    At most PEOPLE_CACHE_SIZE records are kept and each one is fetched again PEOPLE_CACHE_TTL seconds after it was
+    stored. Ids Spark does not know are remembered for PEOPLE_CACHE_NEGATIVE_TTL seconds, and asking for them again
+    in that time raises the original error without a round-trip.
+    """
+    def __init__(self, api, size=None, ttl=None, negative_ttl=None):
+        self._api = api
+        self._size = size or PEOPLE_CACHE_SIZE
+        self._ttl = ttl or PEOPLE_CACHE_TTL
+        self._negative_ttl = negative_ttl or PEOPLE_CACHE_NEGATIVE_TTL
+        self._records = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, id):
+        record = self._lookup(id)
+        if record is None:
+            try:
+                person = self._api.people.get(id)
+            except SparkApiError as e:
+                if getattr(e.response, 'status_code', None) == 404:
+                    self._store(id, e, self._negative_ttl)
+                raise
+            self._store(id, person, self._ttl)
+            return person
+        elif isinstance(record, Exception):
+            raise record
+        else:
+            return record
+
+    def prefetch(self, ids):
+        with self._lock:
+            now = time.time()
+            missing = sorted(set(i for i in ids if i not in self._records or self._records[i][1] <= now))
+
+        for start in range(0, len(missing), PREFETCH_BATCH_SIZE):
+            batch = missing[start:start + PREFETCH_BATCH_SIZE]
+            try:
+                # ciscosparkapi 0.7.1 does not expose the id filter of 'GET /people', so go through its session
+                items = self._api._session.get_items('people', params={'id': ','.join(batch)})
+                for item in items:
+                    person = Person(item)
+                    self._store(person.id, person, self._ttl)
+            except SparkApiError:
+                # Leave the batch to be fetched one at a time by get
+                logger.warning('Failed to prefetch ' + str(len(batch)) + ' people')
+
+    def _lookup(self, id):
+        with self._lock:
+            if id in self._records and self._records[id][1] > time.time():
+                self._records.move_to_end(id)
+                self.hits += 1
+                return self._records[id][0]
+            self.misses += 1
+            return None
+
+    def _store(self, id, record, ttl):
+        with self._lock:
+            self._records[id] = (record, time.time() + ttl)
+            self._records.move_to_end(id)
+            while len(self._records) > self._size:
+                self._records.popitem(last=False)
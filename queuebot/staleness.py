@@ -0,0 +1,253 @@
+import datetime
+import heapq
+import json
+import os
+import threading
+import traceback
+
+from app import logger, PROJECT_STALE_SECONDS_FIRST, PROJECT_STALE_SECONDS_SECOND, PROJECT_STALE_SECONDS_FINAL, \
+    PROJECT_STALE_SECONDS, STALE_SWEEP_SECONDS, STALE_WARNINGS_FILE
+from config import WARNINGS_FILE
+from queuebot.commands import on_activity
+from queuebot.dispatcher import get_dispatcher
+from queuebot.projects import ProjectManager
+
+# Warnings in the order they are sent: (seconds without a command, warnings flag, message after the project name)
+WARNINGS = [
+    (PROJECT_STALE_SECONDS_FIRST, 'first', 'hasn\'t been used for a week. '
+                                           'If the project is unused for 2 more weeks, it will be marked for deletion.'),
+    (PROJECT_STALE_SECONDS_SECOND, 'second', 'hasn\'t been used for 2 weeks. '
+                                             'If the project is unused for 1 more week, it will be marked for deletion.'),
+    (PROJECT_STALE_SECONDS_FINAL, 'third', 'hasn\'t been used in 3 weeks. '
+                                           'If the project is unused for 1 more day, it will be marked for deletion'),
+    (PROJECT_STALE_SECONDS, 'final', 'hasn\'t been used in 3 weeks. It is stale and has been marked for deletion'),
+]
+
+
+def _new_warnings():
+    return {'first': False, 'second': False, 'third': False, 'final': False}
+
+
+class WarningStore:
+    """
+    The stale warnings already sent for every project, kept in memory and in a single file.
+
+    The file maps each project with a warning sent to the list of warnings flags that are set; projects without any
+    are left out. It is read once, and rewritten (to a temporary file that then replaces it) only when a project's
+    warnings actually change. Per project WARNINGS_FILEs from older versions are moved into it the first time their
+    project is looked up.
+    """
+    def __init__(self, file=None):
+        self._file = file or STALE_WARNINGS_FILE
+        self._lock = threading.Lock()
+        self._checked = set()
+        self.writes = 0
+
+        if os.path.exists(self._file):
+            with open(self._file) as f:
+                self._warnings = json.load(f)
+        else:
+            self._warnings = {}
+
+    def get(self, project):
+        with self._lock:
+            if project not in self._warnings and project not in self._checked:
+                self._import_legacy(project)
+            self._checked.add(project)
+
+            warnings = _new_warnings()
+            warnings.update((flag, True) for flag in self._warnings.get(project, []))
+            return warnings
+
+    def set(self, project, warnings):
+        flags = sorted(flag for flag, sent in warnings.items() if sent)
+        with self._lock:
+            if flags == self._warnings.get(project, []):
+                return
+            if flags:
+                self._warnings[project] = flags
+            else:
+                self._warnings.pop(project, None)
+            self._flush()
+
+    def forget(self, project):
+        self.set(project, {})
+
+    def _import_legacy(self, project):
+        legacy = WARNINGS_FILE.format(project)
+        if os.path.exists(legacy):
+            with open(legacy) as f:
+                flags = sorted(flag for flag, sent in json.load(f).items() if sent)
+            if flags:
+                self._warnings[project] = flags
+                self._flush()
+            os.remove(legacy)
+            logger.debug("Moved '" + legacy + "' into '" + self._file + "'")
+
+    def _flush(self):
+        os.makedirs(os.path.dirname(os.path.realpath(self._file)), exist_ok=True)
+        with open(self._file + '.tmp', 'w') as f:
+            json.dump(self._warnings, f, sort_keys=True)
+        os.replace(self._file + '.tmp', self._file)
+        self.writes += 1
+
+
+class StalenessScheduler:
+    """
+    Sends the stale project warnings from a background thread.
+
+    Every project with commands has a deadline: the moment it will cross the next warning threshold after its last
+    command. Deadlines are kept in a heap and the thread sleeps until the earliest one, so nothing is read for a project
+    until a warning may be due. Adding a command moves the project's deadline; entries in the heap for an old deadline
+    are skipped when they come up. When a deadline is reached the last command time is read again, so commands handled
+    by other processes are still noticed, and the project is rescheduled rather than warned if it was used since. The
+    time of the latest command recorded in this process is used when it is newer than the one read, as the request that
+    added it may not have saved it yet.
+
+    Every STALE_SWEEP_SECONDS the project list is checked for projects that were created by another process.
+    """
+    def __init__(self, api, sweep_seconds=None, warnings=None):
+        self._api = api
+        self._store = warnings or WarningStore()
+        self._sweep_seconds = STALE_SWEEP_SECONDS if sweep_seconds is None else sweep_seconds
+        self._heap = []
+        self._deadlines = {}
+        self._activity = {}
+        self._warned = set()
+        self._known = set()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.checks = 0
+        self.sent = 0
+
+    def start(self):
+        self._stopped = False
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+        on_activity(self.record_activity)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def record_activity(self, project, time):
+        """
+        Called when a command is added to project at time
+        """
+        with self._condition:
+            self._known.add(project)
+            self._activity[project] = max(time, self._activity.get(project, time))
+            if project in self._warned:
+                # Check straight away so the warnings already sent are reset
+                self._schedule(project, datetime.datetime.now())
+            else:
+                self._schedule(project, time + datetime.timedelta(seconds=WARNINGS[0][0], microseconds=1))
+
+    def run_pending(self, now=None):
+        """
+        Checks every project whose deadline has been reached and returns the earliest remaining deadline
+        """
+        while True:
+            with self._condition:
+                now = now or datetime.datetime.now()
+                project = self._pop(now)
+                if project is None:
+                    return self._heap[0][0] if self._heap else None
+            self._check(project, now)
+
+    def sweep(self):
+        """
+        Schedules every project that isn't scheduled yet
+        """
+        manager = ProjectManager(self._api, roomId=None)
+        for project in manager.get_projects():
+            if project not in self._known:
+                self._known.add(project)
+                self._check(project, datetime.datetime.now(), manager)
+
+    def _schedule(self, project, deadline):
+        self._deadlines[project] = deadline
+        heapq.heappush(self._heap, (deadline, project))
+        self._condition.notify()
+
+    def _pop(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            deadline, project = heapq.heappop(self._heap)
+            if self._deadlines.get(project) == deadline:
+                del self._deadlines[project]
+                return project
+        return None
+
+    def _check(self, project, now, manager=None):
+        self.checks += 1
+        manager = manager or ProjectManager(self._api, roomId=None)
+        if project not in manager.get_projects():
+            self._store.forget(project)
+            with self._condition:
+                self._activity.pop(project, None)
+            return
+
+        last_command = manager.get_last_command_time(project)
+        with self._condition:
+            recorded = self._activity.get(project)
+        if recorded and (not last_command or recorded > last_command):
+            last_command = recorded
+        if not last_command:
+            return
+
+        elapsed = (now - last_command).total_seconds()
+        warnings = self._store.get(project)
+        if elapsed < WARNINGS[0][0]:
+            # Command was run, reset warnings.
+            warnings = _new_warnings()
+            self._store.set(project, warnings)
+        elif elapsed > WARNINGS[0][0]:
+            seconds, flag, message = [i for i in WARNINGS if elapsed > i[0]][-1]
+            if not warnings[flag]:
+                self._send(manager, project, 'Project "' + str(project) + '" ' + message)
+                warnings[flag] = True
+                self._store.set(project, warnings)
+
+        with self._condition:
+            if any(warnings.values()):
+                self._warned.add(project)
+            else:
+                self._warned.discard(project)
+            # A command recorded while this check ran has already rescheduled the project
+            if project not in self._deadlines:
+                upcoming = [i[0] for i in WARNINGS if i[0] >= elapsed]
+                if upcoming:
+                    self._schedule(project, last_command + datetime.timedelta(seconds=upcoming[0], microseconds=1))
+
+    def _send(self, manager, project, message):
+        for room in set(manager.get_rooms(project)):
+            try:
+                get_dispatcher(self._api).send(markdown=message, roomId=room)
+            except Exception as e:
+                # If it doesn't sent to a room, room was likely deleted. Ignore
+                logger.warning("Failed to warn room '" + str(room) + "': " + str(e))
+        self.sent += 1
+
+    def _work(self):
+        next_sweep = datetime.datetime.now()
+        while True:
+            try:
+                if datetime.datetime.now() >= next_sweep:
+                    self.sweep()
+                    next_sweep = datetime.datetime.now() + datetime.timedelta(seconds=self._sweep_seconds)
+                deadline = self.run_pending()
+            except Exception:
+                logger.error(traceback.format_exc())
+                deadline = None
+
+            with self._condition:
+                if self._stopped:
+                    return
+                wake = min(deadline, next_sweep) if deadline else next_sweep
+                wait = (wake - datetime.datetime.now()).total_seconds()
+                if wait > 0:
+                    self._condition.wait(wait)
+                if self._stopped:
+                    return
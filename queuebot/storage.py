@@ -0,0 +1,711 @@
+import abc
+import collections
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+from app import logger, STORAGE_ENGINE, DATABASE_FILE, COMMAND_LOG_FILE, LAST_ACTIVITY_FILE, HISTORY_FILE
+from config import QUEUE_FILE, PEOPLE_FILE, COMMANDS_FILE, GLOBAL_STATS_FILE, ADMINS_FILE, SETTINGS_FILE, \
+    DATA_FOLDER, SUBPROJECT_FOLDER
+from queuebot.commandlog import CommandLog
+from queuebot.history import History, HistoryLog
+
+_storage = None
+_storage_lock = threading.Lock()
+_request = threading.local()
+
+cache_statistics = {'hits': 0, 'misses': 0}
+
+
+def get_storage():
+    """
+    Returns the unit of work for the current request if there is one, otherwise the storage engine
+    """
+    return getattr(_request, 'unit_of_work', None) or get_engine()
+
+
+def get_engine():
+    """
+    Returns the process wide storage engine selected by STORAGE_ENGINE in config
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if STORAGE_ENGINE == 'sqlite':
+                _storage = SqliteStorage(DATABASE_FILE)
+            elif STORAGE_ENGINE == 'json':
+                _storage = JsonStorage()
+            else:
+                raise Exception("Unknown storage engine '" + str(STORAGE_ENGINE) + "'")
+            logger.debug("Initialized '" + str(STORAGE_ENGINE) + "' storage engine")
+        return _storage
+
+
+@contextmanager
+def request_scope():
+    """
+    Routes all storage access on this thread through a UnitOfWork until the block exits, then flushes it
+    """
+    unit_of_work = UnitOfWork(get_engine())
+    _request.unit_of_work = unit_of_work
+    try:
+        yield unit_of_work
+    finally:
+        _request.unit_of_work = None
+        unit_of_work.flush()
+
+
+class Storage(abc.ABC):
+    """
+    Base class for storage engines. Engines must implement every abstract method, and can't be created until they do;
+    the per-record methods default to rewriting the whole collection and should be overridden by
+    engines that can update a single record in place.
+    """
+    @abc.abstractmethod
+    def get_people(self, project, subproject):
+        """
+        Returns the people on the subproject as a dictionary keyed by sparkId, in the order they were added
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_people(self, project, subproject, people, changed=None):
+        """
+        changed is an optional set of the sparkIds that were modified; engines may use it to skip everyone else
+        """
+        raise NotImplementedError
+
+    def save_person(self, project, subproject, person):
+        people = self.get_people(project, subproject)
+        people[person['sparkId']] = person
+        self.save_people(project, subproject, people)
+
+    @abc.abstractmethod
+    def get_queue(self, project, subproject):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_queue(self, project, subproject, queue):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_commands(self, project, subproject):
+        raise NotImplementedError
+
+    def get_last_commands(self, project, subproject, number):
+        return self.get_commands(project, subproject)[-number:] if number > 0 else []
+
+    @abc.abstractmethod
+    def add_command(self, project, subproject, command):
+        """
+        Engines must also record command['timeIssued'] as the last activity on the project
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_last_activity(self, project):
+        """
+        Returns the timeIssued of the latest command on any subproject of the project, or None if it isn't known
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_last_activity(self, project, time):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_admins(self, project):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_admins(self, project, admins):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_settings(self, project):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_settings(self, project, settings):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_global_stats(self, project, subproject):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_global_stats(self, project, subproject, global_stats):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_history(self, project, subproject):
+        """
+        Returns the queue history of the subproject as a History
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def append_history(self, project, subproject, records):
+        """
+        records is a list of (time, depth, flush_time, diff) tuples, see History
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def replace_history(self, project, subproject, history):
+        """
+        Replaces the whole history of the subproject, including its rollups
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_subproject(self, project, subproject):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_project(self, project):
+        raise NotImplementedError
+
+
+class JsonStorage(Storage):
+    """
+    Stores every collection as a whole JSON document in the data folder. This is the original storage format.
+    """
+    def _load(self, file, default):
+        if not os.path.exists(file):
+            return default
+        else:
+            return json.load(open(file, 'r'))
+
+    def _dump(self, data, file):
+        json.dump(data, open(file, 'w'), indent=4, separators=(',', ': '))
+
+    def get_people(self, project, subproject):
+        people = self._load(PEOPLE_FILE.format(project, subproject), {})
+        if isinstance(people, list):
+            # People files from before people were keyed by sparkId
+            people = collections.OrderedDict((i['sparkId'], i) for i in people)
+        return people
+
+    def save_people(self, project, subproject, people, changed=None):
+        self._dump(people, PEOPLE_FILE.format(project, subproject))
+
+    def get_queue(self, project, subproject):
+        return self._load(QUEUE_FILE.format(project, subproject), [])
+
+    def save_queue(self, project, subproject, queue):
+        self._dump(queue, QUEUE_FILE.format(project, subproject))
+
+    def _command_log(self, project, subproject):
+        return CommandLog(
+            COMMAND_LOG_FILE.format(project, subproject),
+            legacy_file=COMMANDS_FILE.format(project, subproject)
+        )
+
+    def get_commands(self, project, subproject):
+        return self._command_log(project, subproject).read()
+
+    def get_last_commands(self, project, subproject, number):
+        return self._command_log(project, subproject).tail(number)
+
+    def add_command(self, project, subproject, command):
+        self._command_log(project, subproject).append(command)
+        self.save_last_activity(project, command['timeIssued'])
+
+    def get_last_activity(self, project):
+        return (self._load(LAST_ACTIVITY_FILE.format(project), None) or {}).get('timeIssued')
+
+    def save_last_activity(self, project, time):
+        self._dump({'timeIssued': time}, LAST_ACTIVITY_FILE.format(project))
+
+    def get_admins(self, project):
+        return self._load(ADMINS_FILE.format(project), [])
+
+    def save_admins(self, project, admins):
+        os.makedirs(os.path.dirname(os.path.realpath(ADMINS_FILE.format(project))), exist_ok=True)
+        self._dump(admins, ADMINS_FILE.format(project))
+
+    def get_settings(self, project):
+        return self._load(SETTINGS_FILE.format(project), {})
+
+    def save_settings(self, project, settings):
+        json.dump(settings, open(SETTINGS_FILE.format(project), 'w'))
+
+    def get_global_stats(self, project, subproject):
+        return self._load(GLOBAL_STATS_FILE.format(project, subproject), None)
+
+    def save_global_stats(self, project, subproject, global_stats):
+        self._dump(global_stats, GLOBAL_STATS_FILE.format(project, subproject))
+
+    def get_history(self, project, subproject):
+        return HistoryLog(HISTORY_FILE.format(project, subproject)).read()
+
+    def append_history(self, project, subproject, records):
+        HistoryLog(HISTORY_FILE.format(project, subproject)).append(records)
+
+    def replace_history(self, project, subproject, history):
+        HistoryLog(HISTORY_FILE.format(project, subproject)).replace(history)
+
+    def delete_subproject(self, project, subproject):
+        shutil.rmtree(SUBPROJECT_FOLDER.format(project, subproject), ignore_errors=True)
+
+    def delete_project(self, project):
+        shutil.rmtree(DATA_FOLDER.format(project), ignore_errors=True)
+
+
+class SqliteStorage(Storage):
+    """
+    Stores every collection in a single SQLite database in WAL mode. People and commands are stored one row per
+    record so that updating a person or issuing a command does not rewrite the rest of the collection.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS people (
+            project TEXT NOT NULL,
+            subproject TEXT NOT NULL,
+            sparkId TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (project, subproject, sparkId)
+        );
+        CREATE INDEX IF NOT EXISTS people_position ON people (project, subproject, position);
+
+        CREATE TABLE IF NOT EXISTS queue_entries (
+            project TEXT NOT NULL,
+            subproject TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            personId TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (project, subproject, position)
+        );
+
+        CREATE TABLE IF NOT EXISTS commands (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project TEXT NOT NULL,
+            subproject TEXT NOT NULL,
+            timeIssued TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS commands_subproject ON commands (project, subproject, id);
+
+        CREATE TABLE IF NOT EXISTS admins (
+            project TEXT NOT NULL,
+            personId TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (project, personId)
+        );
+
+        CREATE TABLE IF NOT EXISTS settings (
+            project TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (project, key)
+        );
+
+        CREATE TABLE IF NOT EXISTS global_stats (
+            project TEXT NOT NULL,
+            subproject TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (project, subproject)
+        );
+
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project TEXT NOT NULL,
+            subproject TEXT NOT NULL,
+            time REAL NOT NULL,
+            depth REAL NOT NULL,
+            flushTime REAL NOT NULL,
+            diff TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS history_subproject ON history (project, subproject, id);
+
+        CREATE TABLE IF NOT EXISTS history_rollups (
+            project TEXT NOT NULL,
+            subproject TEXT NOT NULL,
+            unit TEXT NOT NULL,
+            start REAL NOT NULL,
+            count REAL NOT NULL,
+            depthSum REAL NOT NULL,
+            depthMin REAL NOT NULL,
+            depthMax REAL NOT NULL,
+            flushSum REAL NOT NULL,
+            flushMin REAL NOT NULL,
+            flushMax REAL NOT NULL,
+            PRIMARY KEY (project, subproject, unit, start)
+        );
+
+        CREATE TABLE IF NOT EXISTS last_activity (
+            project TEXT NOT NULL PRIMARY KEY,
+            timeIssued TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, file):
+        self._file = file
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.realpath(self._file)), exist_ok=True)
+        self._connection.executescript(self.SCHEMA)
+
+    @property
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads, so each thread gets its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self._file, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get_people(self, project, subproject):
+        rows = self._connection.execute(
+            'SELECT sparkId, data FROM people WHERE project = ? AND subproject = ? ORDER BY position',
+            (project, subproject)
+        )
+        return collections.OrderedDict((row[0], json.loads(row[1])) for row in rows)
+
+    def save_people(self, project, subproject, people, changed=None):
+        if changed is not None:
+            for id in [i for i in people if i in changed]:
+                self.save_person(project, subproject, people[id])
+            return
+
+        with self._connection as connection:
+            connection.execute('DELETE FROM people WHERE project = ? AND subproject = ?', (project, subproject))
+            connection.executemany(
+                'INSERT INTO people (project, subproject, sparkId, position, data) VALUES (?, ?, ?, ?, ?)',
+                [(project, subproject, person['sparkId'], index, json.dumps(person))
+                 for index, person in enumerate(people.values())]
+            )
+
+    def save_person(self, project, subproject, person):
+        with self._connection as connection:
+            updated = connection.execute(
+                'UPDATE people SET data = ? WHERE project = ? AND subproject = ? AND sparkId = ?',
+                (json.dumps(person), project, subproject, person['sparkId'])
+            ).rowcount
+            if not updated:
+                connection.execute(
+                    'INSERT INTO people (project, subproject, sparkId, position, data) '
+                    'SELECT ?, ?, ?, COALESCE(MAX(position) + 1, 0), ? FROM people WHERE project = ? AND subproject = ?',
+                    (project, subproject, person['sparkId'], json.dumps(person), project, subproject)
+                )
+
+    def get_queue(self, project, subproject):
+        rows = self._connection.execute(
+            'SELECT data FROM queue_entries WHERE project = ? AND subproject = ? ORDER BY position',
+            (project, subproject)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def save_queue(self, project, subproject, queue):
+        with self._connection as connection:
+            connection.execute('DELETE FROM queue_entries WHERE project = ? AND subproject = ?', (project, subproject))
+            connection.executemany(
+                'INSERT INTO queue_entries (project, subproject, position, personId, data) VALUES (?, ?, ?, ?, ?)',
+                [(project, subproject, index, member['personId'], json.dumps(member))
+                 for index, member in enumerate(queue)]
+            )
+
+    def get_commands(self, project, subproject):
+        rows = self._connection.execute(
+            'SELECT data FROM commands WHERE project = ? AND subproject = ? ORDER BY id',
+            (project, subproject)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def get_last_commands(self, project, subproject, number):
+        rows = self._connection.execute(
+            'SELECT data FROM commands WHERE project = ? AND subproject = ? ORDER BY id DESC LIMIT ?',
+            (project, subproject, max(number, 0))
+        )
+        return [json.loads(row[0]) for row in rows][::-1]
+
+    def add_command(self, project, subproject, command):
+        with self._connection as connection:
+            connection.execute(
+                'INSERT INTO commands (project, subproject, timeIssued, data) VALUES (?, ?, ?, ?)',
+                (project, subproject, command['timeIssued'], json.dumps(command))
+            )
+            connection.execute(
+                'INSERT OR REPLACE INTO last_activity (project, timeIssued) VALUES (?, ?)',
+                (project, command['timeIssued'])
+            )
+
+    def save_commands(self, project, subproject, commands):
+        """
+        Replaces the whole command history of the subproject, used by migrate_storage to import the JSON engine's
+        """
+        with self._connection as connection:
+            connection.execute('DELETE FROM commands WHERE project = ? AND subproject = ?', (project, subproject))
+            connection.executemany(
+                'INSERT INTO commands (project, subproject, timeIssued, data) VALUES (?, ?, ?, ?)',
+                [(project, subproject, command['timeIssued'], json.dumps(command)) for command in commands]
+            )
+
+    def get_admins(self, project):
+        rows = self._connection.execute('SELECT personId FROM admins WHERE project = ? ORDER BY position', (project,))
+        return [row[0] for row in rows]
+
+    def save_admins(self, project, admins):
+        with self._connection as connection:
+            connection.execute('DELETE FROM admins WHERE project = ?', (project,))
+            connection.executemany(
+                'INSERT OR IGNORE INTO admins (project, personId, position) VALUES (?, ?, ?)',
+                [(project, admin, index) for index, admin in enumerate(admins)]
+            )
+
+    def get_settings(self, project):
+        rows = self._connection.execute('SELECT key, value FROM settings WHERE project = ?', (project,))
+        return {key: json.loads(value) for key, value in rows}
+
+    def save_settings(self, project, settings):
+        with self._connection as connection:
+            connection.execute('DELETE FROM settings WHERE project = ?', (project,))
+            connection.executemany(
+                'INSERT INTO settings (project, key, value) VALUES (?, ?, ?)',
+                [(project, key, json.dumps(value)) for key, value in settings.items()]
+            )
+
+    def get_last_activity(self, project):
+        row = self._connection.execute('SELECT timeIssued FROM last_activity WHERE project = ?', (project,)).fetchone()
+        return row[0] if row else None
+
+    def save_last_activity(self, project, time):
+        with self._connection as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO last_activity (project, timeIssued) VALUES (?, ?)',
+                (project, time)
+            )
+
+    def get_global_stats(self, project, subproject):
+        row = self._connection.execute(
+            'SELECT data FROM global_stats WHERE project = ? AND subproject = ?',
+            (project, subproject)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_global_stats(self, project, subproject, global_stats):
+        with self._connection as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO global_stats (project, subproject, data) VALUES (?, ?, ?)',
+                (project, subproject, json.dumps(global_stats))
+            )
+
+    def get_history(self, project, subproject):
+        history = History()
+        rows = self._connection.execute(
+            'SELECT time, depth, flushTime, diff FROM history WHERE project = ? AND subproject = ? ORDER BY id',
+            (project, subproject)
+        )
+        history.extend((time, depth, flush_time, json.loads(diff)) for time, depth, flush_time, diff in rows)
+
+        for unit in ['hourly', 'daily']:
+            rows = self._connection.execute(
+                'SELECT start, count, depthSum, depthMin, depthMax, flushSum, flushMin, flushMax FROM history_rollups '
+                'WHERE project = ? AND subproject = ? AND unit = ? ORDER BY start',
+                (project, subproject, unit)
+            )
+            for row in rows:
+                getattr(history, unit).add_summary(*row)
+        return history
+
+    def append_history(self, project, subproject, records):
+        with self._connection as connection:
+            self._insert_history(connection, project, subproject, records)
+
+    def replace_history(self, project, subproject, history):
+        with self._connection as connection:
+            for table in ['history', 'history_rollups']:
+                connection.execute(
+                    'DELETE FROM ' + table + ' WHERE project = ? AND subproject = ?',
+                    (project, subproject)
+                )
+            self._insert_history(connection, project, subproject, list(history.records()))
+            connection.executemany(
+                'INSERT INTO history_rollups (project, subproject, unit, start, count, depthSum, depthMin, depthMax, '
+                'flushSum, flushMin, flushMax) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(project, subproject, unit) + summary
+                 for unit in ['hourly', 'daily'] for summary in getattr(history, unit).summaries()]
+            )
+
+    def _insert_history(self, connection, project, subproject, records):
+        connection.executemany(
+            'INSERT INTO history (project, subproject, time, depth, flushTime, diff) VALUES (?, ?, ?, ?, ?, ?)',
+            [(project, subproject, time, depth, flush_time, json.dumps(diff))
+             for time, depth, flush_time, diff in records]
+        )
+
+    def delete_subproject(self, project, subproject):
+        with self._connection as connection:
+            for table in ['people', 'queue_entries', 'commands', 'global_stats', 'history', 'history_rollups']:
+                connection.execute(
+                    'DELETE FROM ' + table + ' WHERE project = ? AND subproject = ?',
+                    (project, subproject)
+                )
+        shutil.rmtree(SUBPROJECT_FOLDER.format(project, subproject), ignore_errors=True)
+
+    def delete_project(self, project):
+        with self._connection as connection:
+            for table in ['people', 'queue_entries', 'commands', 'admins', 'settings', 'global_stats', 'history',
+                          'history_rollups', 'last_activity']:
+                connection.execute('DELETE FROM ' + table + ' WHERE project = ?', (project,))
+        shutil.rmtree(DATA_FOLDER.format(project), ignore_errors=True)
+
+
+class UnitOfWork(Storage):
+    """
+    Request scoped cache in front of a storage engine. The first read of each collection goes to the engine and is
+    kept for the rest of the request; writes only update the cached copy and are written back once by flush().
+    Cached collections are returned by reference, so callers must not mutate them without saving.
+    """
+    def __init__(self, engine):
+        self._engine = engine
+        self._cache = {}
+        self._dirty = {}
+        self._changed_people = {}
+        self._commands = {}
+        self._history = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, collection, *key):
+        if (collection,) + key in self._cache:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self._cache[(collection,) + key] = getattr(self._engine, 'get_' + collection)(*key)
+        return self._cache[(collection,) + key]
+
+    def _set(self, collection, value, *key):
+        self._cache[(collection,) + key] = value
+        self._dirty[(collection,) + key] = True
+
+    def get_people(self, project, subproject):
+        return self._get('people', project, subproject)
+
+    def save_people(self, project, subproject, people, changed=None):
+        self._set('people', people, project, subproject)
+        self._changed_people[(project, subproject)] = None
+
+    def save_person(self, project, subproject, person):
+        people = self.get_people(project, subproject)
+        people[person['sparkId']] = person
+        self._set('people', people, project, subproject)
+
+        changed = self._changed_people.get((project, subproject), set())
+        if changed is not None:
+            changed.add(person['sparkId'])
+            self._changed_people[(project, subproject)] = changed
+
+    def get_queue(self, project, subproject):
+        return self._get('queue', project, subproject)
+
+    def save_queue(self, project, subproject, queue):
+        self._set('queue', queue, project, subproject)
+
+    def get_commands(self, project, subproject):
+        return self._get('commands', project, subproject) + self._commands.get((project, subproject), [])
+
+    def get_last_commands(self, project, subproject, number):
+        pending = self._commands.get((project, subproject), [])
+        if number <= 0:
+            return []
+        elif number <= len(pending):
+            return pending[-number:]
+        elif ('commands', project, subproject) in self._cache:
+            return self.get_commands(project, subproject)[-number:]
+        else:
+            self.misses += 1
+            return self._engine.get_last_commands(project, subproject, number - len(pending)) + pending
+
+    def add_command(self, project, subproject, command):
+        self._commands.setdefault((project, subproject), []).append(command)
+
+    def get_last_activity(self, project):
+        pending = [i[-1]['timeIssued'] for key, i in self._commands.items() if key[0] == project and i]
+        if pending:
+            return max(pending)
+        return self._get('last_activity', project)
+
+    def save_last_activity(self, project, time):
+        self._set('last_activity', time, project)
+
+    def get_admins(self, project):
+        return self._get('admins', project)
+
+    def save_admins(self, project, admins):
+        self._set('admins', admins, project)
+
+    def get_settings(self, project):
+        return self._get('settings', project)
+
+    def save_settings(self, project, settings):
+        self._set('settings', settings, project)
+
+    def get_global_stats(self, project, subproject):
+        return self._get('global_stats', project, subproject)
+
+    def save_global_stats(self, project, subproject, global_stats):
+        self._set('global_stats', global_stats, project, subproject)
+
+    def get_history(self, project, subproject):
+        history = self._engine.get_history(project, subproject)
+        history.extend(self._history.get((project, subproject), []))
+        return history
+
+    def append_history(self, project, subproject, records):
+        self._history.setdefault((project, subproject), []).extend(records)
+
+    def replace_history(self, project, subproject, history):
+        # Records appended during this request are newer than anything in history
+        history.extend(self._history.pop((project, subproject), []))
+        self._engine.replace_history(project, subproject, history)
+
+    def delete_subproject(self, project, subproject):
+        self._forget(lambda key: key[1:3] == (project, subproject))
+        self._engine.delete_subproject(project, subproject)
+
+    def delete_project(self, project):
+        self._forget(lambda key: key[1] == project)
+        self._engine.delete_project(project)
+
+    def _forget(self, matches):
+        # Pending writes for deleted data must not recreate it when flushed
+        for key in [i for i in self._cache if matches(i)]:
+            del self._cache[key]
+            self._dirty.pop(key, None)
+        for key in [i for i in self._commands if matches(('commands',) + i)]:
+            del self._commands[key]
+        for key in [i for i in self._history if matches(('history',) + i)]:
+            del self._history[key]
+
+    def flush(self):
+        for key in self._dirty:
+            collection, args = key[0], key[1:]
+            if collection == 'people':
+                self._engine.save_people(*args, self._cache[key], changed=self._changed_people.get(args))
+            else:
+                getattr(self._engine, 'save_' + collection)(*args, self._cache[key])
+
+        for (project, subproject), commands in self._commands.items():
+            for command in commands:
+                self._engine.add_command(project, subproject, command)
+
+        for (project, subproject), records in self._history.items():
+            self._engine.append_history(project, subproject, records)
+
+        cache_statistics['hits'] += self.hits
+        cache_statistics['misses'] += self.misses
+        logger.debug("Storage: " + str(self.misses) + " reads, " + str(self.hits) + " cache hits, " +
+                     str(len(self._dirty) + sum(len(i) for i in self._commands.values()) + len(self._history)) +
+                     " writes")
+
+        self._dirty = {}
+        self._changed_people = {}
+        self._commands = {}
+        self._history = {}
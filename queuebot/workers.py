@@ -0,0 +1,170 @@
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+import zlib
+
+from app import logger, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_OVERFLOW, WEBHOOK_BLOCK_TIMEOUT, WEBHOOK_SPILL_FOLDER
+
+
+class WebhookWorkers:
+    """
+    Bounded pool of threads that process webhook events after the endpoint has already answered Spark.
+
+    Events are pinned to a worker by a stable hash of key(event), the roomId by default, so events with the same key are
+    always handled in the order they arrived while different keys are handled in parallel. Each worker has a queue of
+    WEBHOOK_QUEUE_SIZE / WEBHOOK_WORKERS events; when it is full WEBHOOK_OVERFLOW decides what happens:
+      - 'drop': the event is discarded
+      - 'block': the endpoint waits up to WEBHOOK_BLOCK_TIMEOUT seconds for room, then discards the event
+      - 'spill': the event is appended to a file in WEBHOOK_SPILL_FOLDER, read back once the worker catches up.
+        Spilled events survive a restart
+
+    With WEBHOOK_WORKERS = 0 events are handled synchronously by submit.
+    """
+    def __init__(self, handler, workers=None, size=None, overflow=None, spill_folder=None, key=None):
+        self._handler = handler
+        self._key = key or (lambda event: event.get('roomId'))
+        self._workers = WEBHOOK_WORKERS if workers is None else workers
+        self._overflow = overflow or WEBHOOK_OVERFLOW
+        self._spill_folder = spill_folder or WEBHOOK_SPILL_FOLDER
+        self._queues = [queue.Queue(max(1, (size or WEBHOOK_QUEUE_SIZE) // max(1, self._workers)))
+                        for i in range(self._workers)]
+        self._spilled = [0] * self._workers
+        self._lock = threading.Lock()
+        self._threads = []
+        self._processed = 0
+        self._dropped = 0
+        self._wait_total = 0
+        self._wait_max = 0
+        self._duration_total = 0
+        self._duration_max = 0
+
+    def submit(self, event):
+        """
+        Queues event for processing and returns whether it was accepted
+        """
+        if not self._workers:
+            self._run(event, time.time())
+            return True
+
+        self._start()
+        shard = zlib.crc32(str(self._key(event)).encode('utf-8')) % self._workers
+        item = (event, time.time())
+
+        with self._lock:
+            # Once a worker has spilled, later events for it must spill too so their order is kept
+            if self._spilled[shard]:
+                self._spill(shard, item)
+                return True
+            try:
+                self._queues[shard].put_nowait(item)
+                return True
+            except queue.Full:
+                if self._overflow == 'spill':
+                    self._spill(shard, item)
+                    return True
+
+        if self._overflow == 'block':
+            try:
+                self._queues[shard].put(item, timeout=WEBHOOK_BLOCK_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+
+        with self._lock:
+            self._dropped += 1
+        logger.error("Webhook queue is full, dropping event '" + str(event.get('id')) + "'")
+        return False
+
+    def statistics(self):
+        with self._lock:
+            return {
+                'workers': self._workers,
+                'depth': sum(i.qsize() for i in self._queues) + sum(self._spilled),
+                'spilled': sum(self._spilled),
+                'processed': self._processed,
+                'dropped': self._dropped,
+                'averageWaitSeconds': (self._wait_total / self._processed) if self._processed else 0,
+                'maxWaitSeconds': self._wait_max,
+                'averageProcessingSeconds': (self._duration_total / self._processed) if self._processed else 0,
+                'maxProcessingSeconds': self._duration_max
+            }
+
+    def join(self):
+        """
+        Waits until every queued (not spilled) event has been processed
+        """
+        for i in self._queues:
+            i.join()
+
+    def _start(self):
+        if len(self._threads) < self._workers:
+            with self._lock:
+                if not self._threads:
+                    if self._overflow == 'spill':
+                        os.makedirs(self._spill_folder, exist_ok=True)
+                        for shard in range(self._workers):
+                            self._spilled[shard] = self._count_spilled(shard)
+                    for shard in range(self._workers):
+                        thread = threading.Thread(target=self._work, args=(shard,), daemon=True)
+                        thread.start()
+                        self._threads.append(thread)
+
+    def _work(self, shard):
+        while True:
+            if self._spilled[shard] and self._queues[shard].empty():
+                for event, enqueued in self._unspill(shard):
+                    self._run(event, enqueued)
+                continue
+
+            try:
+                event, enqueued = self._queues[shard].get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                self._run(event, enqueued)
+            finally:
+                self._queues[shard].task_done()
+
+    def _run(self, event, enqueued):
+        started = time.time()
+        try:
+            self._handler(event)
+        except Exception:
+            if not self._workers:
+                raise
+            logger.error(traceback.format_exc())
+        finally:
+            finished = time.time()
+            with self._lock:
+                self._processed += 1
+                self._wait_total += started - enqueued
+                self._wait_max = max(self._wait_max, started - enqueued)
+                self._duration_total += finished - started
+                self._duration_max = max(self._duration_max, finished - started)
+
+    def _spill_file(self, shard):
+        return os.path.join(self._spill_folder, 'webhooks-' + str(shard) + '.spill')
+
+    def _spill(self, shard, item):
+        with open(self._spill_file(shard), 'a') as file:
+            file.write(json.dumps({'event': item[0], 'enqueued': item[1]}) + '\n')
+        self._spilled[shard] += 1
+
+    def _unspill(self, shard):
+        with self._lock:
+            with open(self._spill_file(shard), 'r') as file:
+                lines = file.readlines()
+            os.remove(self._spill_file(shard))
+            self._spilled[shard] = 0
+
+        logger.debug('Processing ' + str(len(lines)) + ' spilled events for worker ' + str(shard))
+        return [(i['event'], i['enqueued']) for i in (json.loads(line) for line in lines if line.strip())]
+
+    def _count_spilled(self, shard):
+        if not os.path.exists(self._spill_file(shard)):
+            return 0
+        with open(self._spill_file(shard), 'r') as file:
+            return len([i for i in file if i.strip()])
@@ -0,0 +1,21 @@
+from queuebot.projects import ProjectManager
+
+# Rebuilds the subproject catalog kept in every project's settings from the subproject folders on disk. The catalog
+# is maintained by the create and delete subproject commands, so this is only needed after upgrading, or if folders
+# were added or removed by hand.
+
+
+def repair():
+    manager = ProjectManager(None, None)
+
+    for project in sorted(manager.get_projects()):
+        added, removed = manager.repair_subprojects(project)
+        print(project + ': ' + ', '.join(manager.get_subprojects(project=project)))
+        if added:
+            print('  added ' + ', '.join(added))
+        if removed:
+            print('  removed ' + ', '.join(removed))
+
+
+if __name__ == '__main__':
+    repair()
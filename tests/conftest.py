@@ -0,0 +1,10 @@
+import pytest
+
+from tests.fake_spark import FakeSpark
+
+
+@pytest.fixture
+def fake_spark():
+    server = FakeSpark().start()
+    yield server
+    server.stop()
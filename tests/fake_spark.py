@@ -0,0 +1,142 @@
+import email.parser
+import json
+import re
+import socketserver
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ME = {
+    'id': 'me_id',
+    'displayName': 'QueueBot',
+    'emails': ['queuebot@sparkbot.io'],
+    'type': 'bot'
+}
+
+
+class FakeSpark(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    A local stand-in for the Spark REST API that records every request it receives, so tests can count round-trips.
+
+    people and messages are dicts of id -> JSON record, and uploads is a dict of filename -> the bytes uploaded with
+    a message. Point a client at it with CiscoSparkAPI(token, base_url=url)
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakeSparkHandler)
+        self.url = 'http://127.0.0.1:' + str(self.server_address[1]) + '/v1/'
+        self.people = {ME['id']: ME}
+        self.messages = {}
+        self.uploads = {}
+        self.requests = []
+        self.connections = set()
+        self.responses = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, method, path):
+        """
+        Returns how many requests matched method and the path regex
+        """
+        return len([i for i in self.requests if i[0] == method and re.match(path + '$', i[1])])
+
+    def respond_next(self, status, body=None, headers=None):
+        """
+        Makes the next request fail (or succeed) with the given status instead of being handled normally
+        """
+        self.responses.append((status, body or {}, headers or {}))
+
+    def record(self, method, path, port):
+        with self._lock:
+            self.requests.append((method, path))
+            self.connections.add(port)
+            return self.responses.pop(0) if self.responses else None
+
+
+class FakeSparkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Type', '').startswith('multipart/form-data'):
+            body = self._parse_multipart(data)
+        else:
+            body = json.loads(data.decode('utf-8')) if data else {}
+
+        response = self.server.record(method, url.path, self.client_address[1])
+        if response:
+            return self._send(*response)
+
+        match = re.match(r'/v1/(people|messages)(?:/([^/]+))?$', url.path)
+        if not match:
+            return self._send(404, {'message': 'Not found'})
+
+        collection, id = match.groups()
+        if collection == 'people' and id == 'me':
+            id = ME['id']
+        records = getattr(self.server, collection)
+
+        if method == 'GET' and id:
+            if id in records:
+                self._send(200, records[id])
+            else:
+                self._send(404, {'message': 'Not found'})
+        elif method == 'GET':
+            ids = parse_qs(url.query).get('id', [''])[0].split(',')
+            self._send(200, {'items': [records[i] for i in ids if i in records]})
+        elif method == 'POST':
+            record = dict(body, id='message-' + str(len(records) + 1))
+            records[record['id']] = record
+            self._send(200, record)
+        elif method == 'DELETE':
+            records.pop(id, None)
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def _parse_multipart(self, data):
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode('utf-8') + b'\r\n\r\n' + data)
+        body = {}
+        for part in message.get_payload():
+            name = part.get_param('name', header='Content-Disposition')
+            if part.get_filename():
+                self.server.uploads[part.get_filename()] = part.get_payload(decode=True)
+                body.setdefault(name, []).append(part.get_filename())
+            else:
+                body[name] = part.get_payload(decode=True).decode('utf-8')
+        return body
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
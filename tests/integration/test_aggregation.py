@@ -0,0 +1,55 @@
+import datetime
+
+import numpy
+import pytest
+
+from queuebot.aggregation import HistoryAggregator
+from queuebot.history import History
+
+
+def random_history(records, seed=0):
+    state = numpy.random.RandomState(seed)
+    history = History()
+    start = datetime.datetime(1980, 1, 1).timestamp()
+    for time in numpy.sort(start + state.uniform(0, 60 * 24 * 60 * 60, records)):
+        history.append(time, state.randint(0, 20), state.uniform(0, 3600), [])
+    return history
+
+
+def grouped(history, attribute, unit):
+    groups = {}
+    for time, depth, flush_time, diff in history.records():
+        local = datetime.datetime.fromtimestamp(time)
+        key = local.hour if unit == 'hour' else local.weekday()
+        groups.setdefault(key, []).append(depth if attribute == 'queueDepth' else flush_time)
+    return groups
+
+
+@pytest.mark.parametrize('statistic, function', [
+    ('average', numpy.mean),
+    ('min', numpy.min),
+    ('max', numpy.max),
+    ('p50', lambda values: numpy.percentile(values, 50)),
+    ('p90', lambda values: numpy.percentile(values, 90)),
+    ('p99', lambda values: numpy.percentile(values, 99)),
+])
+def test_statistics_match_each_group(statistic, function):
+    history = random_history(2000)
+    aggregator = HistoryAggregator(history)
+    for attribute in ['queueDepth', 'flushTime']:
+        for unit, length in [('hour', 24), ('day', 7)]:
+            groups = grouped(history, attribute, unit)
+            expected = [function(groups[i]) if i in groups else 0 for i in range(length)]
+            assert numpy.allclose(aggregator.aggregate(statistic, attribute, unit), expected)
+
+
+def test_empty_groups_are_zero():
+    history = History()
+    history.append(datetime.datetime(1980, 1, 1, 12, 30).timestamp(), 3, 90, [])
+    aggregator = HistoryAggregator(history)
+
+    assert list(aggregator.aggregate('max', 'queueDepth', 'hour')) == [0] * 12 + [3] + [0] * 11
+    assert list(aggregator.aggregate('p90', 'flushTime', 'day')) == [0, 90, 0, 0, 0, 0, 0]
+    assert list(HistoryAggregator(History()).aggregate('min', 'queueDepth', 'day')) == [0] * 7
+    with pytest.raises(Exception):
+        aggregator.aggregate('median', 'queueDepth', 'day')
@@ -0,0 +1,59 @@
+import threading
+
+from queuebot.charts import ChartCache, ChartRenderer, render_line_graph
+
+
+def test_charts_are_rendered_once_per_key():
+    cache = ChartCache(size=10)
+    renders = []
+
+    def render(chart):
+        def inner():
+            renders.append(chart)
+            return chart
+        return inner
+
+    assert cache.get(('P', 'GENERAL', 'average', 1), render(b'1234')) == b'1234'
+    assert cache.get(('P', 'GENERAL', 'average', 1), render(b'5678')) == b'1234'
+    assert cache.get(('P', 'GENERAL', 'average', 2), render(b'5678')) == b'5678'
+    assert renders == [b'1234', b'5678']
+    assert cache.statistics()['hitRate'] == 1 / 3 and cache.statistics()['bytes'] == 8
+
+    # Over the size limit the least recently used chart is dropped
+    cache.get(('P', 'GENERAL', 'average', 1), render(b''))
+    cache.get(('P', 'GENERAL', 'max', 1), render(b'9012'))
+    assert cache.statistics()['cached'] == 2 and cache.statistics()['bytes'] == 8
+    cache.get(('P', 'GENERAL', 'average', 2), render(b'3456'))
+    assert renders[-1] == b'3456'
+
+
+def test_charts_can_be_rendered_on_several_threads():
+    items = {str(i): i * i for i in range(24)}
+    expected = render_line_graph('Squares', items, yaxis_dates=True)
+    assert expected.startswith(b'\x89PNG')
+
+    charts = []
+    threads = [threading.Thread(target=lambda: charts.append(render_line_graph('Squares', items, yaxis_dates=True)))
+               for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert charts == [expected] * 4
+
+
+def test_charts_are_rendered_in_other_processes():
+    renderer = ChartRenderer(processes=1, timeout=60)
+    try:
+        items = {str(i): i for i in range(7)}
+        assert renderer.render('Days', items, rotation=0) == render_line_graph('Days', items, rotation=0)
+        assert renderer.render('Broken', {'a': 'not a number', 'b': None}) is None
+
+        # A chart that takes too long is given up on, and the next one is rendered by a new pool
+        renderer._timeout = 0.001
+        assert renderer.render('Days', items) is None
+        renderer._timeout = 60
+        assert renderer.render('Days', items).startswith(b'\x89PNG')
+        assert renderer.statistics() == {'rendered': 2, 'failed': 1, 'timedOut': 1}
+    finally:
+        renderer.stop()
@@ -0,0 +1,48 @@
+import json
+
+from unittest import mock
+from queuebot.commandlog import CommandLog
+
+
+def test_tail_reads_from_the_end(tmpdir):
+    log = CommandLog(str(tmpdir.join('commands.log')))
+    for i in range(10):
+        log.append({'command': 'list', 'number': i})
+
+    assert [i['number'] for i in log.tail(3)] == [7, 8, 9]
+    assert [i['number'] for i in log.tail(20)] == list(range(10))
+    assert log.tail(0) == []
+    assert [i['number'] for i in log.read()] == list(range(10))
+
+
+@mock.patch('queuebot.commandlog.COMMAND_LOG_SEGMENT_BYTES', 100)
+def test_rotation_and_legacy_file(tmpdir):
+    legacy = tmpdir.join('commands.pickle')
+    json.dump([{'number': -2}, {'number': -1}], open(str(legacy), 'w'))
+
+    log = CommandLog(str(tmpdir.join('commands.log')), legacy_file=str(legacy))
+    for i in range(20):
+        log.append({'command': 'add me', 'number': i})
+
+    assert tmpdir.join('commands.log.1').check()
+    assert tmpdir.join('commands.log.2').check()
+    assert [i['number'] for i in log.read()] == list(range(-2, 20))
+    assert [i['number'] for i in log.tail(5)] == list(range(15, 20))
+    assert [i['number'] for i in log.tail(100)] == list(range(-2, 20))
+
+
+def test_partial_line_is_skipped(tmpdir):
+    log = CommandLog(str(tmpdir.join('commands.log')))
+    log.append({'number': 0})
+    log.append({'number': 1})
+    with open(str(tmpdir.join('commands.log')), 'a') as file:
+        file.write('{"numb')
+
+    assert [i['number'] for i in log.tail(5)] == [0, 1]
+    assert [i['number'] for i in log.read()] == [0, 1]
+
+    # Records appended after the partial line are still read
+    log.append({'number': 2})
+    log.append({'number': 3})
+    assert [i['number'] for i in log.tail(5)] == [0, 1, 2, 3]
+    assert [i['number'] for i in log.read()] == [0, 1, 2, 3]
@@ -0,0 +1,92 @@
+import time
+
+from unittest import mock
+from queuebot.decorators import with_request
+from queuebot.dedup import WebhookDeduplicator
+
+
+def test_ids_are_remembered_within_the_window():
+    dedup = WebhookDeduplicator(window=60, size=2)
+
+    assert not dedup.is_duplicate('a')
+    assert dedup.is_duplicate('a')
+    assert not dedup.is_duplicate(None)
+
+    with mock.patch('time.time', return_value=time.time() + 120):
+        assert not dedup.is_duplicate('a')
+
+    assert not dedup.is_duplicate('b')
+    assert not dedup.is_duplicate('c')
+    # Only the two most recent ids fit
+    assert not dedup.is_duplicate('a')
+    assert dedup.statistics() == {'checks': 6, 'hits': 1, 'remembered': 2}
+
+
+def test_ids_survive_restart(tmpdir):
+    file = str(tmpdir.join('seen.log'))
+    dedup = WebhookDeduplicator(window=60, size=2, file=file)
+    for i in ['a', 'b', 'c', 'd', 'e']:
+        dedup.is_duplicate(i)
+
+    restarted = WebhookDeduplicator(window=60, size=2, file=file)
+    assert restarted.is_duplicate('e')
+    assert not restarted.is_duplicate('a')
+    assert len(open(file).readlines()) <= 4
+
+
+def test_forgotten_ids_stay_forgotten_after_restart(tmpdir):
+    file = str(tmpdir.join('seen.log'))
+    dedup = WebhookDeduplicator(window=60, size=10, file=file)
+    dedup.is_duplicate('a')
+    dedup.is_duplicate('b')
+    dedup.forget('a')
+    dedup.forget('unknown')
+
+    assert not WebhookDeduplicator(window=60, size=10, file=file).is_duplicate('a')
+    assert dedup.statistics()['remembered'] == 1 and not dedup.is_duplicate('a') and dedup.is_duplicate('a')
+
+
+@with_request(data={
+      "id": "message-id",
+      "roomId": "BLAH",
+      "roomType": "group",
+      "text": "QueueBot list",
+      "personId": "non-admin",
+      "personEmail": "avthorn@cisco.com",
+      "mentionedPeople": [
+        "me_id"
+      ],
+      "created": "2018-04-02T14:23:08.086Z"
+    }
+)
+def test_redelivered_webhook_is_handled_once():
+    from endpoints import queue, DEDUPLICATOR
+    from queuebot.spark import CiscoSparkAPI
+    queue()
+    calls = len(CiscoSparkAPI().mock_calls)
+    queue()
+    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
+    assert len(CiscoSparkAPI().mock_calls) == calls, "Redelivery should not call the API"
+    assert DEDUPLICATOR.statistics()['hits'] == 1
+
+
+@with_request(data={
+      "id": "message-id",
+      "roomId": "BLAH",
+      "roomType": "group",
+      "text": "QueueBot list",
+      "personId": "non-admin",
+      "personEmail": "avthorn@cisco.com",
+      "mentionedPeople": [
+        "me_id"
+      ],
+      "created": "2018-04-02T14:23:08.086Z"
+    }
+)
+def test_dropped_webhook_is_handled_when_redelivered():
+    from endpoints import queue, WORKERS
+    from queuebot.spark import CiscoSparkAPI
+    with mock.patch.object(WORKERS, 'submit', return_value=False):
+        assert queue()[1] == 503
+    queue()
+    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Redelivery should be handled"
@@ -0,0 +1,88 @@
+from unittest import mock
+import pytest
+from ciscosparkapi import CiscoSparkAPI
+from queuebot.dispatcher import MessageDispatcher
+
+
+def test_consecutive_messages_to_a_room_are_combined(fake_spark):
+    dispatcher = MessageDispatcher(CiscoSparkAPI('token', base_url=fake_spark.url), window=0.2, background=True)
+
+    dispatcher.send('room-a', markdown='one')
+    dispatcher.send('room-b', markdown='other room')
+    dispatcher.send('room-a', markdown='two')
+    dispatcher.send('room-a', markdown='three')
+    dispatcher.flush(timeout=5)
+
+    assert fake_spark.count('POST', '/v1/messages') == 2
+    sent = {i['roomId']: i['markdown'] for i in fake_spark.messages.values()}
+    assert sent == {'room-a': 'one\n\ntwo\n\nthree', 'room-b': 'other room'}
+    assert dispatcher.statistics()['posted'] == 2 and dispatcher.statistics()['pending'] == 0
+
+
+def test_rate_limit_is_retried_after_the_given_delay(fake_spark):
+    dispatcher = MessageDispatcher(CiscoSparkAPI('token', base_url=fake_spark.url, wait_on_rate_limit=False),
+                                   window=0, background=True)
+    fake_spark.respond_next(429, {'message': 'Too many requests'}, {'Retry-After': '1'})
+
+    with mock.patch('time.sleep') as sleep:
+        dispatcher.send('room-a', markdown='hello')
+        dispatcher.flush(timeout=5)
+
+    sleep.assert_called_with(1.0)
+    assert fake_spark.count('POST', '/v1/messages') == 2
+    assert [i['markdown'] for i in fake_spark.messages.values()] == ['hello']
+    assert dispatcher.statistics()['rateLimited'] == 1 and dispatcher.statistics()['failed'] == 0
+
+
+
+def test_rate_limit_with_a_date_falls_back_to_the_backoff(fake_spark):
+    dispatcher = MessageDispatcher(CiscoSparkAPI('token', base_url=fake_spark.url, wait_on_rate_limit=False),
+                                   window=0, background=True)
+    fake_spark.respond_next(429, {'message': 'Too many requests'}, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+
+    with mock.patch('time.sleep') as sleep:
+        dispatcher.send('room-a', markdown='hello')
+        dispatcher.flush(timeout=5)
+    dispatcher.send('room-a', markdown='later', files=[('chart.png', b'\x89PNG data')])
+
+    sleep.assert_called_with(1)
+    assert [i['markdown'] for i in fake_spark.messages.values()] == ['hello', 'later']
+
+
+def test_unexpected_error_does_not_stop_sending():
+    api = mock.MagicMock()
+    dispatcher = MessageDispatcher(api, window=0, background=True, send_timeout=5)
+
+    with mock.patch.object(dispatcher, '_deliver', side_effect=RuntimeError('broken')):
+        with pytest.raises(RuntimeError):
+            dispatcher.send('room-a', files=['chart.png'])
+    dispatcher.send('room-a', files=['chart.png'])
+
+    api.messages.create.assert_called_once_with(roomId='room-a', files=['chart.png'])
+    assert dispatcher.statistics()['failed'] == 1
+
+def test_files_are_sent_in_order_before_send_returns():
+    api = mock.MagicMock()
+    dispatcher = MessageDispatcher(api, window=10, background=True)
+
+    dispatcher.send('room-a', markdown='before')
+    dispatcher.send('room-a', files=['chart.png'])
+
+    assert api.messages.create.call_args_list == [
+        mock.call(roomId='room-a', markdown='before'),
+        mock.call(roomId='room-a', files=['chart.png'])
+    ]
+
+
+def test_inline_sends_immediately():
+    api = mock.MagicMock()
+    MessageDispatcher(api, background=False).send('room-a', markdown='now')
+    api.messages.create.assert_called_once_with(roomId='room-a', markdown='now')
+
+
+def test_in_memory_files_are_uploaded(fake_spark):
+    dispatcher = MessageDispatcher(CiscoSparkAPI('token', base_url=fake_spark.url), background=False)
+    dispatcher.send('room-a', markdown='chart', files=[('chart.png', b'\x89PNG data')])
+
+    assert list(fake_spark.messages.values())[0]['files'] == ['chart.png']
+    assert fake_spark.uploads == {'chart.png': b'\x89PNG data'}
@@ -0,0 +1,151 @@
+import datetime
+
+import numpy
+
+from queuebot.history import History, HistoryLog, apply_diff, diff_queues
+from queuebot.queue import Queue
+from queuebot.storage import SqliteStorage, get_storage
+
+QUEUES = [
+    [],
+    [{'personId': 'a'}],
+    [{'personId': 'a'}, {'personId': 'b'}, {'personId': 'c'}],
+    [{'personId': 'a'}, {'personId': 'c'}],
+    [{'personId': 'c', 'atHeadTime': '1980-01-01 12:00:00'}],
+]
+
+
+def records():
+    previous = []
+    for index, queue in enumerate(QUEUES):
+        yield 315576000.0 + index, len(queue), 60.0 * index, diff_queues(previous, queue)
+        previous = queue
+
+
+def test_diffs_rebuild_every_snapshot():
+    queue = []
+    for time, depth, flush_time, diff in records():
+        queue = apply_diff(queue, diff)
+        assert len(queue) == depth
+    assert queue == QUEUES[-1]
+    assert diff_queues(QUEUES[2], QUEUES[3]) == [[1, 2, []]]
+
+
+def test_history_log_round_trip(tmpdir):
+    log = HistoryLog(str(tmpdir.join('history')))
+    log.append(list(records())[:2])
+    log.append(list(records())[2:])
+    # A partially written record is ignored
+    tmpdir.join('history.times').write_binary(tmpdir.join('history.times').read_binary() + b'\x00\x01')
+
+    history = log.read()
+    assert list(history.depths) == [0, 1, 3, 2, 1]
+    assert list(history.flush_times) == [0, 60, 120, 180, 240]
+    assert [i[1] for i in history.snapshots()] == QUEUES
+    assert tmpdir.join('history.depths').size() == 5 * 8
+
+
+
+def test_history_log_append_after_partial_write(tmpdir):
+    log = HistoryLog(str(tmpdir.join('history')))
+    log.append(list(records())[:3])
+    # Interrupted part way through appending the fourth record
+    tmpdir.join('history.times').write_binary(tmpdir.join('history.times').read_binary() + b'\x00' * 8)
+    tmpdir.join('history.depths').write_binary(tmpdir.join('history.depths').read_binary() + b'\x00\x01')
+    tmpdir.join('history.diffs').write(tmpdir.join('history.diffs').read() + '[[1,2')
+
+    HistoryLog(str(tmpdir.join('history'))).append(list(records())[3:])
+    history = log.read()
+    assert list(history.depths) == [0, 1, 3, 2, 1]
+    assert [i[1] for i in history.snapshots()] == QUEUES
+    assert [tmpdir.join('history.' + i).size() for i in ['times', 'depths', 'flush_times']] == [5 * 8] * 3
+    assert len(tmpdir.join('history.diffs').readlines()) == 5
+
+
+def test_sqlite_history(tmpdir):
+    storage = SqliteStorage(str(tmpdir.join('queuebot.db')))
+    storage.append_history('UNIT_TEST', 'GENERAL', list(records()))
+
+    history = storage.get_history('UNIT_TEST', 'GENERAL')
+    assert list(history.times) == [i[0] for i in records()]
+    assert [i[1] for i in history.snapshots()] == QUEUES
+
+    history = storage.get_history('UNIT_TEST', 'GENERAL').compact(315576002.0)
+    storage.replace_history('UNIT_TEST', 'GENERAL', history)
+    history = storage.get_history('UNIT_TEST', 'GENERAL')
+    assert len(history) == 3 and sum(history.hourly.counts) == 2
+    assert [i[1] for i in history.snapshots()] == QUEUES[2:]
+
+    storage.delete_subproject('UNIT_TEST', 'GENERAL')
+    assert len(storage.get_history('UNIT_TEST', 'GENERAL')) == 0
+
+
+def test_compact_summarises_old_records():
+    history = History()
+    history.extend(records())
+
+    compacted = history.compact(315576003.0)
+    assert list(compacted.times) == [315576003.0, 315576004.0]
+    assert [i[1] for i in compacted.snapshots()] == QUEUES[3:]
+    assert list(compacted.hourly.counts) == [3] and list(compacted.daily.counts) == [3]
+    assert compacted.hourly.depth_sums[0] == 4 and compacted.hourly.depth_maxes[0] == 3
+    assert compacted.hourly.flush_mins[0] == 0 and compacted.hourly.flush_maxes[0] == 120
+
+    # Compacting again adds to the same summaries
+    compacted = compacted.compact(315576004.0)
+    assert list(compacted.hourly.counts) == [4] and len(compacted) == 1
+    assert [i[1] for i in compacted.snapshots()] == QUEUES[4:]
+
+
+def test_interrupted_replace_is_finished(tmpdir):
+    log = HistoryLog(str(tmpdir.join('history')))
+    log.append(list(records()))
+    history = log.read().compact(315576003.0)
+
+    log.replace(history)
+    assert len(log.read()) == 2 and len(log.read().hourly) == 1
+
+    # Every file was written but only the times were moved into place
+    log.append(list(records())[:1])
+    for name in ['times', 'depths', 'flush_times', 'diffs', 'hourly', 'daily']:
+        tmpdir.join('history.' + name).copy(tmpdir.join('history.' + name + '.tmp'))
+    tmpdir.join('history.replacing').write('')
+    tmpdir.join('history.times.tmp').move(tmpdir.join('history.times'))
+    assert len(log.read()) == 3
+    assert not tmpdir.join('history.replacing').check()
+
+
+def test_compacting_keeps_the_statistics(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join('queuebot', 'data', 'UNIT_TEST', 'GENERAL').ensure(dir=True)
+    queue = Queue(None, 'UNIT_TEST', 'GENERAL', people_manager=None)
+    now = datetime.datetime(1980, 3, 1)
+    get_storage().append_history('UNIT_TEST', 'GENERAL', [
+        ((now - datetime.timedelta(hours=i * 7)).timestamp(), i % 5, i * 10.0, [])
+        for i in range(500, 0, -1)
+    ])
+
+    statistics = [(statistic, attribute, unit) for statistic in ['average', 'min', 'max']
+                  for attribute in ['queueDepth', 'flushTime'] for unit in ['hour', 'day']]
+    before = [queue.get_statistic_by_unit(*i) for i in statistics]
+    assert queue.compact_history(retention_days=30, now=now) == 500 - 30 * 24 // 7
+    for values, arguments in zip(before, statistics):
+        assert numpy.allclose(queue.get_statistic_by_unit(*arguments), values)
+
+
+def test_record_after_compacting_everything_holds_the_whole_queue(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join('queuebot', 'data', 'UNIT_TEST', 'GENERAL').ensure(dir=True)
+    member = {'personId': 'a', 'timeEnqueued': '1980-01-01 12:00:00', 'atHeadTime': None}
+    storage = get_storage()
+    storage.save_queue('UNIT_TEST', 'GENERAL', [member])
+    storage.append_history('UNIT_TEST', 'GENERAL', [
+        (datetime.datetime(1980, 1, 1).timestamp(), 1, 0.0, [[0, 0, [member]]])
+    ])
+    queue = Queue(None, 'UNIT_TEST', 'GENERAL', people_manager=None)
+    queue._global_stats['lastSnapshot'] = [member]
+    monkeypatch.setattr(queue, 'get_estimated_flush_time', lambda: 0.0)
+
+    assert queue.compact_history(retention_days=30, now=datetime.datetime(1980, 3, 1)) == 1
+    queue._update_save_global_stats()
+    assert [i[1] for i in queue.get_history().snapshots()] == [[member]]
@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+
+# Imports endpoints, as the bot does when it starts, in a fresh interpreter and reports how long each module took in
+# the style of 'python -X importtime' (which Python 3.6 doesn't have): the time from a module's first import starting
+# to it finishing, including everything it imported.
+IMPORT_TIMES = '''
+import builtins
+import json
+import sys
+import time
+
+times = {}
+original = builtins.__import__
+
+
+def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return original(name, globals, locals, fromlist, level)
+    start = time.perf_counter()
+    try:
+        return original(name, globals, locals, fromlist, level)
+    finally:
+        times.setdefault(name, time.perf_counter() - start)
+
+
+builtins.__import__ = timed_import
+import endpoints
+builtins.__import__ = original
+print(json.dumps({'times': times, 'modules': sorted(sys.modules)}))
+'''
+
+# Only needed by a few commands, so loaded when they are first used. The standard library's csv isn't checked as
+# importlib.metadata, which requests may load, imports it
+LAZY_MODULES = ['matplotlib', 'numpy', 'queuebot.aggregation']
+
+
+def test_heavy_modules_are_not_imported_on_start_up():
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    report = json.loads(subprocess.check_output([sys.executable, '-c', IMPORT_TIMES], cwd=root).decode('utf-8'))
+
+    print('\nslowest imports of endpoints:')
+    for name, seconds in sorted(report['times'].items(), key=lambda i: -i[1])[:10]:
+        print('  ' + format(seconds * 1e3, '8.1f') + ' ms  ' + name)
+
+    assert [i for i in report['modules'] if i.split('.')[0] in LAZY_MODULES or i in LAZY_MODULES] == []
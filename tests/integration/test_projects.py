@@ -0,0 +1,67 @@
+import json
+import os
+from unittest import mock
+
+from queuebot import projects
+from queuebot.projects import ProjectIndex, get_project_index
+
+
+def test_project_index_lookups_and_updates(tmpdir):
+    index = ProjectIndex(str(tmpdir.join('projects.json')), [['A', 'room-1'], ['A', 'room-2'], ['B', None]])
+
+    assert index.rooms == {'room-1': 'A', 'room-2': 'A'}
+    assert index.projects == {'A': ['room-1', 'room-2'], 'B': [None]}
+
+    index.register('B', 'room-2')
+    assert index.rooms == {'room-1': 'A', 'room-2': 'B'}
+    assert index.projects == {'A': ['room-1'], 'B': ['room-2']}
+
+    # Readers holding the indexes from before an update never see them change
+    config, rooms, projects = index.config, index.rooms, index.projects
+    index.add_project('C')
+    assert 'C' in index.projects and 'C' not in projects and len(config) == 2 and len(rooms) == 2
+    index.remove_project('A')
+    assert index.rooms == {'room-2': 'B'}
+    assert list(index.projects) == ['B', 'C']
+
+    index.save()
+    assert json.load(open(index.file)) == [['B', 'room-2'], ['C', None]]
+
+
+def test_project_index_is_reloaded_only_when_the_file_changes(tmpdir):
+    file = str(tmpdir.join('projects.json'))
+    json.dump([['A', 'room-1']], open(file, 'w'))
+    projects._index = None
+
+    index = get_project_index(file)
+    assert get_project_index(file) is index
+
+    json.dump([['A', 'room-1'], ['B', 'room-2']], open(file, 'w'))
+    os.utime(file, ns=(0, 0))
+    reloaded = get_project_index(file)
+    assert reloaded is not index
+    assert reloaded.rooms == {'room-1': 'A', 'room-2': 'B'}
+
+
+def test_subprojects_come_from_the_catalog_once_it_exists(tmpdir, monkeypatch):
+    from queuebot.projects import ProjectManager
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(projects, '_index', None)
+    tmpdir.join('queuebot', 'data', 'P', 'A').ensure(dir=True)
+    tmpdir.join('queuebot', 'data', 'P', 'B').ensure(dir=True)
+    json.dump([['P', 'room']], open('queuebot/data/projects.json', 'w'))
+
+    # Without a catalog the folders are scanned
+    manager = ProjectManager(None, 'room')
+    assert manager.get_subprojects() == ['A', 'B']
+
+    manager.create_subproject('c')
+    assert json.load(open('queuebot/data/P/settings.json'))['subprojects'] == ['A', 'B', 'C']
+
+    # Folders changed by hand are only picked up by a repair
+    tmpdir.join('queuebot', 'data', 'P', 'B').remove()
+    with mock.patch('os.walk') as walk:
+        assert ProjectManager(None, 'room').get_subprojects() == ['A', 'B', 'C']
+        assert not walk.called
+    assert ProjectManager(None, None).repair_subprojects('P') == ([], ['B'])
+    assert ProjectManager(None, 'room').get_subprojects() == ['A', 'C']
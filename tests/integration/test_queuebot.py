@@ -1,8 +1,11 @@
+import datetime
 import flask
 import ciscosparkapi
 import json
 
 from queuebot.decorators import with_request
+from queuebot.commandlog import CommandLog
+from queuebot.history import HistoryLog
 from unittest import mock
 from contextlib import contextmanager
 from tests.scaffolding import CAT_FACT, DAD_JOKE
@@ -10,6 +13,19 @@ from app import VERSION, RELEASED, AUTHOR, EMAIL, QUEUE_THRESHOLD
 from freezegun import freeze_time
 from attrdict import AttrDict
 
+
+def assert_uploaded(filename, roomId, mime_type='image/png'):
+    """
+    Checks the only message sent was an upload of the in memory file filename, a PNG by default
+    """
+    from queuebot.spark import CiscoSparkAPI
+    assert not CiscoSparkAPI().messages.create.called, "Too many messages sent"
+    args, kwargs = CiscoSparkAPI()._session.post.call_args
+    fields = kwargs['data'].fields
+    assert args == ('messages',) and fields['roomId'] == roomId, "Sent message not correct"
+    assert fields['files'][0] == filename and fields['files'][2] == mime_type, "Sent file not correct"
+
+
 def test_empty_data():
     with mock.patch("flask.request") as mock_api:
         flask.request.json={}
@@ -23,7 +39,8 @@ def test_empty_data():
     data=dict(mentionedPeople={1})
 )
 def test_early_exception():
-    from endpoints import CiscoSparkAPI, queue
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     og = CiscoSparkAPI.return_value
     CiscoSparkAPI.return_value = None
     try:
@@ -40,7 +57,8 @@ def test_early_exception():
     data=dict(mentionedPeople={1})
 )
 def test_early_exception_production(mock_production):
-    from endpoints import CiscoSparkAPI, queue
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     og = CiscoSparkAPI.return_value
     CiscoSparkAPI.return_value = None
     result = queue()
@@ -64,7 +82,8 @@ def test_early_exception_production(mock_production):
     }
 )
 def test_unregistered():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
     assert CiscoSparkAPI().messages.create.call_args == \
@@ -72,9 +91,9 @@ def test_unregistered():
                markdown='QueueBot is not registered to a project! Ask an admin to register this bot',
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'list'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'list'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -94,7 +113,8 @@ def test_unregistered():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_queue_status_ok():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
     assert CiscoSparkAPI().messages.create.call_args == \
@@ -107,9 +127,9 @@ def test_queue_status_ok():
                         'my social life has plumetted. But I guess I\'m:\n\n200 OK',
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'status'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'status'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -130,7 +150,8 @@ def test_queue_status_ok():
     queue=[]
 )
 def test_how_long_nonadmin_empty_queue():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
     assert CiscoSparkAPI().messages.create.call_args == \
@@ -139,9 +160,9 @@ def test_how_long_nonadmin_empty_queue():
                         'Estimated wait time from the back of the queue is:\n\n0:00:00',
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'how long'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'how long'
 
 @freeze_time("1980-01-01 12:00:00.000000")
 @with_request(data={
@@ -183,7 +204,8 @@ def test_how_long_nonadmin_empty_queue():
     }]
 )
 def test_how_long_nonadmin_nonempty_queue():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
     assert CiscoSparkAPI().messages.create.call_args == \
@@ -192,9 +214,9 @@ def test_how_long_nonadmin_nonempty_queue():
                         'Estimated wait time for "Unit Test Person" is:\n\n0:00:00',
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'how long'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'how long'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -214,7 +236,8 @@ def test_how_long_nonadmin_nonempty_queue():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_queue_help_unregistered():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     from queuebot import Bot
     import endpoints
     queue()
@@ -223,9 +246,9 @@ def test_queue_help_unregistered():
     args, kwargs =  CiscoSparkAPI().messages.create.call_args
     assert 'This bot is to be used to manage a queue for a given team.' in kwargs['markdown'], "Sent message not correct"
     assert 'Available commands are:' in kwargs['markdown'], "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'help'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'help'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -246,7 +269,8 @@ def test_queue_help_unregistered():
     random=1
 )
 def test_cat_fact():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     with mock.patch('requests.get') as mock_requests:
         foo = mock.MagicMock()
         foo.json.return_value = CAT_FACT
@@ -259,9 +283,9 @@ def test_cat_fact():
                markdown=CAT_FACT['fact'],
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'cat fact'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'cat fact'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -281,7 +305,8 @@ def test_cat_fact():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_dad_joke():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     with mock.patch('requests.get') as mock_requests:
         foo = mock.MagicMock()
         foo.json.return_value = DAD_JOKE
@@ -294,9 +319,9 @@ def test_dad_joke():
                markdown=DAD_JOKE['joke'],
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'pun'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'pun'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -316,7 +341,8 @@ def test_dad_joke():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_admin_command_by_nonadmin():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
     assert CiscoSparkAPI().messages.create.call_args == \
@@ -324,9 +350,9 @@ def test_admin_command_by_nonadmin():
                markdown='You are not registered as an admin.',
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'show admin commands'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'show admin commands'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -347,15 +373,16 @@ def test_admin_command_by_nonadmin():
     admins=['admin']
 )
 def test_admin_command_by_admin():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
     args, kwargs = CiscoSparkAPI().messages.create.call_args
     assert 'Admin commands can be used in any room' in kwargs['markdown'], "Sent message not correct"
     assert 'Available admin commands are:' in kwargs['markdown'], "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'show admin commands'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'show admin commands'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -375,7 +402,8 @@ def test_admin_command_by_admin():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_list_empty():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -384,9 +412,9 @@ def test_list_empty():
                markdown='Current queue is:\n\nThere is no one in the queue',
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'list'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'list'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -406,7 +434,8 @@ def test_list_empty():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_list_empty():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -420,9 +449,9 @@ def test_list_empty():
                         "Author: " + str(AUTHOR) + " (" + str(EMAIL) + ")",
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'about'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'about'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -455,7 +484,8 @@ def test_list_empty():
     ]
 )
 def test_list_one_member():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -467,9 +497,9 @@ def test_list_one_member():
                         'Estimated wait time from the back of the queue is:\n\n0:00:05',
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'list'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'list'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -503,7 +533,8 @@ def test_list_one_member():
     subprojects=['GENERAL', 'OTHER_SUBPROJECT']
 )
 def test_list_one_member_for_subproject():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -515,9 +546,9 @@ def test_list_one_member_for_subproject():
                         'from the back of the queue is:\n\n0:00:05',
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'list'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'list'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -554,7 +585,8 @@ def test_list_one_member_for_subproject():
     }
 )
 def test_list_no_default_subproject():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -597,7 +629,8 @@ def test_list_no_default_subproject():
     subprojects=['GENERAL', 'OTHER_SUBPROJECT'],
 )
 def test_list_invalid_subproject():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -647,7 +680,8 @@ def test_list_invalid_subproject():
         }]
 )
 def test_list_two_members():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -660,9 +694,74 @@ def test_list_two_members():
                         'Estimated wait time from the back of the queue is:\n\n0:00:05.500000',
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args
-    commands = args[0]
-    assert commands[-1]['sparkId'] == 'message-id' and commands[-1]['command'] == 'list'
+    args, kwargs = CommandLog.append.call_args
+    command = args[0]
+    assert command['sparkId'] == 'message-id' and command['command'] == 'list'
+
+
+@freeze_time("1980-01-01 12:00:00.000000")
+@with_request(data={
+      "id": "message-id",
+      "roomId": "BLAH",
+      "roomType": "direct",
+      "text": "QueueBot how long",
+      "personId": "fooid3",
+      "personEmail": "avthorn@cisco.com",
+      "html": "<p><spark-mention data-object-type=\"person\" data-object-id=\"me_id\">QueueBot</spark-mention> list</p>",
+      "mentionedPeople": [
+        "me_id"
+      ],
+      "created": "2018-04-02T14:23:08.086Z"
+    },
+    project=[('UNIT_TEST', 'BLAH')],
+    queue=[{
+        "personId": "fooid",
+        "timeEnqueued": "2018-04-06 12:34:45.678901",
+        "displayName": "Unit Test Display Name",
+        "atHeadTime": "1980-01-01 11:00:00.000000"
+    },{
+        "personId": "fooid2",
+        "timeEnqueued": "2018-04-07 12:34:45.678901",
+        "displayName": "Unit Test Display Name 2",
+        "atHeadTime": None
+    },{
+        "personId": "fooid3",
+        "timeEnqueued": "2018-04-08 12:34:45.678901",
+        "displayName": "Unit Test Display Name 3",
+        "atHeadTime": None
+    }],
+    people=[
+        {
+            'sparkId': 'fooid',
+            'timesAtHead': [2, 3],
+            'timesInQueue': [2, 3]
+        },
+        {
+            'sparkId': 'fooid2',
+            'timesAtHead': [2, 3],
+            'timesInQueue': [2, 3],
+        },
+        {
+            'sparkId': 'fooid3',
+            'displayName': 'Unit Test Display Name 3',
+            'commands': 0,
+            'timesAtHead': [10],
+            'timesInQueue': [10],
+        }]
+)
+def test_how_long_three_members():
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
+    queue()
+
+    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
+    assert CiscoSparkAPI().messages.create.call_args == \
+           mock.call(
+               markdown='Given that there are 2 people ahead of you. '
+                        'Estimated wait time for "Unit Test Display Name 3" is:\n\n0:00:05.500000',
+               roomId='BLAH'
+           ), "Sent message not correct"
+
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -695,7 +794,8 @@ def test_list_two_members():
     }
 )
 def test_add_me_empty_queue():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -708,13 +808,21 @@ def test_add_me_empty_queue():
                roomId='BLAH'
            ), "Sent message not correct"
     args, kwargs = json.dump.call_args_list[0]
-    assert 'test_add_me_empty_queue' in [i['sparkId'] for i in args[0]]
+    assert 'test_add_me_empty_queue' in args[0]
 
-    args, kwargs = json.dump.call_args_list[4]
+    args, kwargs = json.dump.call_args_list[1]
     assert 'test_add_me_empty_queue' in [i['personId'] for i in args[0]]
 
     args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'add me'
+    assert 'aggregates' not in args[0] and args[0]['historyVersion'] == 1
+
+    args, kwargs = HistoryLog.append.call_args
+    (time, depth, flush_time, diff), = args[0]
+    assert depth == 1 and flush_time == 0
+    assert [i['personId'] for i in diff[0][2]] == ['test_add_me_empty_queue']
+
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'add me'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -761,7 +869,8 @@ def test_add_me_empty_queue():
     }]
 )
 def test_add_me_one_in_queue():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -775,14 +884,14 @@ def test_add_me_one_in_queue():
                roomId='BLAH'
            ), "Sent message not correct"
     args, kwargs = json.dump.call_args_list[0]
-    assert 'test_add_me_one_in_queue' in [i['sparkId'] for i in args[0]]
+    assert 'test_add_me_one_in_queue' in args[0]
 
-    args, kwargs = json.dump.call_args_list[4]
+    args, kwargs = json.dump.call_args_list[1]
     assert len(args[0]) == 2
     assert 'test_add_me_one_in_queue' == args[0][-1]['personId']
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'add me'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'add me'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -828,7 +937,8 @@ def test_add_me_one_in_queue():
     }
 )
 def test_remove_me_one_in_queue():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -840,13 +950,13 @@ def test_remove_me_one_in_queue():
                roomId='BLAH'
            ), "Sent message not correct"
     args, kwargs = json.dump.call_args_list[0]
-    assert 'test_remove_me_one_in_queue' in [i['sparkId'] for i in args[0]]
+    assert 'test_remove_me_one_in_queue' in args[0]
 
-    args, kwargs = json.dump.call_args_list[4]
+    args, kwargs = json.dump.call_args_list[1]
     assert len(args[0]) == 0
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove me'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove me'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -898,7 +1008,8 @@ def test_remove_me_one_in_queue():
     }]
 )
 def test_remove_me_two_in_queue_me_at_head():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -912,13 +1023,13 @@ def test_remove_me_two_in_queue_me_at_head():
                roomId='BLAH'
            ), "Sent message not correct"
     args, kwargs = json.dump.call_args_list[0]
-    assert 'test_remove_me_one_in_queue' in [i['sparkId'] for i in args[0]]
+    assert 'test_remove_me_one_in_queue' in args[0]
 
-    args, kwargs = json.dump.call_args_list[4]
+    args, kwargs = json.dump.call_args_list[1]
     assert len(args[0]) == 1
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove me'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove me'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -985,7 +1096,8 @@ def test_remove_me_two_in_queue_me_at_head():
     }]
 )
 def test_remove_me_three_in_queue_me_at_head():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1000,14 +1112,18 @@ def test_remove_me_three_in_queue_me_at_head():
                roomId='BLAH'
            ), "Sent message not correct"
 
+    # The historicalData in global stats is moved into the history when it is first loaded
     args, kwargs = json.dump.call_args_list[0]
-    assert 'test_remove_me_three_in_queue_me_at_head' in [i['sparkId'] for i in args[0]]
+    assert 'historicalData' not in args[0]
 
-    args, kwargs = json.dump.call_args_list[4]
-    assert len(args[0]) == 2
+    args, kwargs = json.dump.call_args_list[1]
+    assert 'test_remove_me_three_in_queue_me_at_head' in args[0]
 
     args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove me'
+    assert len(args[0]) == 2
+
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove me'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1034,7 +1150,8 @@ def test_remove_me_three_in_queue_me_at_head():
     global_stats={'historicalData': {}}
 )
 def test_remove_me_one_in_queue_but_not_caller():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1045,10 +1162,10 @@ def test_remove_me_one_in_queue_but_not_caller():
            ), "Sent message not correct"
 
     args, kwargs = json.dump.call_args_list[0]
-    assert 'test_remove_me_one_in_queue_but_not_caller' in [i['sparkId'] for i in args[0]]
+    assert 'test_remove_me_one_in_queue_but_not_caller' in args[0]
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove me'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove me'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1076,7 +1193,8 @@ def test_remove_me_one_in_queue_but_not_caller():
     admins=['test_show_admins']
 )
 def test_show_admins():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1087,10 +1205,10 @@ def test_show_admins():
                roomId='BLAH'
            ), "Sent message not correct"
     args, kwargs = json.dump.call_args_list[0]
-    assert 'test_show_admins' in [i['sparkId'] for i in args[0]]
+    assert 'test_show_admins' in args[0]
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show admins'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show admins'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1111,7 +1229,8 @@ def test_show_admins():
     admins=['test_register_bot_by_admin']
 )
 def test_register_bot_by_admin():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1121,8 +1240,8 @@ def test_register_bot_by_admin():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'register bot to project lalala'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'register bot to project lalala'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1142,7 +1261,8 @@ def test_register_bot_by_admin():
     global_stats={'historicalData': {}}
 )
 def test_register_bot_by_nonadmin():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1151,9 +1271,9 @@ def test_register_bot_by_nonadmin():
                markdown="ERROR: project \"SHOULD_NOT_WORK\" has not been created.",
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and \
-           args[0][-1]['command'] == 'register bot to project should_not_work'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and \
+           args[0]['command'] == 'register bot to project should_not_work'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1176,7 +1296,8 @@ def test_register_bot_by_nonadmin():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_get_all_stats():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1189,9 +1310,9 @@ def test_get_all_stats():
                         "nds         |      0 seconds     \n",
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and \
-           args[0][-1]['command'] == 'show all stats as markdown'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and \
+           args[0]['command'] == 'show all stats as markdown'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1213,7 +1334,8 @@ def test_get_all_stats():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_show_registration():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 2, "Too many messages sent"
@@ -1227,8 +1349,8 @@ def test_show_registration():
                markdown="Subprojects for project \"UNIT_TEST\" are:\n\n- GENERAL (DEFAULT)\n",
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show registration'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show registration'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1258,7 +1380,8 @@ def test_show_registration():
     }]
 )
 def test_show_last_10_commands_1_command():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1269,8 +1392,8 @@ def test_show_last_10_commands_1_command():
                         "2. add me (Ava Thorn executed at 01:41:22 PM on Mon, Apr 09)\n",
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show last 10 commands'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show last 10 commands'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1300,7 +1423,8 @@ def test_show_last_10_commands_1_command():
     }] * 15
 )
 def test_show_last_10_commands_15_command():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1319,8 +1443,8 @@ def test_show_last_10_commands_15_command():
                         "10. add me (Ava Thorn executed at 01:41:22 PM on Mon, Apr 09)\n",
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show last 10 commands'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show last 10 commands'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1369,7 +1493,8 @@ def test_show_last_10_commands_15_command():
     })}
 )
 def test_add_person():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1381,7 +1506,7 @@ def test_add_person():
                         "time from the back of the queue is:\n\n0:00:00",
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args_list[5]
+    args, kwargs = json.dump.call_args_list[1]
     assert [{
                'personId': 'unit_test_person',
                'timeEnqueued': '1980-01-01 12:00:00',
@@ -1389,8 +1514,8 @@ def test_add_person():
                'atHeadTime': '1980-01-01 12:00:00'
            }] == args[0]
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'add person UNIT_TEST_PERSON'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'add person UNIT_TEST_PERSON'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1421,7 +1546,8 @@ def test_add_person():
     })}
 )
 def test_add_admin():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 2, "Too many messages sent"
@@ -1438,11 +1564,11 @@ def test_add_admin():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[4]
+    args, kwargs = json.dump.call_args_list[1]
     assert ['test_add_admin', 'unit_test_person'] == args[0]
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'add admin Unit Test Person'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'add admin Unit Test Person'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1473,7 +1599,8 @@ def test_add_admin():
     })}
 )
 def test_add_admin_already_admin():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1483,8 +1610,8 @@ def test_add_admin_already_admin():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'add admin Unit Test Person'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'add admin Unit Test Person'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1514,7 +1641,8 @@ def test_add_admin_already_admin():
     })}
 )
 def test_add_admin_no_tags():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1524,8 +1652,8 @@ def test_add_admin_no_tags():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[1]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'add admin Unit Test Person'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'add admin Unit Test Person'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1557,7 +1685,8 @@ def test_add_admin_no_tags():
     })}
 )
 def test_add_admin_2_tags():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1567,8 +1696,8 @@ def test_add_admin_2_tags():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'add admin Unit Test Person'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'add admin Unit Test Person'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1599,7 +1728,8 @@ def test_add_admin_2_tags():
     })}
 )
 def test_remove_admin():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 2, "Too many messages sent"
@@ -1615,11 +1745,11 @@ def test_remove_admin():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[4]
+    args, kwargs = json.dump.call_args_list[1]
     assert ['test_remove_admin'] == args[0]
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove admin Unit Test Person'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove admin Unit Test Person'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1650,7 +1780,8 @@ def test_remove_admin():
     })}
 )
 def test_remove_admin_not_an_admin():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1660,8 +1791,8 @@ def test_remove_admin_not_an_admin():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[1]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove admin Unit Test Person'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove admin Unit Test Person'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1693,7 +1824,8 @@ def test_remove_admin_not_an_admin():
     })}
 )
 def test_remove_admin_2_tags():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1703,8 +1835,8 @@ def test_remove_admin_2_tags():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[1]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove admin Unit Test Person'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove admin Unit Test Person'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1734,7 +1866,8 @@ def test_remove_admin_2_tags():
     })}
 )
 def test_remove_admin_no_tags():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1744,8 +1877,8 @@ def test_remove_admin_no_tags():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[1]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove admin Unit Test Person'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove admin Unit Test Person'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1813,7 +1946,8 @@ def test_remove_admin_no_tags():
     })}
 )
 def test_remove_person():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1825,7 +1959,7 @@ def test_remove_person():
                         "<@personId:ava_test_id|Ava Test>, you\'re at the front of the queue!",
                roomId='BLAH'
            ), "Sent message not correct"
-    args, kwargs = json.dump.call_args_list[4]
+    args, kwargs = json.dump.call_args_list[1]
     assert [{
         "atHeadTime": "1980-01-01 11:00:00.000000",
         "displayName": "Ava Test",
@@ -1833,8 +1967,8 @@ def test_remove_person():
         "timeEnqueued": "1980-01-01 11:00:00.000000"
     }] == args[0]
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove person UNIT_TEST_PERSON'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove person UNIT_TEST_PERSON'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1874,7 +2008,8 @@ def test_remove_person():
     })}
 )
 def test_remove_person_no_in_queue():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1884,8 +2019,8 @@ def test_remove_person_no_in_queue():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove person UNIT_TEST_PERSON'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove person UNIT_TEST_PERSON'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1918,7 +2053,8 @@ def test_remove_person_no_in_queue():
     }],
 )
 def test_remove_person_no_tags():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1928,8 +2064,8 @@ def test_remove_person_no_tags():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove person UNIT_TEST_PERSON'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove person UNIT_TEST_PERSON'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -1964,7 +2100,8 @@ def test_remove_person_no_tags():
     }],
 )
 def test_remove_person_2_tags():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -1974,8 +2111,8 @@ def test_remove_person_2_tags():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'remove person UNIT_TEST_PERSON'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'remove person UNIT_TEST_PERSON'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2004,7 +2141,8 @@ def test_remove_person_2_tags():
     }]
 )
 def test_show_people():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -2017,8 +2155,8 @@ def test_show_people():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show people'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show people'
 
 
 # @freeze_time("1980-01-01 12:00:00.000000")
@@ -2036,15 +2174,16 @@ def test_show_people():
 #     global_stats={'historicalData': {}}
 # )
 # def test_no_files_exist():
-#     from endpoints import queue, CiscoSparkAPI
+#     from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
 #     with mock.patch("os.path.exists", return_value=False):
 #         queue()
 #
 #     assert json.dump.call_args_list[1][0][0] == []
 #     assert json.dump.call_args_list[2][0][0] == {}
-#     assert len(json.dump.call_args_list[3][0][0]) == 1
+#     assert len(json.dump.call_args_list[2][0][0]) == 1
 #
-#     args, kwargs = json.dump.call_args_list[5]
+#     args, kwargs = json.dump.call_args_list[4]
 #     assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'doesnt matter'
 
 
@@ -2070,7 +2209,8 @@ def test_show_people():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_get_stats_for_commands_issued():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
     assert CiscoSparkAPI().messages.create.call_args == \
@@ -2080,8 +2220,8 @@ def test_get_stats_for_commands_issued():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show stats for commands issued'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show stats for commands issued'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2101,7 +2241,8 @@ def test_get_stats_for_commands_issued():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_get_stats_for_invalid_stat():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
     assert CiscoSparkAPI().messages.create.call_args == \
@@ -2113,8 +2254,8 @@ def test_get_stats_for_invalid_stat():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show stats for invalid stat'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show stats for invalid stat'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2133,14 +2274,15 @@ def test_get_stats_for_invalid_stat():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_nonexistent_command():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
     args, kwargs = CiscoSparkAPI().messages.create.call_args
     assert 'Unrecognized Command' in kwargs['markdown'], "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'foobar'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'foobar'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2169,7 +2311,8 @@ def test_nonexistent_command():
     })}
 )
 def test_add_person_no_tag():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -2179,8 +2322,8 @@ def test_add_person_no_tag():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'add person UNIT_TEST_PERSON'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'add person UNIT_TEST_PERSON'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2204,7 +2347,8 @@ def test_add_person_no_tag():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_add_person_2_tags():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -2214,8 +2358,8 @@ def test_add_person_2_tags():
                roomId='BLAH'
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'add person UNIT_TEST_PERSON BLAH'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'add person UNIT_TEST_PERSON BLAH'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2251,19 +2395,17 @@ def test_add_person_2_tags():
     }]
 )
 def test_get_stats_as_csv():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               markdown="Here are all the stats for subproject 'GENERAL' on project 'UNIT_TEST' as a csv",
-               roomId='BLAH',
-               files=['UNIT_TEST-GENERAL-STATISTICS.csv']
-           ), "Sent message not correct"
+    assert_uploaded('UNIT_TEST-GENERAL-STATISTICS.csv', 'BLAH', 'text/csv')
+    fields = CiscoSparkAPI()._session.post.call_args[1]['data'].fields
+    assert fields['markdown'] == "Here are all the stats for subproject 'GENERAL' on project 'UNIT_TEST' as a csv"
+    assert fields['files'][1].getvalue().decode('utf-8').startswith('PERSON,'), "Sent file not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show all stats as csv'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show all stats as csv'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2313,7 +2455,8 @@ def test_get_stats_as_csv():
     }]
 )
 def test_get_most_active_users():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -2323,8 +2466,8 @@ def test_get_most_active_users():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show most active users'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show most active users'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2354,7 +2497,8 @@ def test_get_most_active_users():
     project=[('UNIT_TEST', 'BLAH')]
 )
 def test_largest_queue_depth():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -2365,8 +2509,8 @@ def test_largest_queue_depth():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show largest queue depth'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show largest queue depth'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2396,7 +2540,8 @@ def test_largest_queue_depth():
     }]
 )
 def test_quickest_at_head_user():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -2406,8 +2551,8 @@ def test_quickest_at_head_user():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show quickest users'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show quickest users'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2435,18 +2580,89 @@ def test_quickest_at_head_user():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_average_queue_depth():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
+    assert_uploaded('get_average_queue_depth_hour_UNIT_TEST_GENERAL.png', roomId='BLAH')
+
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show average queue depth by hour'
+
+
+@freeze_time("1980-01-01 12:00:00.000000")
+@with_request(data={
+      "id": "message-id",
+      "roomId": "BLAH",
+      "roomType": "group",
+      "text": "QueueBot show p90 flush time by hour",
+      "personId": "test_show_p90_flush_time",
+      "personEmail": "avthorn@cisco.com",
+      "html": "<p><spark-mention data-object-type=\"person\" data-object-id=\"me_id\">QueueBot</spark-mention> list</p>",
+      "mentionedPeople": [
+        "me_id"
+      ],
+      "created": "2018-04-02T14:23:08.086Z"
+    },
+    history=[(315576000.0 + i * 60, 1, i * 60.0, []) for i in range(11)],
+    admins=['test_show_p90_flush_time'],
+    project=[('UNIT_TEST', 'BLAH')],
+)
+def test_show_p90_flush_time():
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
+    with mock.patch('matplotlib.axes.Axes.plot') as plot:
+        queue()
+
+    assert_uploaded('get_p90_flush_time_hour_UNIT_TEST_GENERAL.png', roomId='BLAH')
+    hours, values = plot.call_args[0][:2]
+    assert max(values) == 540 and sum(values) == 540
+
+    # The history hasn't changed, so the chart isn't rendered again
+    from queuebot import CHART_CACHE
+    flask.request.json['data']['id'] = 'message-id-2'
+    with mock.patch('matplotlib.axes.Axes.plot') as plot:
+        queue()
+    assert plot.call_count == 0 and len(CiscoSparkAPI()._session.post.call_args_list) == 2
+    assert CHART_CACHE.statistics()['hits'] == 1 and CHART_CACHE.statistics()['misses'] == 1
+
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show p90 flush time by hour'
+
+
+@freeze_time("1980-01-01 12:00:00.000000")
+@with_request(data={
+      "id": "message-id",
+      "roomId": "BLAH",
+      "roomType": "group",
+      "text": "QueueBot show average queue depth by day",
+      "personId": "test_show_chart_as_table_when_rendering_fails",
+      "personEmail": "avthorn@cisco.com",
+      "html": "<p><spark-mention data-object-type=\"person\" data-object-id=\"me_id\">QueueBot</spark-mention> list</p>",
+      "mentionedPeople": [
+        "me_id"
+      ],
+      "created": "2018-04-02T14:23:08.086Z"
+    },
+    history=[(datetime.datetime(1980, 1, 1, 12).timestamp(), 3, 60.0, [])],
+    admins=['test_show_chart_as_table_when_rendering_fails'],
+    project=[('UNIT_TEST', 'BLAH')],
+)
+def test_show_chart_as_table_when_rendering_fails():
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
+    from queuebot import CHART_CACHE, CHART_RENDERER
+    with mock.patch('queuebot.charts.render_line_graph', side_effect=RuntimeError('No fonts')):
+        queue()
+
     assert CiscoSparkAPI().messages.create.call_args == \
            mock.call(
-               files=['get_average_queue_depth_hour_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
+               markdown="**Average Queue Depth by Day for 'UNIT_TEST' on subproject 'GENERAL'**\n\n```\n"
+                        "Monday     0.00\nTuesday    3.00\nWednesday  0.00\nThursday   0.00\nFriday     0.00\n"
+                        "Saturday   0.00\nSunday     0.00\n```",
+               roomId='BLAH'
            ), "Sent message not correct"
-
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show average queue depth by hour'
+    assert CHART_RENDERER.statistics()['failed'] == 1 and CHART_CACHE.statistics()['cached'] == 0
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2473,18 +2689,14 @@ def test_show_average_queue_depth():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_average_queue_depth_day():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               files=['get_average_queue_depth_day_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
-           ), "Sent message not correct"
+    assert_uploaded('get_average_queue_depth_day_UNIT_TEST_GENERAL.png', roomId='BLAH')
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show average queue depth by day'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show average queue depth by day'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2511,18 +2723,14 @@ def test_show_average_queue_depth_day():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_min_queue_depth_day():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               files=['get_min_queue_depth_day_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
-           ), "Sent message not correct"
+    assert_uploaded('get_min_queue_depth_day_UNIT_TEST_GENERAL.png', roomId='BLAH')
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show min queue depth by day'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show min queue depth by day'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2549,18 +2757,14 @@ def test_show_min_queue_depth_day():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_max_queue_depth_day():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               files=['get_max_queue_depth_day_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
-           ), "Sent message not correct"
+    assert_uploaded('get_max_queue_depth_day_UNIT_TEST_GENERAL.png', roomId='BLAH')
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show max queue depth by day'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show max queue depth by day'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2593,18 +2797,14 @@ def test_show_max_queue_depth_day():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_max_flush_time_day():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               files=['get_max_flush_time_day_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
-           ), "Sent message not correct"
+    assert_uploaded('get_max_flush_time_day_UNIT_TEST_GENERAL.png', roomId='BLAH')
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show max flush time by day'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show max flush time by day'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2637,18 +2837,14 @@ def test_show_max_flush_time_day():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_min_flush_time_day():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               files=['get_min_flush_time_day_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
-           ), "Sent message not correct"
+    assert_uploaded('get_min_flush_time_day_UNIT_TEST_GENERAL.png', roomId='BLAH')
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show min flush time by day'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show min flush time by day'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2681,18 +2877,14 @@ def test_show_min_flush_time_day():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_average_flush_time_day():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               files=['get_average_flush_time_day_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
-           ), "Sent message not correct"
+    assert_uploaded('get_average_flush_time_day_UNIT_TEST_GENERAL.png', roomId='BLAH')
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show average flush time by day'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show average flush time by day'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2717,18 +2909,14 @@ def test_show_average_flush_time_day():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_max_queue_depth():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               files=['get_max_queue_depth_hour_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
-           ), "Sent message not correct"
+    assert_uploaded('get_max_queue_depth_hour_UNIT_TEST_GENERAL.png', roomId='BLAH')
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show max queue depth by hour'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show max queue depth by hour'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2753,18 +2941,14 @@ def test_show_max_queue_depth():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_min_queue_depth():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               files=['get_min_queue_depth_hour_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
-           ), "Sent message not correct"
+    assert_uploaded('get_min_queue_depth_hour_UNIT_TEST_GENERAL.png', roomId='BLAH')
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show min queue depth by hour'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show min queue depth by hour'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2789,18 +2973,14 @@ def test_show_min_queue_depth():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_min_flush_time():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               files=['get_min_flush_time_hour_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
-           ), "Sent message not correct"
+    assert_uploaded('get_min_flush_time_hour_UNIT_TEST_GENERAL.png', roomId='BLAH')
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show min flush time by hour'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show min flush time by hour'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2825,18 +3005,14 @@ def test_show_min_flush_time():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_max_flush_time():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               files=['get_max_flush_time_hour_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
-           ), "Sent message not correct"
+    assert_uploaded('get_max_flush_time_hour_UNIT_TEST_GENERAL.png', roomId='BLAH')
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show max flush time by hour'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show max flush time by hour'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2874,18 +3050,14 @@ def test_show_max_flush_time():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_average_flush_time():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
-    assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
-    assert CiscoSparkAPI().messages.create.call_args == \
-           mock.call(
-               files=['get_average_flush_time_hour_UNIT_TEST_GENERAL.png'],
-               roomId='BLAH',
-           ), "Sent message not correct"
+    assert_uploaded('get_average_flush_time_hour_UNIT_TEST_GENERAL.png', roomId='BLAH')
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show average flush time by hour'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show average flush time by hour'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2907,7 +3079,8 @@ def test_show_average_flush_time():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_version_number():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -2917,8 +3090,8 @@ def test_show_version_number():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show version'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show version'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2940,7 +3113,8 @@ def test_show_version_number():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_release_notes():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     from app import RELEASE_NOTES
     r_notes = json.load(open(RELEASE_NOTES))
     message = ''
@@ -2955,8 +3129,8 @@ def test_show_release_notes():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show all release notes'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show all release notes'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -2978,7 +3152,8 @@ def test_show_release_notes():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_release_notes_for_valid():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     from app import RELEASE_NOTES
     notes = json.load(open(RELEASE_NOTES))
     message = '\n\n**1.1.0**\n\n' + notes['1.1.0']
@@ -2991,8 +3166,8 @@ def test_show_release_notes_for_valid():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[1]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show release notes for 1.1.0'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show release notes for 1.1.0'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3014,7 +3189,8 @@ def test_show_release_notes_for_valid():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_release_notes_for_invalid():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     from app import RELEASE_NOTES
     notes = json.load(open(RELEASE_NOTES))
     message = '"invalid.number" is not a valid release. Please use one of:\n\n- ' + '\n- '.join(notes.keys())
@@ -3027,8 +3203,8 @@ def test_show_release_notes_for_invalid():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show release notes for invalid.number'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show release notes for invalid.number'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3050,7 +3226,8 @@ def test_show_release_notes_for_invalid():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_projects_not_global_admin():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3060,8 +3237,8 @@ def test_show_projects_not_global_admin():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show projects'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show projects'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3083,7 +3260,8 @@ def test_show_projects_not_global_admin():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_show_projects_is_global_admin():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3093,8 +3271,8 @@ def test_show_projects_is_global_admin():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show projects'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show projects'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3120,7 +3298,8 @@ def test_show_projects_is_global_admin():
     queue=[{}] * QUEUE_THRESHOLD
 )
 def test_add_me_queue_at_max():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3130,8 +3309,8 @@ def test_add_me_queue_at_max():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'add me'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'add me'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3158,7 +3337,8 @@ def test_add_me_queue_at_max():
     queue=[{}] * QUEUE_THRESHOLD
 )
 def test_add_person_queue_at_max():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3168,8 +3348,8 @@ def test_add_person_queue_at_max():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'add person UNIT_TEST_PERSON'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'add person UNIT_TEST_PERSON'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3190,7 +3370,8 @@ def test_add_person_queue_at_max():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_create_new_project():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 2, "Too many messages sent"
@@ -3205,11 +3386,11 @@ def test_create_new_project():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[7]
+    args, kwargs = json.dump.call_args_list[1]
     assert tuple(['FOOBAR', 'BLAH']) in args[0]
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'create new project foobar'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'create new project foobar'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3230,7 +3411,8 @@ def test_create_new_project():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_delete_project():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3241,11 +3423,12 @@ def test_delete_project():
            ), "Sent message not correct"
 
 
-    args, kwargs = json.dump.call_args_list[3]
+    args, kwargs = json.dump.call_args_list[0]
     assert [] == args[0]
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'delete project'
+    # The project's data, including the pending command, is deleted before the request is flushed
+    assert len(json.dump.call_args_list) == 1
+    assert not CommandLog.append.called
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3266,7 +3449,8 @@ def test_delete_project():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_list_queue_all_subprojects_only_general():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3278,8 +3462,8 @@ def test_list_queue_all_subprojects_only_general():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'list for all subprojects'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'list for all subprojects'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3301,7 +3485,8 @@ def test_list_queue_all_subprojects_only_general():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_list_queue_all_subprojects_two_subprojects():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     messages = [
@@ -3318,8 +3503,8 @@ def test_list_queue_all_subprojects_two_subprojects():
     assert CiscoSparkAPI().messages.create.call_args_list[0][1]['markdown'] in messages, "Sent message not correct"
     assert CiscoSparkAPI().messages.create.call_args_list[1][1]['markdown'] in messages, "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'list for all subprojects'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'list for all subprojects'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3344,7 +3529,8 @@ def test_list_queue_all_subprojects_two_subprojects():
     }
 )
 def test_show_strict_regex_true():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3354,8 +3540,8 @@ def test_show_strict_regex_true():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show strict regex'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show strict regex'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3380,7 +3566,8 @@ def test_show_strict_regex_true():
     }
 )
 def test_show_strict_regex_false():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3390,8 +3577,8 @@ def test_show_strict_regex_false():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show strict regex'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show strict regex'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3416,7 +3603,8 @@ def test_show_strict_regex_false():
     }
 )
 def test_set_strict_regex_to_true():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3426,8 +3614,8 @@ def test_set_strict_regex_to_true():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'set strict regex to true'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'set strict regex to true'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3452,7 +3640,8 @@ def test_set_strict_regex_to_true():
     }
 )
 def test_set_strict_regex_to_false():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3462,8 +3651,8 @@ def test_set_strict_regex_to_false():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'set strict regex to false'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'set strict regex to false'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3485,7 +3674,8 @@ def test_set_strict_regex_to_false():
     random=0.01
 )
 def test_pun_easter_rejection():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3495,8 +3685,8 @@ def test_pun_easter_rejection():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'pun'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'pun'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3518,7 +3708,8 @@ def test_pun_easter_rejection():
     random=0.01
 )
 def test_cat_easter_rejection():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3528,8 +3719,8 @@ def test_cat_easter_rejection():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'cat fact'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'cat fact'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3550,7 +3741,8 @@ def test_cat_easter_rejection():
     project=[],
 )
 def test_admin_command_unregistered():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3560,8 +3752,8 @@ def test_admin_command_unregistered():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'show admins'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'show admins'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3582,7 +3774,8 @@ def test_admin_command_unregistered():
     project=[('UNIT_TEST', 'BLAH')],
 )
 def test_create_new_subproject():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     import os
     queue()
 
@@ -3594,14 +3787,14 @@ def test_create_new_subproject():
            ), "Sent message not correct"
     assert CiscoSparkAPI().messages.create.call_args_list[1] == \
            mock.call(
-               markdown='Subprojects for project "UNIT_TEST" are:\n\n- GENERAL (DEFAULT)\n',
+               markdown='Subprojects for project "UNIT_TEST" are:\n\n- FOOBAR\n- GENERAL (DEFAULT)\n',
                roomId='BLAH',
            ), "Sent message not correct"
 
     assert 'queuebot/data/UNIT_TEST/FOOBAR' in [i[0][0] for i in os.makedirs.call_args_list]
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'create new subproject foobar'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'create new subproject foobar'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3623,7 +3816,8 @@ def test_create_new_subproject():
     subprojects=['GENERAL', 'FOOBAR']
 )
 def test_delete_subproject():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     import shutil
     queue()
 
@@ -3635,14 +3829,14 @@ def test_delete_subproject():
            ), "Sent message not correct"
     assert CiscoSparkAPI().messages.create.call_args_list[1] == \
            mock.call(
-               markdown='Subprojects for project "UNIT_TEST" are:\n\n- FOOBAR\n- GENERAL (DEFAULT)\n',
+               markdown='Subprojects for project "UNIT_TEST" are:\n\n- GENERAL (DEFAULT)\n',
                roomId='BLAH',
            ), "Sent message not correct"
 
     assert 'queuebot/data/UNIT_TEST/FOOBAR' == shutil.rmtree.call_args[0][0]
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'delete subproject foobar'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'delete subproject foobar'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3664,7 +3858,8 @@ def test_delete_subproject():
     subprojects=['GENERAL', 'FOOBAR']
 )
 def test_delete_default_subproject():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     import shutil
     queue()
 
@@ -3677,8 +3872,8 @@ def test_delete_default_subproject():
 
     assert not shutil.rmtree.called
 
-    args, kwargs = json.dump.call_args_list[1]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'delete subproject general'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'delete subproject general'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3700,7 +3895,8 @@ def test_delete_default_subproject():
     subprojects=['GENERAL', 'FOOBAR']
 )
 def test_set_default_to_already_set():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3710,8 +3906,8 @@ def test_set_default_to_already_set():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'change default subproject to general'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'change default subproject to general'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3733,7 +3929,8 @@ def test_set_default_to_already_set():
     subprojects=['GENERAL', 'FOOBAR']
 )
 def test_change_default_subproject_valid():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 2, "Too many messages sent"
@@ -3748,11 +3945,11 @@ def test_change_default_subproject_valid():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[3]
+    args, kwargs = json.dump.call_args_list[1]
     assert args[0]['default_subproject'] == 'FOOBAR'
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'change default subproject to foobar'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'change default subproject to foobar'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3774,7 +3971,8 @@ def test_change_default_subproject_valid():
     subprojects=['GENERAL', 'FOOBAR']
 )
 def test_change_default_subproject_invalid():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3784,8 +3982,8 @@ def test_change_default_subproject_invalid():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'change default subproject to invalid'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'change default subproject to invalid'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3807,7 +4005,8 @@ def test_change_default_subproject_invalid():
     subprojects=['GENERAL', 'FOOBAR']
 )
 def test_register_bot_to_valid_project():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3817,10 +4016,10 @@ def test_register_bot_to_valid_project():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    assert ('VALID', 'BLAH') in json.dump.call_args_list[3][0][0]
+    assert ('VALID', 'BLAH') in json.dump.call_args_list[0][0][0]
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'register bot to project valid'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'register bot to project valid'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3840,7 +4039,8 @@ def test_register_bot_to_valid_project():
     project=[('VALID', 'OTHERROOM')]
 )
 def test_register_bot_to_valid_project_not_admin():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3850,8 +4050,8 @@ def test_register_bot_to_valid_project_not_admin():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'register bot to project valid'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'register bot to project valid'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3873,7 +4073,8 @@ def test_register_bot_to_valid_project_not_admin():
     subprojects=['GENERAL', 'FOOBAR']
 )
 def test_register_bot_already_registered():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3883,8 +4084,8 @@ def test_register_bot_already_registered():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'register bot to project unit_test'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'register bot to project unit_test'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3905,7 +4106,8 @@ def test_register_bot_already_registered():
     project=[('UNIT_TEST', 'OTHERROOM')]
 )
 def test_delete_project_unregistered():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3915,8 +4117,8 @@ def test_delete_project_unregistered():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'delete project'
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'delete project'
 
 
 @freeze_time("1980-01-01 12:00:00.000000")
@@ -3937,7 +4139,8 @@ def test_delete_project_unregistered():
     project=[('UNIT_TEST', 'OTHERROOM')]
 )
 def test_create_project_already_exists():
-    from endpoints import queue, CiscoSparkAPI
+    from endpoints import queue
+    from queuebot.spark import CiscoSparkAPI
     queue()
 
     assert len(CiscoSparkAPI().messages.create.call_args_list) == 1, "Too many messages sent"
@@ -3947,5 +4150,5 @@ def test_create_project_already_exists():
                roomId='BLAH',
            ), "Sent message not correct"
 
-    args, kwargs = json.dump.call_args_list[2]
-    assert args[0][-1]['sparkId'] == 'message-id' and args[0][-1]['command'] == 'create new project UNIT_TEST'
\ No newline at end of file
+    args, kwargs = CommandLog.append.call_args
+    assert args[0]['sparkId'] == 'message-id' and args[0]['command'] == 'create new project UNIT_TEST'
\ No newline at end of file
@@ -0,0 +1,33 @@
+from queuebot.enum import TIER
+from queuebot.router import CommandRouter
+
+router = CommandRouter([
+    (TIER.GLOBAL_ADMIN, {'show projects': 'show_projects'}),
+    (TIER.ADMIN, {
+        'show last (\d*) commands': 'show_command_history',
+        'show (average|max|min) (queue depth|flush time) by (hour|day)': 'get_aggregate_stat_unit',
+        'add person (.*)': 'add_person'
+    }),
+    (TIER.USER, {
+        'add me': 'add_me',
+        'list': 'list_queue',
+        'list for all subprojects': 'list_queue_all_subprojects'
+    })
+])
+
+
+def test_route_strict():
+    assert router.route('Add Me', strict=True) == ('add_me', TIER.USER, ())
+    assert router.route('list for all subprojects', strict=True) == ('list_queue_all_subprojects', TIER.USER, ())
+    assert router.route('show last 10 commands', strict=True) == ('show_command_history', TIER.ADMIN, ('10',))
+    assert router.route('show max flush time by day', strict=True) == \
+        ('get_aggregate_stat_unit', TIER.ADMIN, ('max', 'flush time', 'day'))
+    assert router.route('please add me', strict=True) == (None, TIER.NONE, ())
+
+
+def test_route_non_strict_uses_first_pattern_found_anywhere():
+    assert router.route('please add me') == ('add_me', TIER.USER, ())
+    assert router.route('list for all subprojects') == ('list_queue', TIER.USER, ())
+    assert router.route('add person list') == ('add_person', TIER.ADMIN, ('list',))
+    assert router.route('show projects and list') == ('show_projects', TIER.GLOBAL_ADMIN, ())
+    assert router.route('nothing to see here') == (None, TIER.NONE, ())
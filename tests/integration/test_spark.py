@@ -0,0 +1,80 @@
+import pytest
+import threading
+import time
+
+from unittest import mock
+from ciscosparkapi import CiscoSparkAPI, SparkApiError
+from queuebot import spark
+
+
+def test_get_me_is_fetched_once_per_client(fake_spark):
+    spark.reset()
+    with mock.patch('queuebot.spark.SPARK_BASE_URL', fake_spark.url):
+        api = spark.get_api('token')
+
+        for i in range(5):
+            assert spark.get_me(api).displayName == 'QueueBot'
+        assert fake_spark.count('GET', '/v1/people/me') == 1
+
+        fake_spark.people['me_id'] = dict(fake_spark.people['me_id'], displayName='RenamedBot')
+        assert spark.get_me(api).displayName == 'QueueBot'
+        assert spark.get_me(api, refresh=True).displayName == 'RenamedBot'
+        assert spark.get_me(api).displayName == 'RenamedBot'
+        assert fake_spark.count('GET', '/v1/people/me') == 2
+
+
+def test_get_api_is_shared_across_threads_and_reuses_connections(fake_spark):
+    spark.reset()
+    clients = []
+    with mock.patch('queuebot.spark.SPARK_BASE_URL', fake_spark.url):
+        threads = [threading.Thread(target=lambda: clients.append(spark.get_api('token'))) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(set(id(i) for i in clients)) == 1
+        assert spark.get_api('other-token') is not clients[0]
+
+        for i in range(3):
+            clients[0].people.get('me_id')
+        assert fake_spark.count('GET', '/v1/people/me_id') == 3
+        assert len(fake_spark.connections) == 1
+
+
+def test_people_directory_caches_records_and_unknown_ids(fake_spark):
+    fake_spark.people['a'] = {'id': 'a', 'displayName': 'A'}
+    fake_spark.people['b'] = {'id': 'b', 'displayName': 'B'}
+    directory = spark.PeopleDirectory(CiscoSparkAPI('token', base_url=fake_spark.url), size=1, ttl=60, negative_ttl=60)
+
+    assert directory.get('a').displayName == 'A'
+    assert directory.get('a').displayName == 'A'
+    assert fake_spark.count('GET', '/v1/people/a') == 1
+
+    for i in range(2):
+        with pytest.raises(SparkApiError):
+            directory.get('missing')
+    assert fake_spark.count('GET', '/v1/people/missing') == 1
+
+    # 'missing' pushed 'a' out of the single slot
+    directory.get('a')
+    assert fake_spark.count('GET', '/v1/people/a') == 2
+
+    with mock.patch('time.time', return_value=time.time() + 120):
+        directory.get('a')
+    assert fake_spark.count('GET', '/v1/people/a') == 3
+    assert directory.hits == 2 and directory.misses == 4
+
+
+def test_prefetch_people_uses_one_request_per_batch(fake_spark):
+    for i in range(100):
+        fake_spark.people[str(i)] = {'id': str(i), 'displayName': 'Person ' + str(i)}
+    api = CiscoSparkAPI('token', base_url=fake_spark.url)
+    spark.reset()
+
+    spark.prefetch_people(api, [str(i) for i in range(100)])
+    assert fake_spark.count('GET', '/v1/people') == 2
+
+    assert [spark.get_person(api, str(i)).displayName for i in range(100)] == ['Person ' + str(i) for i in range(100)]
+    spark.prefetch_people(api, [str(i) for i in range(100)])
+    assert len(fake_spark.requests) == 2
@@ -0,0 +1,95 @@
+import datetime
+import json
+
+from unittest import mock
+
+from queuebot.staleness import StalenessScheduler, WarningStore
+
+DAY = datetime.timedelta(days=1)
+
+
+@mock.patch('queuebot.staleness.get_dispatcher')
+@mock.patch('queuebot.staleness.ProjectManager')
+def test_projects_are_only_checked_when_a_warning_is_due(ProjectManager, get_dispatcher, tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join('queuebot', 'data', 'P').ensure(dir=True)
+    last = datetime.datetime(1980, 1, 1, 12)
+    manager = ProjectManager.return_value
+    manager.get_projects.return_value = {'P'}
+    manager.get_rooms.return_value = ['room']
+    manager.get_last_command_time.side_effect = lambda project: last
+    send = get_dispatcher.return_value.send
+
+    staleness = StalenessScheduler(None, warnings=WarningStore('warnings.json'))
+    staleness.record_activity('P', last)
+    assert staleness.run_pending(last + 6 * DAY) == last + 7 * DAY + datetime.timedelta(microseconds=1)
+    assert staleness.checks == 0
+
+    staleness.run_pending(last + 7 * DAY + datetime.timedelta(seconds=1))
+    assert send.call_args[1]['markdown'].startswith('Project "P" hasn\'t been used for a week.')
+    staleness.run_pending(last + 8 * DAY)
+    assert staleness.checks == 1 and send.call_count == 1
+
+    # Only the latest warning is sent when several were missed
+    staleness.run_pending(last + 22 * DAY)
+    assert 'It is stale' in send.call_args[1]['markdown']
+    assert staleness.checks == 2 and send.call_count == 2
+    assert json.load(open('warnings.json')) == {'P': ['final', 'first']}
+    assert staleness.run_pending(last + 100 * DAY) is None
+
+    # A command on a warned project resets its warnings
+    last = datetime.datetime.now()
+    staleness.record_activity('P', last)
+    staleness.run_pending()
+    assert json.load(open('warnings.json')) == {}
+    assert staleness.run_pending() == last + 7 * DAY + datetime.timedelta(microseconds=1)
+
+
+@mock.patch('queuebot.staleness.get_dispatcher')
+@mock.patch('queuebot.staleness.ProjectManager')
+def test_command_in_a_request_resets_warnings_before_it_is_saved(ProjectManager, get_dispatcher, tmpdir,
+                                                                  monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    last = datetime.datetime.now() - 30 * DAY
+    manager = ProjectManager.return_value
+    manager.get_projects.return_value = {'P'}
+    manager.get_rooms.return_value = ['room']
+    # The request's unit of work hasn't been flushed, so the stored last command time is still the old one
+    manager.get_last_command_time.side_effect = lambda project: last
+    store = WarningStore('warnings.json')
+    store.set('P', {'first': True, 'second': True, 'third': True, 'final': True})
+
+    staleness = StalenessScheduler(None, warnings=store)
+    staleness.record_activity('P', last)
+    assert staleness.run_pending() is None
+
+    now = datetime.datetime.now()
+    staleness.record_activity('P', now)
+    assert staleness.run_pending() == now + 7 * DAY + datetime.timedelta(microseconds=1)
+    assert not any(store.get('P').values())
+
+    # The project is warned again once it goes unused
+    staleness.run_pending(now + 8 * DAY)
+    assert get_dispatcher.return_value.send.call_args[1]['markdown'].startswith('Project "P" hasn\'t been used for')
+
+
+def test_warning_store_writes_only_changes(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join('queuebot', 'data', 'OLD', 'warnings.json').write(
+        json.dumps({'first': True, 'second': False, 'third': False, 'final': False}), ensure=True)
+    store = WarningStore(str(tmpdir.join('warnings.json')))
+
+    assert store.get('OLD')['first'] and not store.get('OLD')['second']
+    assert not tmpdir.join('queuebot', 'data', 'OLD', 'warnings.json').check()
+    assert not any(store.get('NEW').values())
+
+    store.set('NEW', {'first': False})
+    store.set('OLD', {'first': True, 'second': False})
+    assert store.writes == 1
+
+    store.set('NEW', {'first': True, 'second': True})
+    assert json.load(tmpdir.join('warnings.json')) == {'NEW': ['first', 'second'], 'OLD': ['first']}
+    store.forget('OLD')
+    assert WarningStore(str(tmpdir.join('warnings.json'))).get('NEW') == \
+        {'first': True, 'second': True, 'third': False, 'final': False}
+    assert json.load(tmpdir.join('warnings.json')) == {'NEW': ['first', 'second']}
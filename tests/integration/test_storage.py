@@ -0,0 +1,118 @@
+import pytest
+
+from unittest import mock
+
+from queuebot.people import PeopleManager
+from queuebot.storage import JsonStorage, SqliteStorage, Storage, UnitOfWork
+
+
+def test_sqlite_round_trip(tmpdir):
+    storage = SqliteStorage(str(tmpdir.join('queuebot.db')))
+
+    storage.save_people('UNIT_TEST', 'GENERAL', {'a': {'sparkId': 'a', 'commands': 0}, 'b': {'sparkId': 'b', 'commands': 0}})
+    storage.save_person('UNIT_TEST', 'GENERAL', {'sparkId': 'a', 'commands': 1})
+    storage.save_person('UNIT_TEST', 'GENERAL', {'sparkId': 'c', 'commands': 0})
+    people = storage.get_people('UNIT_TEST', 'GENERAL')
+    assert list(people) == ['a', 'b', 'c']
+    assert people['a'] == {'sparkId': 'a', 'commands': 1}
+    assert storage.get_people('UNIT_TEST', 'OTHER') == {}
+
+    storage.save_queue('UNIT_TEST', 'GENERAL', [{'personId': 'b'}, {'personId': 'a'}])
+    assert storage.get_queue('UNIT_TEST', 'GENERAL') == [{'personId': 'b'}, {'personId': 'a'}]
+
+    storage.add_command('UNIT_TEST', 'GENERAL', {'command': 'add me', 'timeIssued': '1980-01-01 12:00:00'})
+    storage.add_command('UNIT_TEST', 'GENERAL', {'command': 'list', 'timeIssued': '1980-01-01 12:00:01'})
+    assert [i['command'] for i in storage.get_commands('UNIT_TEST', 'GENERAL')] == ['add me', 'list']
+
+    storage.save_admins('UNIT_TEST', ['a', 'b'])
+    assert storage.get_admins('UNIT_TEST') == ['a', 'b']
+
+    storage.save_settings('UNIT_TEST', {'default_subproject': 'GENERAL', 'strict_regex': True})
+    assert storage.get_settings('UNIT_TEST') == {'default_subproject': 'GENERAL', 'strict_regex': True}
+
+    assert storage.get_global_stats('UNIT_TEST', 'GENERAL') is None
+    storage.save_global_stats('UNIT_TEST', 'GENERAL', {'largestQueueDepth': -1})
+    assert storage.get_global_stats('UNIT_TEST', 'GENERAL') == {'largestQueueDepth': -1}
+
+
+def test_last_activity_follows_added_commands(tmpdir):
+    engine = SqliteStorage(str(tmpdir.join('queuebot.db')))
+    assert engine.get_last_activity('UNIT_TEST') is None
+
+    engine.add_command('UNIT_TEST', 'GENERAL', {'command': 'add me', 'timeIssued': '1980-01-01 12:00:00'})
+    engine.add_command('UNIT_TEST', 'OTHER', {'command': 'list', 'timeIssued': '1980-01-02 12:00:00'})
+    assert engine.get_last_activity('UNIT_TEST') == '1980-01-02 12:00:00'
+
+    work = UnitOfWork(engine)
+    work.add_command('UNIT_TEST', 'GENERAL', {'command': 'list', 'timeIssued': '1980-01-03 12:00:00'})
+    assert work.get_last_activity('UNIT_TEST') == '1980-01-03 12:00:00'
+    assert engine.get_last_activity('UNIT_TEST') == '1980-01-02 12:00:00'
+    work.flush()
+    assert engine.get_last_activity('UNIT_TEST') == '1980-01-03 12:00:00'
+
+    engine.delete_project('UNIT_TEST')
+    assert engine.get_last_activity('UNIT_TEST') is None
+
+
+def test_sqlite_delete_project(tmpdir):
+    storage = SqliteStorage(str(tmpdir.join('queuebot.db')))
+    storage.save_people('UNIT_TEST', 'GENERAL', {'a': {'sparkId': 'a'}})
+    storage.save_admins('UNIT_TEST', ['a'])
+    storage.save_admins('OTHER', ['b'])
+
+    storage.delete_project('UNIT_TEST')
+
+    assert storage.get_people('UNIT_TEST', 'GENERAL') == {}
+    assert storage.get_admins('UNIT_TEST') == []
+    assert storage.get_admins('OTHER') == ['b']
+
+
+def test_unit_of_work_caches_reads_and_defers_writes(tmpdir):
+    engine = SqliteStorage(str(tmpdir.join('queuebot.db')))
+    engine.save_people('UNIT_TEST', 'GENERAL', {'a': {'sparkId': 'a', 'commands': 0}, 'b': {'sparkId': 'b', 'commands': 0}})
+    work = UnitOfWork(engine)
+
+    person = work.get_people('UNIT_TEST', 'GENERAL')['a']
+    person['commands'] = 1
+    work.save_person('UNIT_TEST', 'GENERAL', person)
+    work.add_command('UNIT_TEST', 'GENERAL', {'command': 'list', 'timeIssued': '1980-01-01 12:00:00'})
+
+    assert work.get_people('UNIT_TEST', 'GENERAL')['a']['commands'] == 1
+    assert work.get_last_commands('UNIT_TEST', 'GENERAL', 1)[0]['command'] == 'list'
+    assert work.misses == 1 and work.hits == 2
+    assert engine.get_people('UNIT_TEST', 'GENERAL')['a']['commands'] == 0
+    assert engine.get_commands('UNIT_TEST', 'GENERAL') == []
+
+    work.flush()
+
+    assert engine.get_people('UNIT_TEST', 'GENERAL') == {'a': {'sparkId': 'a', 'commands': 1}, 'b': {'sparkId': 'b', 'commands': 0}}
+    assert [i['command'] for i in engine.get_commands('UNIT_TEST', 'GENERAL')] == ['list']
+
+
+def test_people_manager_finds_people_by_email_or_display_name(tmpdir):
+    engine = SqliteStorage(str(tmpdir.join('queuebot.db')))
+    engine.save_people('UNIT_TEST', 'GENERAL', {
+        'a': {'sparkId': 'a', 'email': 'a@example.com', 'displayName': 'Unit Test'},
+        'b': {'sparkId': 'b', 'email': 'b@example.com', 'displayName': 'Unit Test'},
+        'c': {'sparkId': 'c', 'email': 'c@example.com', 'displayName': 'Other Person'}
+    })
+
+    with mock.patch('queuebot.people.get_storage', return_value=engine):
+        people = PeopleManager(mock.Mock(), 'UNIT_TEST', 'GENERAL')
+
+    assert people.get_person('c')['email'] == 'c@example.com'
+    assert people.get_person('missing') == {}
+    assert people.find_person('A@Example.com')['sparkId'] == 'a'
+    assert people.find_person('other person')['sparkId'] == 'c'
+    assert people.find_person('Unit Test') == {}
+    assert [i['sparkId'] for i in people.get_people()] == ['a', 'b', 'c']
+
+
+def test_engines_must_implement_the_whole_interface():
+    JsonStorage()
+
+    class PartialStorage(JsonStorage):
+        get_history = Storage.get_history
+
+    with pytest.raises(TypeError):
+        PartialStorage()
@@ -0,0 +1,128 @@
+import json
+import threading
+import time
+
+from unittest import mock
+from queuebot.workers import WebhookWorkers
+
+
+def test_events_for_a_room_are_handled_in_order():
+    handled = []
+    workers = WebhookWorkers(lambda event: handled.append((event['roomId'], event['id'])), workers=3, size=300)
+
+    for i in range(50):
+        for room in ['a', 'b', 'c', 'd']:
+            assert workers.submit({'roomId': room, 'id': i})
+    workers.join()
+
+    for room in ['a', 'b', 'c', 'd']:
+        assert [i[1] for i in handled if i[0] == room] == list(range(50))
+    statistics = workers.statistics()
+    assert statistics['processed'] == 200 and statistics['depth'] == 0 and statistics['dropped'] == 0
+
+
+def test_events_for_a_project_are_handled_in_order_across_its_rooms():
+    projects = {'a1': 'A', 'a2': 'A', 'b1': 'B', 'b2': 'B'}
+    handled = []
+    workers = WebhookWorkers(lambda event: handled.append(event), workers=4, size=400,
+                             key=lambda event: projects[event['roomId']])
+
+    for i in range(50):
+        for room in sorted(projects):
+            assert workers.submit({'roomId': room, 'id': i})
+    workers.join()
+
+    for project in ['A', 'B']:
+        assert [(i['id'], i['roomId']) for i in handled if projects[i['roomId']] == project] == \
+            [(i, room) for i in range(50) for room in sorted(projects) if projects[room] == project]
+
+
+def test_requests_for_a_project_never_overlap():
+    import endpoints
+    running, overlaps = set(), []
+
+    class SlowBot:
+        def __init__(self, api, data):
+            self.project = {'a1': 'A', 'a2': 'A', 'b1': 'B'}[data['roomId']]
+
+        def handle_data(self, data):
+            if self.project in running:
+                overlaps.append(self.project)
+            running.add(self.project)
+            time.sleep(0.05)
+            running.discard(self.project)
+
+    with mock.patch('endpoints.Bot', SlowBot), mock.patch('endpoints.get_api'), \
+            mock.patch('endpoints.prefetch_people'), \
+            mock.patch('endpoints.get_room_project', side_effect=lambda room: room[0].upper()):
+        threads = [threading.Thread(target=endpoints.handle_webhook, args=({'roomId': room, 'personId': 'p'},))
+                   for room in ['a1', 'a2', 'b1', 'a1', 'a2']]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert overlaps == []
+
+
+def test_drop_when_full():
+    release = threading.Event()
+    workers = WebhookWorkers(lambda event: release.wait(), workers=1, size=1, overflow='drop')
+
+    assert workers.submit({'roomId': 'a', 'id': 0})
+    time.sleep(0.1)  # Let the worker take the first event
+    assert workers.submit({'roomId': 'a', 'id': 1})
+    assert not workers.submit({'roomId': 'a', 'id': 2})
+    assert workers.statistics()['dropped'] == 1
+
+    release.set()
+    workers.join()
+    assert workers.statistics()['processed'] == 2
+
+
+def test_spill_keeps_order(tmpdir):
+    release = threading.Event()
+    handled = []
+
+    def handler(event):
+        release.wait()
+        handled.append(event['id'])
+
+    workers = WebhookWorkers(handler, workers=1, size=2, overflow='spill', spill_folder=str(tmpdir))
+    for i in range(6):
+        assert workers.submit({'roomId': 'a', 'id': i})
+    assert workers.statistics()['spilled'] >= 3
+    assert tmpdir.join('webhooks-0.spill').check()
+
+    release.set()
+    wait_for(lambda: len(handled) == 6)
+    assert handled == list(range(6))
+    assert not tmpdir.join('webhooks-0.spill').check()
+
+
+def test_spilled_events_survive_restart(tmpdir):
+    tmpdir.join('webhooks-0.spill').write(
+        json.dumps({'event': {'roomId': 'a', 'id': 0}, 'enqueued': time.time()}) + '\n' +
+        json.dumps({'event': {'roomId': 'a', 'id': 1}, 'enqueued': time.time()}) + '\n'
+    )
+    handled = []
+    workers = WebhookWorkers(lambda event: handled.append(event['id']), workers=1, overflow='spill',
+                             spill_folder=str(tmpdir))
+
+    workers.submit({'roomId': 'a', 'id': 2})
+    wait_for(lambda: len(handled) == 3)
+    assert handled == [0, 1, 2]
+
+
+def wait_for(condition):
+    for i in range(50):
+        if condition():
+            return
+        time.sleep(0.1)
+
+
+def test_inline_when_there_are_no_workers():
+    handled = []
+    workers = WebhookWorkers(lambda event: handled.append(event['id']), workers=0)
+    workers.submit({'roomId': 'a', 'id': 0})
+    assert handled == [0]